@@ -0,0 +1,92 @@
+"""Microbenchmark: per-read ``str.find`` adapter loops vs. the shared Aho-Corasick AdapterIndex.
+
+Times the adapter-content scan and the known-sequence lookup the old
+fastqc_analysis loop performed on every read, against the index methods
+that replaced them.
+
+Usage:
+    python bench_adapters.py [FASTQ ...]
+
+Without arguments the GSM2527046 sample files in ../data/fastq_files are used.
+"""
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from Bio.Seq import Seq  # noqa: E402
+
+from adapters import ADAPTERS, KNOWN_GROUP, KNOWN_SEQ, QC_ADAPTER_GROUP, default_adapter_index  # noqa: E402
+from fastq_reader import FastqReader  # noqa: E402
+
+DEFAULT_GLOB = "GSM2527046*.fastq"
+DEFAULT_FOLDER = Path(__file__).resolve().parent.parent / "data" / "fastq_files"
+
+
+def loop_adapters(batch) -> int:
+    """The original adapter-content loop (reverse complement only checked after a forward hit)."""
+    hits = 0
+    for seq in batch.sequences():
+        seq = seq.upper()
+        for adapter in ADAPTERS:
+            adapter_upper = adapter.upper().encode()
+            if seq.find(adapter_upper) != -1:
+                hits += 1
+                rc_adapter = str(Seq(adapter.upper()).reverse_complement()).encode()
+                if seq.find(rc_adapter) != -1:
+                    hits += 1
+    return hits
+
+
+def loop_known(batch) -> int:
+    """The original find_known_sequence, applied to every read."""
+    named = 0
+    for seq in batch.sequences():
+        seq = seq.upper().decode()
+        for known_seq in KNOWN_SEQ.values():
+            if known_seq in seq or str(Seq(known_seq).reverse_complement()) in seq:
+                named += 1
+                break
+    return named
+
+
+def index_adapters(batch) -> int:
+    return len(default_adapter_index().exact_matches(batch.seqs, batch.lengths, (QC_ADAPTER_GROUP,)))
+
+
+def index_known(batch) -> int:
+    sequences = [seq.decode() for seq in batch.sequences()]
+    return sum(name is not None for name in default_adapter_index().name_sequences(sequences, KNOWN_GROUP))
+
+
+def run(fastq_file: Path) -> None:
+    with FastqReader(fastq_file) as reader:
+        batches = list(reader)
+    reads = sum(len(batch) for batch in batches)
+    print(f"\n{fastq_file.name} ({reads} reads)")
+    default_adapter_index()
+    for task, baseline, candidate in [("adapter content", loop_adapters, index_adapters),
+                                      ("known sequences", loop_known, index_known)]:
+        times = {}
+        for name, func in [("str.find loop", baseline), ("AdapterIndex", candidate)]:
+            start = time.perf_counter()
+            hits = sum(func(batch) for batch in batches)
+            times[name] = time.perf_counter() - start
+            print(f"  {task:<16} {name:<14} {hits:>8} hits  {times[name]:8.3f} s  "
+                  f"{reads / times[name]:>12,.0f} reads/s")
+        print(f"  {task:<16} speedup: {times['str.find loop'] / times['AdapterIndex']:.1f}x")
+
+
+def main():
+    files = [Path(arg) for arg in sys.argv[1:]] or sorted(DEFAULT_FOLDER.glob(DEFAULT_GLOB))
+    if not files:
+        print(f"No FASTQ files given and none matching {DEFAULT_GLOB} in {DEFAULT_FOLDER}")
+        return
+    for fastq_file in files:
+        run(fastq_file)
+
+
+if __name__ == "__main__":
+    main()
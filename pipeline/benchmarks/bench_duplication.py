@@ -0,0 +1,84 @@
+"""Memory/accuracy benchmark: exact vs. bounded duplication and overrepresentation tracking.
+
+Usage:
+    python bench_duplication.py [--max-distinct N] [--heavy-hitters N] [FASTQ ...]
+
+Without FASTQ arguments the GSM2527046 sample files in ../data/fastq_files are used.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from duplication import (DEFAULT_HEAVY_HITTERS, DEFAULT_MAX_DISTINCT, BoundedSequenceCounter,  # noqa: E402
+                         ExactSequenceCounter)
+from fastq_reader import FastqReader  # noqa: E402
+
+DEFAULT_GLOB = "GSM2527046*.fastq"
+DEFAULT_FOLDER = Path(__file__).resolve().parent.parent / "data" / "fastq_files"
+
+
+def count_sequences(fastq_file: Path, counter):
+    """Feed every read to ``counter``; return (reads, seconds, peak traced bytes)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    reads = 0
+    with FastqReader(fastq_file) as reader:
+        for batch in reader:
+            counter.add(batch.sequences(), batch)
+            reads += len(batch)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return reads, elapsed, peak
+
+
+def duplicate_fraction(levels, total: int) -> float:
+    """Fraction of reads that belong to a sequence seen more than once."""
+    return sum(level * n for level, n in levels.items() if level > 1) / total if total else 0.0
+
+
+def run(fastq_file: Path, max_distinct: int, heavy_hitters: int) -> None:
+    print(f"\n{fastq_file.name}")
+    exact = ExactSequenceCounter()
+    bounded = BoundedSequenceCounter(max_distinct, heavy_hitters)
+    for name, counter in [("exact", exact), ("bounded", bounded)]:
+        reads, elapsed, peak = count_sequences(fastq_file, counter)
+        print(f"  {name:<8} {reads:>10} reads  {elapsed:8.3f} s  peak {peak / 1e6:8.1f} MB")
+
+    total = reads
+    exact_dup = duplicate_fraction(exact.duplication_levels(total), total)
+    bounded_dup = duplicate_fraction(bounded.duplication_levels(total), total)
+    print(f"  duplicated reads: exact {exact_dup * 100:.2f}%  bounded {bounded_dup * 100:.2f}%")
+
+    threshold = total * 0.001
+    truth = dict(exact.top_sequences(threshold))
+    estimate = dict(bounded.top_sequences(threshold))
+    found = truth.keys() & estimate.keys()
+    errors = [estimate[seq] - truth[seq] for seq in found]
+    print(f"  overrepresented: {len(truth)} exact, {len(estimate)} bounded, "
+          f"{len(found)} in common, max overcount {max(errors, default=0)}")
+    for note in bounded.notes(total):
+        print(f"  {note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fastq", nargs="*", type=Path)
+    parser.add_argument("--max-distinct", type=int, default=DEFAULT_MAX_DISTINCT)
+    parser.add_argument("--heavy-hitters", type=int, default=DEFAULT_HEAVY_HITTERS)
+    args = parser.parse_args()
+    files = args.fastq or sorted(DEFAULT_FOLDER.glob(DEFAULT_GLOB))
+    if not files:
+        print(f"No FASTQ files given and none matching {DEFAULT_GLOB} in {DEFAULT_FOLDER}")
+        return
+    for fastq_file in files:
+        run(fastq_file, args.max_distinct, args.heavy_hitters)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Throughput benchmark: Bio.SeqIO record parsing vs. the batch FastqReader.
+
+Usage:
+    python bench_fastq_reader.py [FASTQ ...]
+
+Without arguments the GSM2527046 sample files in ../data/fastq_files are used.
+"""
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from Bio import SeqIO  # noqa: E402
+
+from fastq_reader import FastqReader  # noqa: E402
+
+DEFAULT_GLOB = "GSM2527046*.fastq"
+DEFAULT_FOLDER = Path(__file__).resolve().parent.parent / "data" / "fastq_files"
+
+
+def bench_seqio(fastq_file: Path) -> int:
+    """Parse with SeqIO, touching the sequence and qualities like fastqc_analysis did."""
+    reads = 0
+    for record in SeqIO.parse(str(fastq_file), "fastq"):
+        str(record.seq)
+        record.letter_annotations["phred_quality"]
+        reads += 1
+    return reads
+
+
+def bench_batch_reader(fastq_file: Path) -> int:
+    """Parse with FastqReader, producing sequence/quality matrices per batch."""
+    reads = 0
+    with FastqReader(fastq_file) as reader:
+        for batch in reader:
+            reads += len(batch)
+    return reads
+
+
+def run(fastq_file: Path) -> None:
+    size_mb = fastq_file.stat().st_size / 1e6
+    print(f"\n{fastq_file.name} ({size_mb:.1f} MB)")
+    results = {}
+    for name, func in [("SeqIO.parse", bench_seqio), ("FastqReader", bench_batch_reader)]:
+        start = time.perf_counter()
+        reads = func(fastq_file)
+        elapsed = time.perf_counter() - start
+        results[name] = elapsed
+        print(f"  {name:<12} {reads:>10} reads  {elapsed:8.3f} s  "
+              f"{reads / elapsed:>12,.0f} reads/s  {size_mb / elapsed:8.1f} MB/s")
+    print(f"  speedup: {results['SeqIO.parse'] / results['FastqReader']:.1f}x")
+
+
+def main():
+    files = [Path(arg) for arg in sys.argv[1:]] or sorted(DEFAULT_FOLDER.glob(DEFAULT_GLOB))
+    if not files:
+        print(f"No FASTQ files given and none matching {DEFAULT_GLOB} in {DEFAULT_FOLDER}")
+        return
+    for fastq_file in files:
+        run(fastq_file)
+
+
+if __name__ == "__main__":
+    main()
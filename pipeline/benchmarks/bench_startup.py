@@ -0,0 +1,99 @@
+"""Start-up budget for the rna-seek command line (scripts/cli.py).
+
+Runs every subcommand in a fresh interpreter with ``-X importtime`` on
+inputs that do not exist, so each command imports everything it needs,
+parses its arguments and stops before doing any real work. The total import
+time (the median of --repeat runs) must stay within the command's budget,
+and commands run with ``--no-plots`` must not import Matplotlib:
+
+Usage:
+    python bench_startup.py [--repeat 5] [--scale 1.0]
+
+Exits with status 1 when a command is over budget or imports a module it
+must not, so it can gate CI. --scale multiplies every budget for slower
+machines.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Set, Tuple
+
+CLI = Path(__file__).resolve().parent.parent / "scripts" / "cli.py"
+DEFAULT_REPEAT = 5
+
+# (name, arguments, import-time budget in ms, modules that must not be imported); {tmp} is a scratch folder
+COMMANDS = [
+    ("--help", ["--help"], 100, ("numpy", "matplotlib")),
+    ("qc", ["qc", "--no-plots", "-o", "{tmp}/qc", "{tmp}/missing.fastq"], 400, ("matplotlib", "pyarrow")),
+    ("trim", ["trim", "-o", "{tmp}/trim", "{tmp}/missing.fastq"], 400, ("matplotlib", "pyarrow")),
+    ("demux", ["demux", "--barcodes", "{tmp}/missing.csv", "-o", "{tmp}/demux", "{tmp}/missing.fastq"], 400,
+     ("matplotlib", "pyarrow")),
+    ("run", ["run", "--no-plots", "--no-metrics", "-o", "{tmp}/run", "{tmp}/missing"], 500,
+     ("matplotlib", "pyarrow")),
+    ("report", ["report", "--no-plots", "--table", "{tmp}/table", "{tmp}"], 400, ("matplotlib",)),
+]
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Set[str]]:
+    """Total import time in ms (top-level imports only, so nothing is counted twice) and the modules imported."""
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def measure(arguments: List[str], tmp: str) -> Tuple[float, float, Set[str]]:
+    """Import time (ms), wall time (ms) and imported modules of one cold run of the CLI."""
+    command = [sys.executable, "-X", "importtime", str(CLI)] + [arg.format(tmp=tmp) for arg in arguments]
+    start = time.perf_counter()
+    process = subprocess.run(command, capture_output=True, text=True, cwd=tmp)
+    wall_ms = (time.perf_counter() - start) * 1000
+    import_ms, modules = parse_importtime(process.stderr)
+    return import_ms, wall_ms, modules
+
+
+def forbidden_imports(modules: Set[str], forbidden: Tuple[str, ...]) -> List[str]:
+    return sorted(package for package in forbidden
+                  if any(name == package or name.startswith(package + ".") for name in modules))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the start-up time of each rna-seek subcommand.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="cold runs per command (median used)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget (for slower machines)")
+    args = parser.parse_args()
+
+    failures = 0
+    print(f"{'command':<10} {'imports':>10} {'wall':>10} {'budget':>10}")
+    for name, arguments, budget_ms, forbidden in COMMANDS:
+        with tempfile.TemporaryDirectory(prefix="bench_startup_") as tmp:
+            runs = [measure(arguments, tmp) for _ in range(max(args.repeat, 1))]
+        import_ms = statistics.median(run[0] for run in runs)
+        wall_ms = statistics.median(run[1] for run in runs)
+        budget_ms *= args.scale
+        problems = []
+        if import_ms > budget_ms:
+            problems.append("OVER BUDGET")
+        unwanted = forbidden_imports(set().union(*(run[2] for run in runs)), forbidden)
+        if unwanted:
+            problems.append(f"imports {', '.join(unwanted)}")
+        failures += bool(problems)
+        print(f"{name:<10} {import_ms:>8.1f}ms {wall_ms:>8.1f}ms {budget_ms:>8.0f}ms  {'; '.join(problems)}")
+
+    if failures:
+        print(f"\n{failures} command(s) failed the start-up check")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""End-to-end benchmark suite on synthetic FASTQ files, with results kept for comparison between commits.
+
+Each scenario runs in a fresh Python process so peak RSS is measured per
+scenario. Results are appended as JSON lines (one per scenario and size)
+tagged with the commit, so runs on different commits can be compared:
+
+Usage:
+    python bench_suite.py [--reads 10k,1M,10M] [--scenarios fastqc,trim,index,pipeline]
+    python bench_suite.py --compare BASE_COMMIT [--against COMMIT] [--no-run]
+
+Synthetic inputs are generated once per size (see synthetic_fastq.py) and
+reused from --data-dir.
+"""
+import argparse
+import importlib
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from synthetic_fastq import write_synthetic_fastq  # noqa: E402
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_RESULTS = BENCH_DIR / "results" / "bench_results.jsonl"
+DEFAULT_DATA_DIR = BENCH_DIR / "results" / "synthetic"
+DEFAULT_SIZES = "10k,1M,10M"
+SCENARIOS = ("fastqc", "trim", "index", "pipeline")
+# Slowdown (fraction of the baseline time) reported as a regression
+DEFAULT_THRESHOLD = 0.10
+
+
+def parse_count(text: str) -> int:
+    """``10k``, ``1M``, ``10M`` or a plain integer."""
+    text = text.strip()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1:].lower(), 1)
+    return int(float(text[:-1] if multiplier > 1 else text) * multiplier)
+
+
+def synthetic_input(data_dir: Path, reads: int) -> Path:
+    path = data_dir / f"synthetic_{reads}.fastq"
+    if not path.exists():
+        data_dir.mkdir(parents=True, exist_ok=True)
+        print(f"Generating {reads} synthetic reads -> {path.name}")
+        write_synthetic_fastq(path.with_name(path.name + ".partial"), reads).replace(path)
+    return path
+
+
+def run_fastqc(fastq_file: Path, work_dir: Path) -> None:
+    from fastqc import fastqc_analysis
+    fastqc_analysis(fastq_file, work_dir, render_plots=False)
+
+
+def run_trim(fastq_file: Path, work_dir: Path) -> None:
+    from trimming import wasm_trim_reads
+    wasm_trim_reads(fastq_file, work_dir / f"trimmed_{fastq_file.name}")
+
+
+def run_index(fastq_file: Path, work_dir: Path) -> None:
+    from fastq_index import FastqIndex
+    FastqIndex.build(fastq_file, save=False)
+
+
+def run_pipeline(fastq_file: Path, work_dir: Path) -> None:
+    """The full ``rna-seek run`` flow with its default options, on a folder holding only ``fastq_file``."""
+    from pipeline import run_pipeline as run
+    data_dir = work_dir / "fastq_files"
+    data_dir.mkdir(parents=True)
+    (data_dir / fastq_file.name).symlink_to(fastq_file)
+    run(data_dir, work_dir / "output")
+
+
+RUNNERS = {"fastqc": run_fastqc, "trim": run_trim, "index": run_index, "pipeline": run_pipeline}
+# Imported before the clock starts, so timings exclude import cost
+MODULES = {"fastqc": "fastqc", "trim": "trimming", "index": "fastq_index", "pipeline": "pipeline"}
+
+
+def peak_rss() -> int:
+    """Peak resident memory in bytes of this process and its (waited-for) workers.
+
+    On Linux ``ru_maxrss`` survives ``exec`` and would report the parent's
+    peak, so the process's own high-water mark is read from /proc instead.
+    """
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == "darwin":
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, children)
+    try:
+        with open("/proc/self/status", "r") as handle:
+            own = next(int(line.split()[1]) for line in handle if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max(own, children) * 1024
+
+
+def child(scenario: str, fastq_file: Path) -> None:
+    """Run one scenario in this process and print its timing and peak RSS as the last output line."""
+    importlib.import_module(MODULES[scenario])
+    with tempfile.TemporaryDirectory(prefix=f"bench_{scenario}_") as work_dir:
+        start = time.perf_counter()
+        RUNNERS[scenario](fastq_file, Path(work_dir))
+        seconds = time.perf_counter() - start
+    print("\n" + json.dumps({"seconds": seconds, "peak_rss_bytes": peak_rss()}))
+
+
+def current_commit() -> str:
+    """Short HEAD hash, suffixed with ``-dirty`` when tracked files have uncommitted changes."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BENCH_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_scenario(scenario: str, fastq_file: Path, reads: int, commit: str) -> Optional[Dict]:
+    process = subprocess.run([sys.executable, __file__, "--child", scenario, str(fastq_file)],
+                             capture_output=True, text=True)
+    lines = process.stdout.strip().splitlines()
+    if process.returncode != 0 or not lines:
+        print(f"Error running {scenario} on {fastq_file.name}: {process.stderr.strip()[-500:]}")
+        return None
+    measured = json.loads(lines[-1])
+    size_mb = fastq_file.stat().st_size / 1e6
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "scenario": scenario,
+        "reads": reads,
+        "size_mb": round(size_mb, 2),
+        "seconds": round(measured["seconds"], 4),
+        "reads_per_s": round(reads / measured["seconds"], 1),
+        "mb_per_s": round(size_mb / measured["seconds"], 2),
+        "peak_rss_mb": round(measured["peak_rss_bytes"] / 2 ** 20, 1),
+    }
+
+
+def load_results(path: Path) -> List[Dict]:
+    if not path.exists():
+        return []
+    with open(path, "r") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def latest_by_key(results: List[Dict], commit: str) -> Dict:
+    """Most recent result per (scenario, reads) for ``commit`` (a full label or an abbreviated clean hash)."""
+    latest = {}
+    for result in results:
+        label = result["commit"]
+        if label == commit or (label.startswith(commit) and not label.endswith("-dirty")):
+            latest[(result["scenario"], result["reads"])] = result
+    return latest
+
+
+def compare(results: List[Dict], baseline: str, against: str, threshold: float) -> int:
+    """Print time and memory changes from ``baseline`` to ``against``; returns the number of regressions."""
+    base, new = latest_by_key(results, baseline), latest_by_key(results, against)
+    shared = sorted(set(base) & set(new), key=lambda key: (SCENARIOS.index(key[0]) if key[0] in SCENARIOS else 99,
+                                                              key[1]))
+    if not shared:
+        print(f"No results in common between {baseline} and {against}")
+        return 0
+    regressions = 0
+    print(f"\n{'scenario':<10} {'reads':>10} {baseline:>12} {against:>12} {'change':>8} {'RSS change':>11}")
+    for key in shared:
+        old, current = base[key], new[key]
+        change = current["seconds"] / old["seconds"] - 1
+        rss_change = current["peak_rss_mb"] / old["peak_rss_mb"] - 1 if old["peak_rss_mb"] else 0.0
+        flag = "  REGRESSION" if change > threshold else ""
+        regressions += bool(flag)
+        print(f"{key[0]:<10} {key[1]:>10} {old['seconds']:>11.3f}s {current['seconds']:>11.3f}s "
+              f"{change:>+7.1%} {rss_change:>+10.1%}{flag}")
+    return regressions
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        child(sys.argv[2], Path(sys.argv[3]))
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark QC, trimming, indexing and the full pipeline.")
+    parser.add_argument("--reads", default=DEFAULT_SIZES, help="comma-separated read counts (e.g. 10k,1M,10M)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenarios to run")
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS, help="JSON-lines results file")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR, help="folder for synthetic inputs")
+    parser.add_argument("--compare", metavar="BASE_COMMIT", help="compare results against this commit")
+    parser.add_argument("--against", metavar="COMMIT", help="commit to compare (default: the current one)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="slowdown flagged as regression")
+    parser.add_argument("--no-run", action="store_true", help="only compare stored results")
+    args = parser.parse_args()
+
+    commit = current_commit()
+    if not args.no_run:
+        scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+        unknown = [name for name in scenarios if name not in RUNNERS]
+        if unknown:
+            parser.error(f"unknown scenario(s): {', '.join(unknown)} (expected {', '.join(SCENARIOS)})")
+        args.results.parent.mkdir(parents=True, exist_ok=True)
+        print(f"Commit {commit} on {platform.node()}")
+        for reads in [parse_count(size) for size in args.reads.split(",")]:
+            fastq_file = synthetic_input(args.data_dir, reads)
+            for scenario in scenarios:
+                result = run_scenario(scenario, fastq_file, reads, commit)
+                if result is None:
+                    continue
+                print(f"  {scenario:<10} {reads:>10} reads  {result['seconds']:8.3f} s  "
+                      f"{result['reads_per_s']:>12,.0f} reads/s  {result['mb_per_s']:8.1f} MB/s  "
+                      f"{result['peak_rss_mb']:8.1f} MB RSS")
+                with open(args.results, "a") as handle:
+                    handle.write(json.dumps(result) + "\n")
+
+    if args.compare:
+        regressions = compare(load_results(args.results), args.compare, args.against or commit, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
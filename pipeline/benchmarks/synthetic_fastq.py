@@ -0,0 +1,146 @@
+"""Deterministic synthetic FASTQ files for benchmarks.
+
+Reads are generated in vectorized chunks from a seeded NumPy generator, so
+the same arguments always produce the same bytes. Records have fixed-width
+Casava 1.8 headers spread over a configurable tile layout, a positional
+quality profile, TruSeq adapter read-through at ``adapter_rate`` and exact
+duplicates (drawn from a small pool of sequences) at ``duplication_rate``.
+
+Usage:
+    python synthetic_fastq.py OUTPUT.fastq[.gz] [--reads N] [--length L] [--profile illumina]
+"""
+import argparse
+import gzip
+import sys
+from pathlib import Path
+
+import numpy as np
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from adapters import ADAPTERS  # noqa: E402
+
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+QUALITY_PROFILES = ("flat", "degrading", "illumina")
+CHUNK_READS = 100_000
+# Distinct sequences that duplicated reads are copied from
+DUPLICATE_POOL = 1000
+# Fixed-width header fields: tile (4 digits), x and y (5 digits each)
+HEADER_PREFIX = b"@SYN01:1:FC0001:1:"
+HEADER_SUFFIX = b" 1:N:0:ATCACG\n"
+
+
+def tile_layout(tiles: int, surfaces: int = 2, swaths: int = 2) -> np.ndarray:
+    """Illumina-style tile numbers (surface, swath, tile: 1101, 1102, ... 2201 ...) for ``tiles`` tiles."""
+    per_swath = -(-tiles // (surfaces * swaths))
+    numbers = [surface * 1000 + swath * 100 + tile for surface in range(1, surfaces + 1)
+               for swath in range(1, swaths + 1) for tile in range(1, per_swath + 1)]
+    return np.array(numbers[:tiles], dtype=np.int64)
+
+
+def quality_means(profile: str, length: int) -> np.ndarray:
+    """Mean Phred score at each position for a quality profile."""
+    position = np.arange(length) / max(length - 1, 1)
+    if profile == "flat":
+        return np.full(length, 36.0)
+    if profile == "degrading":
+        return 38.0 - 18.0 * position
+    if profile == "illumina":
+        # Short ramp over the first cycles, plateau, then an accelerating drop towards the 3' end
+        return np.minimum(32.0 + 15.0 * position, 37.0) - 12.0 * position ** 3
+    raise ValueError(f"Unknown quality profile '{profile}' (expected one of {', '.join(QUALITY_PROFILES)})")
+
+
+def _digits(values: np.ndarray, width: int) -> np.ndarray:
+    """Zero-padded ASCII digits of ``values``: ``(len(values), width)`` uint8."""
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    return (values[:, None] // powers % 10 + ord("0")).astype(np.uint8)
+
+
+def _adapter_read_through(rng, seqs: np.ndarray, rate: float) -> None:
+    """Overwrite the 3' end of about ``rate`` of the reads with an adapter starting at a random position."""
+    n, length = seqs.shape
+    rows = np.flatnonzero(rng.random(n) < rate)
+    if not len(rows):
+        return
+    adapters = np.zeros((len(ADAPTERS), length), dtype=np.uint8)
+    for i, adapter in enumerate(ADAPTERS):
+        encoded = np.frombuffer(adapter.encode(), dtype=np.uint8)[:length]
+        adapters[i, :len(encoded)] = encoded
+    which = rng.integers(len(ADAPTERS), size=len(rows))
+    starts = rng.integers(length // 3, length, size=len(rows))
+    source = np.arange(length)[None, :] - starts[:, None]
+    inside = (source >= 0) & (source < length)
+    adapter_bases = adapters[which[:, None], np.clip(source, 0, length - 1)]
+    # Past the end of a short adapter the read keeps its own (random) bases
+    replace = inside & (adapter_bases != 0)
+    seqs[rows] = np.where(replace, adapter_bases, seqs[rows])
+
+
+def generate_chunk(rng, first: int, n: int, length: int, profile: str, adapter_rate: float,
+                   tiles: np.ndarray, reads_per_tile: int, pool: np.ndarray, duplication_rate: float) -> bytes:
+    """FASTQ bytes for reads ``first`` to ``first + n``."""
+    seqs = BASES[rng.integers(4, size=(n, length))]
+    duplicates = np.flatnonzero(rng.random(n) < duplication_rate)
+    seqs[duplicates] = pool[rng.integers(len(pool), size=len(duplicates))]
+    _adapter_read_through(rng, seqs, adapter_rate)
+
+    quals = np.rint(quality_means(profile, length) + rng.normal(0.0, 3.0, size=(n, length)))
+    quals = (np.clip(quals, 2, 41) + 33).astype(np.uint8)
+
+    read_numbers = np.arange(first, first + n, dtype=np.int64)
+    tile = tiles[np.minimum(read_numbers // reads_per_tile, len(tiles) - 1)]
+    x = rng.integers(1000, 30000, size=n)
+    y = rng.integers(1000, 100000, size=n)
+    prefix = np.frombuffer(HEADER_PREFIX, dtype=np.uint8)
+    suffix = np.frombuffer(HEADER_SUFFIX, dtype=np.uint8)
+    colon = np.full((n, 1), ord(":"), dtype=np.uint8)
+    newline = np.full((n, 1), ord("\n"), dtype=np.uint8)
+    plus = np.full((n, 2), [ord("+"), ord("\n")], dtype=np.uint8)
+    records = np.hstack([np.broadcast_to(prefix, (n, len(prefix))), _digits(tile, 4), colon, _digits(x, 5),
+                         colon, _digits(y, 5), np.broadcast_to(suffix, (n, len(suffix))),
+                         seqs, newline, plus, quals, newline])
+    return records.tobytes()
+
+
+def write_synthetic_fastq(path: Path, reads: int, length: int = 75, profile: str = "illumina",
+                          adapter_rate: float = 0.05, tiles: int = 16, duplication_rate: float = 0.1,
+                          seed: int = 0, compresslevel: int = 1) -> Path:
+    """Write ``reads`` synthetic reads to ``path`` (gzip-compressed when it ends in ``.gz``).
+
+    Reads fill the tiles in order, as in a demultiplexed Illumina run.
+    """
+    path = Path(path)
+    rng = np.random.default_rng(seed)
+    pool = BASES[rng.integers(4, size=(DUPLICATE_POOL, length))]
+    layout = tile_layout(tiles)
+    reads_per_tile = max(-(-reads // len(layout)), 1)
+    opener = (lambda: gzip.open(path, "wb", compresslevel=compresslevel)) if path.suffix == ".gz" \
+        else (lambda: open(path, "wb"))
+    with opener() as handle:
+        for first in range(0, reads, CHUNK_READS):
+            n = min(CHUNK_READS, reads - first)
+            handle.write(generate_chunk(rng, first, n, length, profile, adapter_rate, layout, reads_per_tile,
+                                        pool, duplication_rate))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic FASTQ file.")
+    parser.add_argument("output", type=Path, help="FASTQ file to write (.gz for gzip)")
+    parser.add_argument("--reads", type=int, default=10_000)
+    parser.add_argument("--length", type=int, default=75)
+    parser.add_argument("--profile", choices=QUALITY_PROFILES, default="illumina")
+    parser.add_argument("--adapter-rate", type=float, default=0.05)
+    parser.add_argument("--tiles", type=int, default=16)
+    parser.add_argument("--duplication-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_synthetic_fastq(args.output, args.reads, args.length, args.profile, args.adapter_rate, args.tiles,
+                          args.duplication_rate, args.seed)
+    print(f"Wrote {args.reads} reads to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+import numpy as np
+from collections import defaultdict, deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from fastq_reader import FastqBatch
+
+# Trimmomatic-style adapter FASTA files shipped with the pipeline (TruSeq2/3, Nextera)
+ADAPTER_FOLDER = Path(__file__).resolve().parent.parent / "data" / "adapters"
+
+# Common adapter sequences (expand as needed)
+ADAPTERS = [
+    "AGATCGGAAGAGCACACGTCTGAACTCCAGTCA",  # TruSeq Universal Adapter
+    "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGT",  # TruSeq Adapter Index 1
+]
+
+# Dictionary of known overrepresented sequences (Adapters, Primers, Contaminants)
+KNOWN_SEQ = {
+    "TruSeq Adapter, Index 7": "AGATCGGAAGAGCACACGTCTGAACTCCAGTCAC",
+    "TruSeq Universal Adapter": "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGTA",
+    "TruSeq Read 1 Adapter": "AGATCGGAAGAGCGGTTCAGCAGGAATGCCGAG",
+    "TruSeq Read 2 Adapter": "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGT",
+    "Illumina Multiplexing PCR Primer 1.0": "AATGATACGGCGACCACCGAGATCTACAC",
+    "Illumina Multiplexing PCR Primer 2.0": "CAAGCAGAAGACGGCATACGAGAT",
+    "Nextera Transposase Adapter": "CTGTCTCTTATACACATCT",
+    "Nextera Read 1 Adapter": "TCGTCGGCAGCGTCAGATGTGTATAAGAGACAG",
+    "Nextera Read 2 Adapter": "GTCTCGTGGGCTCGGAGATGTGTATAAGAGACAG",
+    "PhiX Control Library": "GTTTTCCCAGTCACGACGTTG",
+    "Small RNA Adapter (Read 1)": "TGGAATTCTCGGGTGCCAAGG",
+    "Small RNA Adapter (Read 2)": "CTGTAGGCACCATCAATAGATCGGAAGAGCACACGTCT",
+}
+
+# Pattern groups indexed by default_adapter_index()
+TRIMMING_GROUP = "trimming"   # adapter FASTA files, clipped by the trimmer
+QC_ADAPTER_GROUP = "adapters"  # ADAPTERS, reported as adapter content
+KNOWN_GROUP = "known"         # KNOWN_SEQ, used to name overrepresented sequences
+
+# 2-bit base encoding; anything that is not A/C/G/T maps to INVALID_BASE
+BASE_TO_CODE = np.full(256, 4, dtype=np.int64)
+for _code, _base in enumerate("ACGT"):
+    BASE_TO_CODE[ord(_base)] = _code
+    BASE_TO_CODE[ord(_base.lower())] = _code
+INVALID_BASE = 4
+
+COMPLEMENT = str.maketrans("ACGTNacgtn", "TGCANtgcan")
+
+
+def reverse_complement(seq: str) -> str:
+    return seq.translate(COMPLEMENT)[::-1]
+
+
+def read_fasta(fasta_file: Union[str, Path]) -> Dict[str, str]:
+    """Parse a small FASTA file into a ``{name: sequence}`` dictionary."""
+    sequences = {}
+    name = None
+    with open(fasta_file, "r") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(">"):
+                name = line[1:].split()[0]
+                sequences[name] = ""
+            elif name is not None:
+                sequences[name] += line.upper()
+    return sequences
+
+
+def load_adapters(fasta_files: Optional[Iterable[Union[str, Path]]] = None) -> Dict[str, str]:
+    """Load adapter sequences from FASTA files, dropping duplicate sequences.
+
+    Defaults to every ``*.fa`` file in ``ADAPTER_FOLDER``.
+    """
+    if fasta_files is None:
+        fasta_files = sorted(ADAPTER_FOLDER.glob("*.fa"))
+    adapters = {}
+    seen = set()
+    for fasta_file in fasta_files:
+        for name, seq in read_fasta(fasta_file).items():
+            if seq and seq not in seen:
+                seen.add(seq)
+                adapters[f"{Path(fasta_file).stem}:{name}"] = seq
+    return adapters
+
+
+def encode_bases(seqs: np.ndarray) -> np.ndarray:
+    """Map an ASCII uint8 matrix to 2-bit base codes (INVALID_BASE for N and padding)."""
+    return BASE_TO_CODE[seqs]
+
+
+def kmer_codes(codes: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Rolling k-mer codes for every window of a ``(n, width)`` base-code matrix.
+
+    Returns ``(kmers, valid)`` of shape ``(n, width - k + 1)``; windows that
+    contain an invalid base are flagged ``False`` in ``valid``.
+    """
+    n, width = codes.shape
+    windows = max(width - k + 1, 0)
+    kmers = np.zeros((n, windows), dtype=np.int64)
+    invalid = np.zeros((n, windows), dtype=bool)
+    for j in range(k):
+        column = codes[:, j:j + windows]
+        kmers = (kmers << 2) | (column & 3)
+        invalid |= column == INVALID_BASE
+    return kmers, ~invalid
+
+
+class _Selection:
+    """Per-state lookup tables for the patterns of some groups/strands."""
+
+    __slots__ = ("patterns", "seed_hit", "start_hit", "partial_depth")
+
+    def __init__(self, patterns, seed_hit, start_hit, partial_depth):
+        self.patterns = patterns
+        self.seed_hit = seed_hit
+        self.start_hit = start_hit
+        self.partial_depth = partial_depth
+
+
+class AdapterIndex:
+    """Aho-Corasick automaton over the k-mers of a set of adapter/contaminant sequences.
+
+    Every k-mer of every pattern, in both orientations, is inserted into one
+    trie whose failure links are compiled into a dense ``(states, 5)``
+    transition table, so a whole batch is scanned with one table lookup per
+    base column instead of one ``str.find`` per pattern per read. A state at
+    depth ``k`` is a seed hit that is verified against the full pattern
+    (allowing ``max_mismatches`` when trimming); the state reached at the end
+    of a read gives the longest read suffix that is a pattern prefix, which
+    catches adapters running off the 3' end by at least ``min_partial`` bases.
+
+    Patterns are organised in named groups so the trimmer, the adapter-content
+    metric and the overrepresented-sequence lookup share one index.
+    """
+
+    def __init__(self, adapters: Dict[str, str], k: int = 12, max_mismatches: int = 2, min_partial: int = 8,
+                 groups: Optional[Dict[str, Dict[str, str]]] = None):
+        groups = {TRIMMING_GROUP: adapters, **(groups or {})}
+        self.max_mismatches = max_mismatches
+        self.min_partial = min_partial
+
+        # Unique pattern sequences; each remembers every (group, name, strand, order) it came from
+        self.patterns: List[str] = []
+        self.sources: List[List[Tuple[str, str, str, int]]] = []
+        pattern_ids = {}
+        for group, sequences in groups.items():
+            for order, (name, seq) in enumerate(sequences.items()):
+                seq = seq.upper()
+                for strand, oriented in (("+", seq), ("-", reverse_complement(seq))):
+                    if oriented not in pattern_ids:
+                        pattern_ids[oriented] = len(self.patterns)
+                        self.patterns.append(oriented)
+                        self.sources.append([])
+                    self.sources[pattern_ids[oriented]].append((group, name, strand, order))
+        self.k = min([k] + [len(seq) for seq in self.patterns])
+        self._pattern_bytes = [seq.encode() for seq in self.patterns]
+        self._build()
+        self._selections = {}
+
+    def parameters(self) -> Dict:
+        """Everything that affects matching, e.g. for cache keys."""
+        return {
+            "k": self.k,
+            "max_mismatches": self.max_mismatches,
+            "min_partial": self.min_partial,
+            "patterns": [[seq, sorted(sources)] for seq, sources in zip(self.patterns, self.sources)],
+        }
+
+    def _build(self) -> None:
+        k = self.k
+        children = [{}]
+        depth = [0]
+        prefix_of = [set()]
+        seeds = defaultdict(list)
+        for pattern_id, seq in enumerate(self.patterns):
+            codes = BASE_TO_CODE[np.frombuffer(seq.encode(), dtype=np.uint8)].tolist()
+            for offset in range(len(seq) - k + 1):
+                kmer = codes[offset:offset + k]
+                if INVALID_BASE in kmer:
+                    continue
+                node = 0
+                for code in kmer:
+                    if code not in children[node]:
+                        children[node][code] = len(children)
+                        children.append({})
+                        depth.append(depth[node] + 1)
+                        prefix_of.append(set())
+                    node = children[node][code]
+                    if offset == 0:
+                        prefix_of[node].add(pattern_id)
+                seeds[node].append((pattern_id, offset))
+
+        n_states = len(children)
+        goto = np.zeros((n_states, INVALID_BASE + 1), dtype=np.int64)
+        fail = np.zeros(n_states, dtype=np.int64)
+        order = []
+        queue = deque()
+        for code, child in children[0].items():
+            goto[0, code] = child
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for code in range(INVALID_BASE):
+                child = children[node].get(code)
+                if child is None:
+                    goto[node, code] = goto[fail[node], code]
+                else:
+                    goto[node, code] = child
+                    fail[child] = goto[fail[node], code]
+                    queue.append(child)
+        # INVALID_BASE (N, padding) always returns to the root: no seed contains it
+
+        self.goto = goto.ravel().astype(np.int32)
+        self.fail = fail
+        self.depth = np.array(depth, dtype=np.int64)
+        self.prefix_of = prefix_of
+        self.seeds = dict(seeds)
+        self._bfs_order = order
+
+    def _selection(self, groups: Sequence[str], strands: str = "+-") -> _Selection:
+        """Lookup tables restricted to patterns from ``groups`` on the given ``strands`` (cached)."""
+        key = (tuple(groups), strands)
+        if key not in self._selections:
+            patterns = np.array([
+                any(group in groups and strand in strands for group, _, strand, _ in sources)
+                for sources in self.sources
+            ], dtype=bool)
+            n_states = len(self.depth)
+            seed_hit = np.zeros(n_states, dtype=bool)
+            start_hit = np.zeros(n_states, dtype=bool)
+            for state, state_seeds in self.seeds.items():
+                seed_hit[state] = any(patterns[pattern_id] for pattern_id, _ in state_seeds)
+                start_hit[state] = any(patterns[pattern_id] and offset == 0 for pattern_id, offset in state_seeds)
+            # Longest suffix of each state's string that is a prefix of a selected pattern
+            partial_depth = np.zeros(n_states, dtype=np.int64)
+            for state in self._bfs_order:
+                if any(patterns[pattern_id] for pattern_id in self.prefix_of[state]):
+                    partial_depth[state] = self.depth[state]
+                else:
+                    partial_depth[state] = partial_depth[self.fail[state]]
+            self._selections[key] = _Selection(patterns, seed_hit, start_hit, partial_depth)
+        return self._selections[key]
+
+    def scan(self, seqs: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """Run the automaton over a padded ASCII matrix; returns the state after every base."""
+        codes = BASE_TO_CODE[seqs].astype(np.int32)
+        n, width = codes.shape
+        codes[np.arange(width)[None, :] >= lengths[:, None]] = INVALID_BASE
+        # Column-major so each step reads and writes contiguous memory
+        codes = np.asfortranarray(codes)
+        states = np.empty((n, width), dtype=np.int32, order="F")
+        state = np.zeros(n, dtype=np.int32)
+        stride = INVALID_BASE + 1
+        for j in range(width):
+            state = self.goto[state * stride + codes[:, j]]
+            states[:, j] = state
+        return states
+
+    @staticmethod
+    def final_states(states: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        if states.shape[1] == 0:
+            return np.zeros(len(lengths), dtype=np.int64)
+        last = states[np.arange(len(lengths)), np.maximum(lengths - 1, 0)]
+        return np.where(lengths > 0, last, 0)
+
+    def _mismatches(self, read: bytes, start: int, adapter: bytes) -> int:
+        """Mismatches in the read/adapter overlap implied by the adapter starting at ``start``."""
+        read_from = max(start, 0)
+        adapter_from = read_from - start
+        overlap = min(len(read) - read_from, len(adapter) - adapter_from)
+        read_part = read[read_from:read_from + overlap]
+        adapter_part = adapter[adapter_from:adapter_from + overlap]
+        if read_part == adapter_part:
+            return 0
+        return sum(a != b for a, b in zip(read_part, adapter_part))
+
+    def find(self, batch: FastqBatch) -> np.ndarray:
+        """Return, for each read, the position where trimming adapter sequence starts (its length if none)."""
+        lengths = batch.lengths
+        clip = lengths.copy()
+        if len(batch) == 0:
+            return clip
+        selection = self._selection((TRIMMING_GROUP,), "+")
+        states = self.scan(batch.seqs, lengths)
+        hits = selection.seed_hit[states]
+        for row in np.flatnonzero(hits.any(axis=1)):
+            read = batch.seqs[row, :lengths[row]].tobytes().upper()
+            tried = set()
+            for end in np.flatnonzero(hits[row]).tolist():
+                position = end - self.k + 1
+                if position >= clip[row]:
+                    break
+                for pattern_id, offset in self.seeds[int(states[row, end])]:
+                    start = position - offset
+                    if (not selection.patterns[pattern_id] or (pattern_id, start) in tried
+                            or max(start, 0) >= clip[row]):
+                        continue
+                    tried.add((pattern_id, start))
+                    if self._mismatches(read, start, self._pattern_bytes[pattern_id]) <= self.max_mismatches:
+                        clip[row] = max(start, 0)
+
+        # Partial adapters at the 3' end: longest read suffix that is an adapter prefix
+        partial = selection.partial_depth[self.final_states(states, lengths)]
+        matched = (clip == lengths) & (partial >= self.min_partial)
+        clip[matched] = lengths[matched] - partial[matched]
+        return clip
+
+    def exact_matches(self, seqs: np.ndarray, lengths: np.ndarray, groups: Sequence[str]) -> List[Tuple[int, int, int]]:
+        """First exact occurrence of each pattern from ``groups`` (either strand) in each read.
+
+        Returns ``(row, start, pattern_id)`` tuples.
+        """
+        matches = []
+        if len(lengths) == 0:
+            return matches
+        selection = self._selection(tuple(groups))
+        states = self.scan(seqs, lengths)
+        rows, ends = np.nonzero(selection.start_hit[states])
+        hit_states = states[rows, ends].tolist()
+        seen = set()
+        read, read_row = b"", -1
+        for row, end, state in zip(rows.tolist(), ends.tolist(), hit_states):
+            if row != read_row:
+                read, read_row = seqs[row, :lengths[row]].tobytes().upper(), row
+            start = end - self.k + 1
+            for pattern_id, offset in self.seeds[state]:
+                if offset or not selection.patterns[pattern_id] or (row, pattern_id) in seen:
+                    continue
+                pattern = self._pattern_bytes[pattern_id]
+                if read[start:start + len(pattern)] == pattern:
+                    seen.add((row, pattern_id))
+                    matches.append((row, start, pattern_id))
+        return matches
+
+    def name_sequences(self, sequences: List[str], group: str) -> List[Optional[str]]:
+        """Name of the first pattern of ``group`` (in its listed order) contained in each sequence, either strand."""
+        names = [None] * len(sequences)
+        if not sequences:
+            return names
+        lengths = np.array([len(seq) for seq in sequences], dtype=np.int64)
+        seqs = np.zeros((len(sequences), int(lengths.max())), dtype=np.uint8)
+        for row, seq in enumerate(sequences):
+            seqs[row, :len(seq)] = np.frombuffer(seq.encode(), dtype=np.uint8)
+        best = {}
+        for row, _, pattern_id in self.exact_matches(seqs, lengths, (group,)):
+            for source_group, name, _, order in self.sources[pattern_id]:
+                if source_group == group and order < best.get(row, (len(self.sources),))[0]:
+                    best[row] = (order, name)
+        for row, (_, name) in best.items():
+            names[row] = name
+        return names
+
+
+@lru_cache(maxsize=None)
+def default_adapter_index() -> AdapterIndex:
+    """Adapter index over the FASTA files in ``ADAPTER_FOLDER``, ``ADAPTERS`` and ``KNOWN_SEQ``.
+
+    Built once per process and shared by QC and trimming.
+    """
+    return AdapterIndex(load_adapters(), groups={
+        QC_ADAPTER_GROUP: {str(i): seq for i, seq in enumerate(ADAPTERS)},
+        KNOWN_GROUP: KNOWN_SEQ,
+    })
@@ -0,0 +1,220 @@
+"""Merge per-sample QC summaries into one columnar table, MultiQC-style.
+
+The table is built from the ``*_qc_summary.npz`` files the QC step writes,
+so comparing samples or runs never touches FASTQ data:
+
+    python aggregate.py [-o OUTPUT_FOLDER] [--workers N] REPORT_FOLDER_OR_SUMMARY [...]
+
+Each column is stored as an uncompressed ``.npy`` file with one row per
+sample, so ``QCTable`` opens hundreds of samples instantly and only pages in
+the columns (and rows) that are actually used. A ``general_stats.tsv`` with
+the per-sample scalars is written alongside, and a Parquet copy of the table
+when ``pyarrow`` is installed.
+"""
+import argparse
+import importlib.util
+import json
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from checkpoint import atomic_path, write_atomic
+from qc_summary import SUMMARY_VERSION, find_summaries, load_summary, structured_summary, summary_stem
+
+# Checked without importing: pyarrow is only loaded when a Parquet file is actually written
+HAVE_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+TABLE_FOLDER = "qc_table"
+INDEX_FILE = "columns.json"
+GENERAL_STATS_FILE = "general_stats.tsv"
+PARQUET_FILE = "qc_table.parquet"
+
+# Arrays that label an axis and are the same for every sample; stored once instead of per row
+SHARED_AXES = ('duplication_bins', 'headline_metrics')
+
+
+def _fill_value(dtype: np.dtype):
+    return "" if dtype.kind in 'US' else np.nan if dtype.kind == 'f' else 0
+
+
+def _stack(values: Sequence[np.ndarray]) -> np.ndarray:
+    """Stack per-sample arrays into one column, padding shorter ones (NaN, 0 or "") to a common shape."""
+    arrays = [np.asarray(value) for value in values]
+    dtype = np.result_type(*arrays)
+    shape = tuple(max(sizes) for sizes in zip(*(array.shape for array in arrays))) if arrays[0].ndim else ()
+    column = np.full((len(arrays),) + shape, _fill_value(dtype), dtype=dtype)
+    for row, array in enumerate(arrays):
+        column[(row,) + tuple(slice(0, size) for size in array.shape)] = array
+    return column
+
+
+def _tile_column(rows: Sequence[Dict[str, np.ndarray]], width: int):
+    """Per-tile means aligned on the union of all tile IDs: ``(samples, tiles, position bins)``."""
+    tiles = sorted({tile for row in rows for tile in row['tiles'].tolist()})
+    lookup = {tile: i for i, tile in enumerate(tiles)}
+    column = np.full((len(rows), len(tiles), width), np.nan)
+    for r, row in enumerate(rows):
+        for tile, means in zip(row['tiles'].tolist(), row['tile_mean']):
+            column[r, lookup[tile], :len(means)] = means
+    return np.array(tiles, dtype=str), column
+
+
+def read_structured(path: Path) -> Dict[str, np.ndarray]:
+    """Structured summary of one ``*_qc_summary.npz`` file, labelled with its sample and report folder."""
+    path = Path(path)
+    row = structured_summary(load_summary(path), summary_stem(path))
+    row['source'] = np.str_(path.parent.name)
+    return row
+
+
+def aggregate(rows: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Merge structured summaries into columns with one row per sample.
+
+    Per-position arrays are padded with NaN to the most position bins in the
+    set (bins depend only on the position, so they line up), tile means are aligned on the union of tile IDs (the ``tiles`` axis)
+    and estimation notes are joined into one string per sample.
+    """
+    if not rows:
+        return {}
+    width = max(len(row['position_first_base']) for row in rows)
+    columns = {}
+    for name in rows[0]:
+        if name in ('tiles', 'tile_mean') or name in SHARED_AXES:
+            continue
+        if name == 'estimation_notes':
+            columns[name] = np.array(["; ".join(row[name].tolist()) for row in rows], dtype=str)
+        else:
+            columns[name] = _stack([row[name] for row in rows])
+    columns['tiles'], columns['tile_mean'] = _tile_column(rows, width)
+    for name in SHARED_AXES:
+        columns[name] = rows[0][name]
+    return columns
+
+
+def load_rows(sources: Sequence[Path], workers: Optional[int] = None) -> List[Dict[str, np.ndarray]]:
+    """Structured summaries for every summary file in ``sources`` (read on a thread pool)."""
+    paths = find_summaries(sources)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(read_structured, paths))
+
+
+def _write_parquet(columns: Dict[str, np.ndarray], path: Path) -> None:
+    """One row per sample; arrays become fixed-size list columns (flattened in C order)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    samples = len(columns['sample'])
+    fields = {}
+    for name, column in columns.items():
+        if len(column.shape) == 0 or column.shape[0] != samples or name in SHARED_AXES:
+            continue
+        if column.ndim == 1:
+            fields[name] = pa.array(column.tolist())
+        else:
+            flat = column.reshape(samples, -1)
+            fields[name] = pa.FixedSizeListArray.from_arrays(pa.array(flat.reshape(-1).tolist()), flat.shape[1])
+    table = pa.table(fields)
+    metadata = {name: json.dumps(columns[name].tolist()) for name in ('tiles',) + SHARED_AXES}
+    table = table.replace_schema_metadata({**metadata, 'format_version': str(SUMMARY_VERSION)})
+    with atomic_path(path) as temporary:
+        pq.write_table(table, temporary)
+
+
+def write_table(columns: Dict[str, np.ndarray], folder: Path) -> Path:
+    """Write an aggregated table: one ``.npy`` per column, an index, general stats and (optionally) Parquet."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    samples = len(columns['sample'])
+    index = {'format_version': SUMMARY_VERSION, 'samples': samples, 'columns': {}}
+    for name, column in columns.items():
+        with atomic_path(folder / f"{name}.npy") as temporary, open(temporary, "wb") as handle:
+            np.save(handle, column, allow_pickle=False)
+        per_sample = column.ndim > 0 and column.shape[0] == samples and name not in ('tiles',) + SHARED_AXES
+        index['columns'][name] = {'dtype': column.dtype.str, 'shape': list(column.shape), 'per_sample': per_sample}
+
+    scalars = [name for name, column in columns.items() if column.ndim == 1 and index['columns'][name]['per_sample']
+               and name not in ('sample', 'format_version', 'estimation_notes')]
+    lines = ["\t".join(['sample'] + scalars)]
+    for row in range(samples):
+        lines.append("\t".join([str(columns['sample'][row])] + [str(columns[name][row]) for name in scalars]))
+    write_atomic(folder / GENERAL_STATS_FILE, "\n".join(lines) + "\n")
+
+    if HAVE_PYARROW:
+        try:
+            _write_parquet(columns, folder / PARQUET_FILE)
+        except Exception as e:
+            print(f"Error writing Parquet table: {str(e)}")
+
+    # Written last: a folder with an index holds a complete table
+    write_atomic(folder / INDEX_FILE, json.dumps(index, indent=2))
+    return folder
+
+
+class QCTable(Mapping):
+    """Aggregated QC table on disk; each column is loaded (memory-mapped by default) on first access.
+
+    Columns are indexed by sample row, e.g. ``table['quality_mean'][row]``;
+    ``table.row(sample)`` gathers one sample's values from every column. Raw
+    and trimmed reports of a single-end file share a stem, so the report
+    folder (``source``) tells them apart.
+    """
+
+    def __init__(self, folder: Path, mmap: bool = True):
+        self.folder = Path(folder)
+        self.mmap_mode = 'r' if mmap else None
+        with open(self.folder / INDEX_FILE, "r") as handle:
+            self.index = json.load(handle)
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self.index['columns']:
+            raise KeyError(name)
+        if name not in self._columns:
+            self._columns[name] = np.load(self.folder / f"{name}.npy", mmap_mode=self.mmap_mode, allow_pickle=False)
+        return self._columns[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index['columns'])
+
+    def __len__(self) -> int:
+        return len(self.index['columns'])
+
+    @property
+    def samples(self) -> List[str]:
+        return self['sample'].tolist()
+
+    def row(self, sample: str, source: Optional[str] = None) -> Dict[str, np.ndarray]:
+        matches = [i for i, (name, folder) in enumerate(zip(self.samples, self['source'].tolist()))
+                   if name == sample and source in (None, folder)]
+        if not matches:
+            raise KeyError(sample)
+        position = matches[0]
+        return {name: self[name][position] if info['per_sample'] else self[name]
+                for name, info in self.index['columns'].items()}
+
+
+def aggregate_reports(sources: Sequence[Path], output_folder: Path, workers: Optional[int] = None) -> Optional[Path]:
+    """Aggregate every summary in ``sources`` into a table in ``output_folder``; ``None`` if there are none."""
+    rows = load_rows(sources, workers)
+    if not rows:
+        print("No QC summaries found to aggregate")
+        return None
+    folder = write_table(aggregate(rows), output_folder)
+    print(f"Aggregated {len(rows)} QC summaries into {folder}")
+    return folder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge per-sample QC summaries into one columnar table.")
+    parser.add_argument("sources", nargs="+", type=Path, help="report folders or *_qc_summary.npz files")
+    parser.add_argument("-o", "--output", type=Path, default=Path(TABLE_FOLDER), help="table folder to write")
+    parser.add_argument("--workers", type=int, default=None, help="threads reading summaries")
+    args = parser.parse_args()
+    aggregate_reports(args.sources, args.output, args.workers)
+
+
+if __name__ == "__main__":
+    main()
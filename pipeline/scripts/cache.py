@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from checkpoint import write_atomic
+
+# Bump when the content of cached outputs changes for the same inputs and parameters
+CACHE_VERSION = 1
+
+# Read size when hashing inputs
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+# Side-car next to each input holding its digest and the file status it was computed for
+FINGERPRINT_SUFFIX = ".fqhash"
+
+DEFAULT_CACHE_SIZE = 50 * 1024 ** 3
+METADATA_FILE = "metadata.json"
+
+
+def fingerprint_path(path: Path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + FINGERPRINT_SUFFIX)
+
+
+def _file_status(stat: os.stat_result) -> List[int]:
+    """What identifies a file's current content without reading it (the change time cannot be set back)."""
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_ino, stat.st_dev]
+
+
+def content_digest(path: Path) -> str:
+    """BLAKE2b of a file's size and every byte."""
+    path = Path(path)
+    digest = hashlib.blake2b(str(path.stat().st_size).encode(), digest_size=20)
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as handle:
+        for count in iter(lambda: handle.readinto(buffer), 0):
+            digest.update(view[:count])
+    return digest.hexdigest()
+
+
+def fingerprint(path: Path) -> str:
+    """Content fingerprint of a file: its ``content_digest``, memoized in a side-car file.
+
+    A cache key must never match a file whose content changed, so the
+    digest covers every byte rather than sampled blocks. Hashing a large
+    project end to end on every run would defeat the cache, though, so the
+    digest is saved next to the file (``<file>.fqhash``, like the ``.fqi``
+    index) with the file's size, modification and change times, inode and
+    device, and reused while all of these are unchanged. Writing a file in
+    place always moves its change time, so a rewrite at the same size is
+    hashed again. Where the side-car cannot be written (a read-only input
+    folder) the file is hashed on every run. The file name is not part of
+    the fingerprint: a copied or renamed file has the same one.
+    """
+    path = Path(path)
+    status = _file_status(path.stat())
+    memo = fingerprint_path(path)
+    try:
+        with open(memo, "r") as handle:
+            saved = json.load(handle)
+        if saved["status"] == status:
+            return saved["digest"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    digest = content_digest(path)
+    # Only remember a digest if the file did not change while it was read
+    if _file_status(path.stat()) == status:
+        try:
+            write_atomic(memo, json.dumps({"status": status, "digest": digest}))
+        except OSError:
+            pass
+    return digest
+
+
+def parameters_key(parameters: Dict) -> str:
+    """Stable hash of a JSON-serializable parameter dictionary."""
+    encoded = json.dumps({"cache_version": CACHE_VERSION, **parameters}, sort_keys=True, default=str)
+    return hashlib.blake2b(encoded.encode(), digest_size=20).hexdigest()
+
+
+def cache_key(input_files: Sequence[Path], parameters: Dict) -> str:
+    """Key for the results of processing ``input_files`` (in order) with ``parameters``."""
+    digest = hashlib.blake2b(parameters_key(parameters).encode(), digest_size=20)
+    for path in input_files:
+        digest.update(fingerprint(path).encode())
+    return digest.hexdigest()
+
+
+def _link_or_copy(source: Path, destination: Path) -> None:
+    """Hard-link ``source`` to ``destination`` (replacing it), copying when linking is not possible."""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if destination.exists() or destination.is_symlink():
+        destination.unlink()
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class ResultCache:
+    """On-disk cache of pipeline outputs keyed by input fingerprints and parameters.
+
+    Each entry is a directory holding the output files (relative to named
+    output folders, e.g. ``"trimmed_reads"``) and a metadata file. Entries are
+    assembled in a temporary directory and renamed into place, so concurrent
+    workers never see a partial entry. Files are hard-linked in and out where
+    the file system allows, which makes storing and restoring large trimmed
+    outputs nearly free. When the cache grows beyond ``max_bytes`` the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_CACHE_SIZE):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.entries = self.root / "entries"
+        self.entries.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, key: str) -> Path:
+        return self.entries / key
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """Metadata of a cached entry, or ``None`` on a miss."""
+        try:
+            with open(self._entry(key) / METADATA_FILE, "r") as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def restore(self, key: str, folders: Dict[str, Path]) -> Optional[Dict]:
+        """Place a cached entry's files into ``folders`` and return its metadata (``None`` on a miss)."""
+        metadata = self.lookup(key)
+        if metadata is None:
+            return None
+        entry = self._entry(key)
+        try:
+            for name in metadata["files"]:
+                folder, relative = name.split("/", 1)
+                _link_or_copy(entry / name, Path(folders[folder]) / relative)
+        except (OSError, KeyError):
+            return None
+        os.utime(entry / METADATA_FILE)
+        return metadata
+
+    def store(self, key: str, folders: Dict[str, Path], files: Sequence[Path], metadata: Dict) -> None:
+        """Add the output ``files`` (each inside one of ``folders``) and ``metadata`` under ``key``."""
+        staging = self.root / f".tmp-{uuid.uuid4().hex}"
+        staging.mkdir(parents=True)
+        try:
+            names: List[str] = []
+            size = 0
+            for path in files:
+                path = Path(path)
+                folder = next(name for name, root in folders.items() if Path(root) in path.parents)
+                name = f"{folder}/{path.relative_to(folders[folder]).as_posix()}"
+                _link_or_copy(path, staging / name)
+                names.append(name)
+                size += path.stat().st_size
+            with open(staging / METADATA_FILE, "w") as handle:
+                json.dump({**metadata, "files": names, "size": size, "created": time.time()}, handle)
+            try:
+                os.rename(staging, self._entry(key))
+            except OSError:
+                # Another worker stored the same key first; keep its entry
+                pass
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def size(self) -> int:
+        return sum(metadata.get("size", 0) for _, metadata, _ in self._scan())
+
+    def _scan(self):
+        """``(entry, metadata, last used)`` for every complete entry."""
+        for entry in self.entries.iterdir():
+            try:
+                with open(entry / METADATA_FILE, "r") as handle:
+                    metadata = json.load(handle)
+                yield entry, metadata, (entry / METADATA_FILE).stat().st_mtime
+            except (OSError, ValueError):
+                continue
+
+    def evict(self) -> int:
+        """Remove least recently used entries until the cache fits in ``max_bytes``; returns bytes freed."""
+        entries = sorted(self._scan(), key=lambda item: item[2])
+        total = sum(metadata.get("size", 0) for _, metadata, _ in entries)
+        freed = 0
+        for entry, metadata, _ in entries:
+            if total - freed <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            freed += metadata.get("size", 0)
+        return freed
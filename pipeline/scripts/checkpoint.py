@@ -0,0 +1,167 @@
+import json
+import os
+import pickle
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+# Input bytes (decompressed) processed between two checkpoints of a long file
+DEFAULT_CHECKPOINT_INTERVAL = 1024 ** 3
+
+
+def partial_path(path: Union[str, Path]) -> Path:
+    """Hidden in-progress name for ``path`` in the same directory (keeps the suffix, e.g. ``.gz``)."""
+    path = Path(path)
+    return path.with_name(f".partial-{path.name}")
+
+
+def _replace(source: Path, destination: Path) -> None:
+    """Move ``source`` over ``destination``, fsyncing so a crash cannot leave a truncated file behind."""
+    with open(source, "rb") as handle:
+        os.fsync(handle.fileno())
+    os.replace(source, destination)
+
+
+@contextmanager
+def atomic_path(path: Union[str, Path]) -> Iterator[Path]:
+    """Yield a temporary path to write instead of ``path``; it is renamed to ``path`` on success.
+
+    Readers see either the previous file or the complete new one, never a
+    partially written file. On error the temporary file is removed.
+    """
+    path = Path(path)
+    temporary = path.with_name(f".partial-{os.getpid()}-{path.name}")
+    try:
+        yield temporary
+        _replace(temporary, path)
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+
+
+def write_atomic(path: Union[str, Path], data: Union[str, bytes]) -> None:
+    with atomic_path(path) as temporary:
+        with open(temporary, "wb") as handle:
+            handle.write(data.encode() if isinstance(data, str) else data)
+
+
+def finish_partial(path: Union[str, Path]) -> None:
+    """Publish an output written to ``partial_path(path)`` under its final name."""
+    _replace(partial_path(path), Path(path))
+
+
+class RunManifest:
+    """Record of the stages each sample has completed in a run.
+
+    One JSON file per sample is kept in ``folder`` and rewritten atomically,
+    so worker processes never contend for the same file and a crash leaves
+    the last complete record in place. A stage only counts as complete if it
+    was recorded for the same inputs (``key``) and all its outputs still exist.
+    """
+
+    def __init__(self, folder: Union[str, Path]):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, sample: str) -> Path:
+        return self.folder / f"{sample}.json"
+
+    def load(self, sample: str) -> Dict:
+        try:
+            with open(self._path(sample), "r") as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return {"sample": sample, "stages": {}}
+
+    def completed(self, sample: str, stage: str, key: Optional[str] = None) -> Optional[Dict]:
+        """The record of a completed ``stage``, or ``None`` if it has to be (re)run."""
+        record = self.load(sample)["stages"].get(stage)
+        if record is None or (key is not None and record.get("key") != key):
+            return None
+        if not all(Path(output).exists() for output in record.get("outputs", [])):
+            return None
+        return record
+
+    def mark_complete(self, sample: str, stage: str, outputs: Sequence[Path], key: Optional[str] = None,
+                      **info) -> None:
+        manifest = self.load(sample)
+        manifest["stages"][stage] = {
+            "completed": time.time(),
+            "key": key,
+            "outputs": [str(Path(output).resolve()) for output in outputs],
+            **info,
+        }
+        write_atomic(self._path(sample), json.dumps(manifest, indent=2, default=str))
+
+    def checkpoint(self, sample: str, stage: str) -> "Checkpoint":
+        return Checkpoint(self.folder / f"{sample}.{stage}.checkpoint")
+
+
+class Checkpoint:
+    """Pickled mid-file state of a stage, saved atomically every ``interval`` input bytes.
+
+    The state holds the input byte offsets to resume reading from, the sizes
+    of the partial outputs at that point and whatever accumulators the stage
+    needs. ``key`` identifies the inputs and parameters; a checkpoint saved
+    under a different key is ignored. ``active`` tells whether a state
+    referring to the partial outputs was loaded or saved.
+    """
+
+    def __init__(self, path: Union[str, Path], interval: int = DEFAULT_CHECKPOINT_INTERVAL):
+        self.path = Path(path)
+        self.interval = interval
+        self._next = interval
+        self.active = False
+
+    def load(self, key: Optional[str] = None) -> Optional[Dict]:
+        try:
+            with open(self.path, "rb") as handle:
+                state = pickle.load(handle)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if state.get("key") != key:
+            return None
+        self._next = min(state["offsets"]) + self.interval
+        self.active = True
+        return state
+
+    def due(self, offsets: List[int]) -> bool:
+        return min(offsets) >= self._next
+
+    def save(self, state: Dict, key: Optional[str] = None) -> None:
+        write_atomic(self.path, pickle.dumps({**state, "key": key}, protocol=pickle.HIGHEST_PROTOCOL))
+        self._next = min(state["offsets"]) + self.interval
+        self.active = True
+
+    def clear(self) -> None:
+        if self.path.exists():
+            self.path.unlink()
+        self.active = False
+
+
+def restore_partial_outputs(paths: Sequence[Path], sizes: Optional[Sequence[int]]) -> None:
+    """Cut partial outputs back to the sizes recorded at a checkpoint (or remove them when starting over)."""
+    for i, path in enumerate(paths):
+        partial = partial_path(path)
+        if sizes is None:
+            if partial.exists():
+                partial.unlink()
+        else:
+            with open(partial, "r+b") as handle:
+                handle.truncate(sizes[i])
+
+
+@contextmanager
+def remove_partials_on_error(paths: Sequence[Path], checkpoint: Optional[Checkpoint] = None) -> Iterator[None]:
+    """Remove the partial outputs of ``paths`` if the block raises, unless an active ``checkpoint`` refers to them.
+
+    Without a checkpoint to resume from, a rerun starts the outputs over, so
+    the partial files would only be left behind in the output folders.
+    """
+    try:
+        yield
+    except BaseException:
+        if checkpoint is None or not checkpoint.active:
+            restore_partial_outputs(paths, None)
+        raise
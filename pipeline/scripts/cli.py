@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""rna-seek command line: quality reports, trimming, full runs and chart rendering.
+
+Usage:
+    rna-seek qc [--workers N] [--preview READS] [--no-plots] [-o OUTPUT] FASTQ [...]
+    rna-seek trim [--min-length N] [--quality Q] [--compress LEVEL] [--workers N] [--dedup [--umi]] [-o OUTPUT]
+                  FASTQ [...]
+    rna-seek demux --barcodes SHEET [--mismatches N] [--compress LEVEL] [-o OUTPUT] FASTQ [...]
+    rna-seek run [options] [--barcodes SHEET] [-o OUTPUT] FASTQ_FOLDER_OR_SAMPLE_SHEET
+    rna-seek serve [--host HOST] [--port PORT] [--workers N] [--max-upload SIZE] [--trust-user-header] [-o JOB_FOLDER]
+    rna-seek report [--workers N] [--force] [--no-plots] [--table FOLDER] REPORT_FOLDER [...]
+
+(``python cli.py ...`` from this folder.) Each subcommand imports the
+modules it needs inside its handler, so ``--help`` and argument errors
+answer without loading NumPy, and nothing run with ``--no-plots`` imports
+Matplotlib. ``benchmarks/bench_startup.py`` checks the start-up time of
+every subcommand against a budget.
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+SIZE_UNITS = {"K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30, "T": 2 ** 40}
+PROFILERS = ("cprofile", "sampling")
+# position_bins.DEFAULT_BINS_PER_OCTAVE, repeated so parsing arguments does not import NumPy
+BINS_PER_OCTAVE = 64
+
+
+def parse_size(text: str) -> int:
+    """Byte count from ``8G``, ``512M``, ``64K`` or a plain integer."""
+    text = text.strip().upper().rstrip("B")
+    multiplier = SIZE_UNITS.get(text[-1:], 1)
+    try:
+        return int(float(text[:-1] if multiplier > 1 else text) * multiplier)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r} (e.g. 8G, 512M)")
+
+
+def parse_profile(entry: str) -> Tuple[str, str]:
+    """``(stage, profiler)`` from ``STAGE[=PROFILER]``; cProfile unless a profiler is named."""
+    stage, _, profiler = entry.partition("=")
+    profiler = profiler or "cprofile"
+    if profiler not in PROFILERS:
+        raise argparse.ArgumentTypeError(f"unknown profiler '{profiler}' (expected {' or '.join(PROFILERS)})")
+    return stage, profiler
+
+
+def parse_exact_positions(text: str) -> int:
+    """Bases reported one by one; a positive multiple of the bins each doubling of the position is split into."""
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value <= 0 or value % BINS_PER_OCTAVE:
+        raise argparse.ArgumentTypeError(f"invalid position count: {text!r} (a multiple of {BINS_PER_OCTAVE})")
+    return value
+
+
+def cmd_qc(args) -> int:
+    from fastqc import fastqc_analysis, preview_analysis
+    from position_bins import PositionBins
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    options = {} if args.kmer_size is None else {'kmer_size': args.kmer_size}
+    if args.exact_positions is not None:
+        options['position_bins'] = PositionBins(args.exact_positions, BINS_PER_OCTAVE)
+    for fastq_file in args.fastq:
+        if args.preview:
+            preview_analysis(fastq_file, args.output, reads=args.preview, render_plots=not args.no_plots)
+        else:
+            fastqc_analysis(fastq_file, args.output, workers=args.workers,
+                            bounded_duplication=args.bounded_duplication, render_plots=not args.no_plots, **options)
+    return 0
+
+
+def cmd_trim(args) -> int:
+    from contextlib import ExitStack
+
+    from dedup import Deduplicator
+    from fastq_reader import fastq_stem
+    from scheduler import detect_samples
+    from trimming import wasm_trim_pairs, wasm_trim_reads
+
+    def output(prefix, fastq_file):
+        suffix = ".fastq.gz" if args.compress is not None else ".fastq"
+        return args.output / f"{prefix}{fastq_stem(fastq_file)}{suffix}"
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    options = dict(min_length=args.min_length, quality_threshold=args.quality, compresslevel=args.compress,
+                   workers=args.workers)
+    failed = 0
+    # _R1/_R2 files given together are trimmed as pairs, with the same names pipeline.py uses
+    for sample in detect_samples(args.fastq):
+        try:
+            with ExitStack() as stack:
+                if args.dedup:
+                    dedup_options = {} if args.dedup_memory is None else {'memory': args.dedup_memory}
+                    options['deduplicator'] = stack.enter_context(
+                        Deduplicator(umi=args.umi, spill_folder=args.output, **dedup_options))
+                if sample.paired:
+                    print(f"\nTrimming {sample.forward.name} and {sample.reverse.name}...")
+                    wasm_trim_pairs(sample.forward, sample.reverse, output("trimmed_1_", sample.forward),
+                                    output("trimmed_2_", sample.reverse), output("unpaired_1_", sample.forward),
+                                    output("unpaired_2_", sample.reverse), **options)
+                else:
+                    print(f"\nTrimming {sample.forward.name}...")
+                    wasm_trim_reads(sample.forward, output("", sample.forward), **options)
+        except Exception as e:
+            print(f"Error trimming {sample.name}: {str(e)}")
+            failed += 1
+    return 1 if failed else 0
+
+
+def cmd_demux(args) -> int:
+    from demultiplex import demultiplex, read_barcode_sheet
+    from scheduler import detect_samples
+
+    options = {} if args.mismatches is None else {'mismatches': args.mismatches}
+    # _R1/_R2 lanes given together are split as pairs; every lane adds to the same per-sample files
+    lanes = detect_samples(args.fastq)
+    try:
+        demultiplex(lanes, read_barcode_sheet(args.barcodes), args.output, compresslevel=args.compress, **options)
+    except Exception as e:
+        print(f"Error demultiplexing: {str(e)}")
+        return 1
+    return 0
+
+
+def cmd_run(args) -> int:
+    from pipeline import run_pipeline
+
+    options = {} if args.queue_depth is None else {'queue_depth': args.queue_depth}
+    if args.barcode_mismatches is not None:
+        options['barcode_mismatches'] = args.barcode_mismatches
+    if args.dedup_memory is not None:
+        options['dedup_memory'] = args.dedup_memory
+    completed = run_pipeline(args.input, args.output, compresslevel=args.compress, max_workers=args.workers,
+                             memory_budget=args.memory, use_cache=not args.no_cache, metrics=not args.no_metrics,
+                             prometheus_file=args.prometheus, profile=dict(args.profile or []),
+                             render_plots=not args.no_plots, preview_reads=args.preview, barcodes=args.barcodes,
+                             dedup=args.dedup, umi=args.umi, **options)
+    return 0 if completed else 1
+
+
+def cmd_serve(args) -> int:
+    from job_service import serve
+
+    serve(args.output, args.host, args.port, args.workers, args.max_upload, args.jobs_per_user, args.allow_origin,
+          args.trust_user_header)
+    return 0
+
+
+def cmd_report(args) -> int:
+    from aggregate import TABLE_FOLDER, aggregate_reports
+
+    if not args.no_plots:
+        from plots import render_pending
+        written = render_pending(args.sources, args.workers, args.force)
+        print(f"Rendered {len(written)} chart(s)")
+    # Next to the report folders by default, where a full run puts it
+    first = args.sources[0]
+    table = args.table or (first if first.is_dir() else first.parent).parent / TABLE_FOLDER
+    return 0 if aggregate_reports(args.sources, table) is not None else 1
+
+
+def add_dedup_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--dedup", action="store_true",
+                        help="remove duplicate reads (pairs) after trimming, keeping the first of each")
+    parser.add_argument("--umi", action="store_true", help="with --dedup, also compare the UMI in read names")
+    parser.add_argument("--dedup-memory", type=parse_size, metavar="SIZE",
+                        help="memory for the duplicate table before it spills to disk (default 1G)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="rna-seek", description="RNA-seq read quality control and trimming.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+
+    qc = commands.add_parser("qc", help="quality reports for FASTQ files")
+    qc.add_argument("fastq", nargs="+", type=Path, help="FASTQ files (.fastq, .fq, optionally .gz)")
+    qc.add_argument("-o", "--output", type=Path, default=Path("quality_reports"), help="report folder")
+    qc.add_argument("--workers", type=int, default=1, help="processes per file (plain or indexed BGZF input)")
+    qc.add_argument("--bounded-duplication", action="store_true",
+                    help="cap the memory used for duplication estimates")
+    qc.add_argument("--kmer-size", type=int, help="k-mer length for the enrichment report (default 7, 0 = off)")
+    qc.add_argument("--exact-positions", type=parse_exact_positions, metavar="N",
+                    help="bases reported one by one before positions are binned (default 512)")
+    qc.add_argument("--preview", type=int, metavar="READS", help="sample this many reads for a quick preview")
+    qc.add_argument("--no-plots", action="store_true", help="write summaries only (render later with 'report')")
+    qc.set_defaults(handler=cmd_qc)
+
+    trim = commands.add_parser("trim", help="adapter and quality trimming (_R1/_R2 files are trimmed as pairs)")
+    trim.add_argument("fastq", nargs="+", type=Path, help="FASTQ files (.fastq, .fq, optionally .gz)")
+    trim.add_argument("-o", "--output", type=Path, default=Path("trimmed_reads"), help="output folder")
+    trim.add_argument("--min-length", type=int, default=36, help="shortest read kept after trimming")
+    trim.add_argument("--quality", type=int, default=20, help="quality threshold for 3' trimming")
+    trim.add_argument("--compress", type=int, choices=range(1, 10), metavar="LEVEL",
+                      help="write .fastq.gz at this gzip level")
+    trim.add_argument("--workers", type=int, default=1, help="trimming threads per file")
+    add_dedup_arguments(trim)
+    trim.set_defaults(handler=cmd_trim)
+
+    demux = commands.add_parser("demux", help="split pooled lanes into one FASTQ file (or pair) per barcode")
+    demux.add_argument("fastq", nargs="+", type=Path, help="pooled lane FASTQ files (_R1/_R2 are split as pairs)")
+    demux.add_argument("--barcodes", type=Path, required=True, metavar="SHEET",
+                       help="CSV/TSV barcode sheet with sample, index and optional index2 columns")
+    demux.add_argument("--mismatches", type=int, choices=range(0, 4), metavar="N",
+                       help="mismatches allowed per index read (default 1)")
+    demux.add_argument("-o", "--output", type=Path, default=Path("demultiplexed"), help="output folder")
+    demux.add_argument("--compress", type=int, choices=range(1, 10), metavar="LEVEL",
+                       help="write .fastq.gz at this gzip level")
+    demux.set_defaults(handler=cmd_demux)
+
+    run = commands.add_parser("run", help="QC, trimming and QC of the trimmed reads for every sample")
+    run.add_argument("input", type=Path, help="folder of FASTQ files or a CSV/TSV sample sheet")
+    run.add_argument("-o", "--output", type=Path, default=Path("output"), help="output folder")
+    run.add_argument("--compress", type=int, choices=range(1, 10), metavar="LEVEL",
+                     help="write trimmed reads as .fastq.gz at this gzip level")
+    run.add_argument("--workers", type=int, help="concurrent samples (default: CPU count)")
+    run.add_argument("--memory", type=parse_size, metavar="SIZE",
+                     help="memory budget, e.g. 8G (default: 80%% of available)")
+    run.add_argument("--queue-depth", type=int, help="batches buffered between read, compute and write threads")
+    run.add_argument("--no-cache", action="store_true", help="always recompute instead of reusing results")
+    run.add_argument("--no-metrics", action="store_true", help="do not record run metrics")
+    run.add_argument("--prometheus", type=Path, metavar="FILE", help="also write metrics as a Prometheus textfile")
+    run.add_argument("--profile", action="append", type=parse_profile, metavar="STAGE[=PROFILER]",
+                     help="profile a stage with cprofile (default) or sampling; repeatable")
+    run.add_argument("--preview", type=int, metavar="READS", help="quick sampled QC of each file instead of a run")
+    run.add_argument("--barcodes", type=Path, metavar="SHEET",
+                     help="demultiplex the inputs as pooled lanes with this barcode sheet first")
+    run.add_argument("--barcode-mismatches", type=int, choices=range(0, 4), metavar="N",
+                     help="mismatches allowed per index read when demultiplexing (default 1)")
+    add_dedup_arguments(run)
+    run.add_argument("--no-plots", action="store_true", help="skip charts (render later with 'report')")
+    run.set_defaults(handler=cmd_run)
+
+    # Defaults repeated from job_service, so parsing arguments does not import the pipeline
+    serve = commands.add_parser("serve", help="local HTTP job service for the webpage's FASTQ analyzer")
+    serve.add_argument("-o", "--output", type=Path, default=Path("jobs"), help="folder for uploads and results")
+    serve.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    serve.add_argument("--port", type=int, default=8765, help="port to listen on")
+    serve.add_argument("--workers", type=int, help="concurrent jobs (default: CPU count)")
+    serve.add_argument("--max-upload", type=parse_size, default=parse_size("20G"), metavar="SIZE",
+                       help="largest accepted upload (default 20G)")
+    serve.add_argument("--jobs-per-user", type=int, default=4, help="jobs a user may have queued or running")
+    serve.add_argument("--allow-origin", default="*", help="Access-Control-Allow-Origin sent to the webpage")
+    serve.add_argument("--trust-user-header", action="store_true",
+                       help="tell users apart by the X-User header set by an authenticating proxy (not client address)")
+    serve.set_defaults(handler=cmd_serve)
+
+    report = commands.add_parser("report", help="render pending charts and aggregate the QC table")
+    report.add_argument("sources", nargs="+", type=Path, help="report folders or *_qc_summary.npz files")
+    report.add_argument("--table", type=Path, help="table folder (default: qc_table next to the report folders)")
+    report.add_argument("--workers", type=int, help="rendering processes (default: CPU count)")
+    report.add_argument("--force", action="store_true", help="re-render charts that are up to date")
+    report.add_argument("--no-plots", action="store_true", help="only aggregate the table")
+    report.set_defaults(handler=cmd_report)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""Exact removal of duplicate reads (or read pairs) by 64-bit hash, for the trimming stage.
+
+Every read is keyed by a 64-bit hash of its sequence (of both mates for a
+pair, plus the UMI from the read name with ``umi=True``). Keys seen so far
+are kept in an open-addressing table of NumPy ``uint64`` slots, about 8-16
+bytes per distinct read instead of the 100+ of a Python ``set`` of
+sequence strings; the first read of each key is kept, later ones dropped.
+Distinct reads whose hashes collide would be counted as duplicates; the
+chance of any collision among n distinct reads is about n**2 / 2**65
+(under 0.03% for 100 million).
+
+When the table would outgrow its memory cap, the ``Deduplicator`` spills:
+the keys seen so far go to ``partitions`` files on disk, every later read
+goes to a pending FASTQ file with its key appended to the partition of the
+key, and ``finish`` decides the pending reads one partition at a time
+before streaming the kept ones back.
+"""
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from duplication import hash_sequences
+from fastq_reader import FastqBatch, FastqReader
+from metrics import METRICS
+from trimming import paired_batches
+
+DEFAULT_DEDUP_MEMORY = 1024 ** 3
+DEFAULT_SPILL_PARTITIONS = 64
+# Grow the table once it would be more than this full (linear probing slows down sharply beyond)
+MAX_LOAD = 0.7
+# Key stored in spill partitions; index -1 marks a key seen before the spill
+SPILL_RECORD = np.dtype([("key", "<u8"), ("index", "<i8")])
+
+
+def _mix(keys: np.ndarray) -> np.ndarray:
+    """SplitMix64 finalizer, spreading FNV hashes over all 64 bits."""
+    with np.errstate(over="ignore"):
+        keys = (keys ^ (keys >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        keys = (keys ^ (keys >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return keys ^ (keys >> np.uint64(31))
+
+
+def parse_umi(header: bytes) -> bytes:
+    """UMI of a read name: the 8th ``:`` field (Illumina) or the part after the last ``_`` (UMI-tools)."""
+    name = header.split(None, 1)[0] if header else b""
+    fields = name.split(b":")
+    if len(fields) >= 8:
+        return fields[7]
+    return name.rsplit(b"_", 1)[1] if b"_" in name else b""
+
+
+def read_keys(mates: Sequence[FastqBatch], umi: bool = False) -> np.ndarray:
+    """Non-zero 64-bit key of each read (``mates`` of one batch) or read pair (both mates' batches).
+
+    Sequences are compared case-insensitively; with ``umi`` the UMI from
+    the first mate's read name (``parse_umi``) is part of the key.
+    """
+    keys = np.zeros(len(mates[0]), dtype=np.uint64)
+    parts = [hash_sequences(batch.seqs & 0xDF, batch.lengths) for batch in mates]
+    if umi:
+        umis = [parse_umi(header) for header in mates[0].headers()]
+        width = max(map(len, umis), default=0)
+        if width:
+            codes = np.array(umis, dtype=f"S{width}").view(np.uint8).reshape(len(umis), width)
+            parts.append(hash_sequences(codes, np.array([len(u) for u in umis], dtype=np.int64)))
+    with np.errstate(over="ignore"):
+        for part in parts:
+            keys = _mix(keys * np.uint64(0x9E3779B97F4A7C15) + part)
+    keys[keys == 0] = 1
+    return keys
+
+
+class KeySet:
+    """Set of non-zero uint64 keys in an open-addressing hash table (linear probing), 8 bytes per slot.
+
+    Kept at most ``MAX_LOAD`` full, so a distinct key costs 8 / MAX_LOAD to
+    twice that many bytes depending on where the table is between resizes.
+    Keys of a batch are inserted together, as in ``kmers.CountTable``.
+    """
+
+    def __init__(self, capacity: int = 1 << 16):
+        self.slots = np.zeros(capacity, dtype=np.uint64)
+        self.size = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.slots.nbytes
+
+    def capacity_for(self, count: int) -> int:
+        """Table capacity needed to hold ``count`` more keys."""
+        capacity = len(self.slots)
+        while self.size + count > capacity * MAX_LOAD:
+            capacity *= 2
+        return capacity
+
+    def _home(self, keys: np.ndarray) -> np.ndarray:
+        """Fibonacci hashing onto the table's power-of-two capacity."""
+        shift = np.uint64(64 - (len(self.slots).bit_length() - 1))
+        with np.errstate(over="ignore"):
+            return ((keys * np.uint64(0x9E3779B97F4A7C15)) >> shift).astype(np.int64)
+
+    def add(self, keys: np.ndarray) -> np.ndarray:
+        """Insert distinct ``keys``; True for each key that was not in the set yet."""
+        capacity = self.capacity_for(len(keys))
+        if capacity != len(self.slots):
+            old = self.slots[self.slots != 0]
+            self.slots = np.zeros(capacity, dtype=np.uint64)
+            self.size = 0
+            self._insert(old)
+        return self._insert(keys)
+
+    def _insert(self, keys: np.ndarray) -> np.ndarray:
+        mask = len(self.slots) - 1
+        slots = self._home(keys)
+        added = np.zeros(len(keys), dtype=bool)
+        pending = np.arange(len(keys))
+        while len(pending):
+            current = self.slots[slots[pending]]
+            hit = current == keys[pending]
+            empty = np.flatnonzero(current == 0)
+            # Several keys may want the same empty slot; the first takes it and the others probe on
+            _, first = np.unique(slots[pending[empty]], return_index=True)
+            winners = pending[empty[first]]
+            self.slots[slots[winners]] = keys[winners]
+            added[winners] = True
+            self.size += len(winners)
+            remaining = ~hit
+            remaining[empty[first]] = False
+            moving = pending[remaining & (current != 0)]
+            slots[moving] = (slots[moving] + 1) & mask
+            pending = pending[remaining]
+        return added
+
+    def keys(self) -> np.ndarray:
+        return self.slots[self.slots != 0]
+
+
+class Deduplicator:
+    """Keep the first read of every key across the batches passed to ``filter``, then ``finish``.
+
+    ``filter`` returns the kept part of each batch (or of both mates'
+    batches) while the key table fits in ``memory`` bytes. After that it
+    spills (see the module docstring) and returns empty batches; the kept
+    reads come from ``finish`` instead, in input order. Spill files are
+    written to a temporary folder in ``spill_folder`` (the system's
+    temporary folder by default) and removed by ``finish`` or ``close``
+    (on leaving a ``with`` block).
+    """
+
+    def __init__(self, memory: int = DEFAULT_DEDUP_MEMORY, umi: bool = False, spill_folder: Optional[Path] = None,
+                 partitions: int = DEFAULT_SPILL_PARTITIONS):
+        self.memory = memory
+        self.umi = umi
+        self.spill_folder = spill_folder
+        self.partition_bits = max(1, (partitions - 1).bit_length())
+        self.table = KeySet()
+        self.reads = 0
+        self.duplicates = 0
+        self.duplicate_bases = 0
+        self.mates = 1
+        self.folder: Optional[Path] = None
+        self.pending = 0
+        self._partitions = []
+        self._pending_handles = []
+
+    @property
+    def spilled(self) -> bool:
+        return self.folder is not None
+
+    @property
+    def duplicate_rate(self) -> float:
+        return self.duplicates / self.reads if self.reads else 0.0
+
+    def filter(self, mates: List[FastqBatch]) -> List[FastqBatch]:
+        """The reads (or pairs) of ``mates`` whose key has not been seen before."""
+        self.mates = len(mates)
+        with METRICS.stage("dedup"):
+            keys = read_keys(mates, self.umi)
+            self.reads += len(keys)
+            if not self.spilled and self.table.capacity_for(len(keys)) * 8 > self.memory:
+                self._spill()
+            if self.spilled:
+                self._append_pending(mates, keys)
+                return [batch.subset(np.zeros(0, dtype=np.int64)) for batch in mates]
+            unique, first = np.unique(keys, return_index=True)
+            keep = np.zeros(len(keys), dtype=bool)
+            keep[first[self.table.add(unique)]] = True
+            self._count_dropped(mates, ~keep)
+            return [batch.subset(keep) for batch in mates]
+
+    def _count_dropped(self, mates: List[FastqBatch], dropped: np.ndarray) -> None:
+        self.duplicates += int(dropped.sum())
+        self.duplicate_bases += sum(int(batch.lengths[dropped].sum()) for batch in mates)
+
+    def _partition_paths(self) -> List[Path]:
+        return [self.folder / f"keys_{p}.bin" for p in range(1 << self.partition_bits)]
+
+    def _spill(self) -> None:
+        self.folder = Path(tempfile.mkdtemp(prefix=".dedup-", dir=self.spill_folder))
+        print(f"Deduplication table reached {self.memory / 2 ** 20:.0f} MiB; spilling to {self.folder}")
+        self._partitions = [open(path, "wb") for path in self._partition_paths()]
+        self._pending_handles = [open(self.folder / f"pending_{mate}.fastq", "wb") for mate in range(self.mates)]
+        seen = self.table.keys()
+        self.table = None
+        self._write_keys(seen, np.full(len(seen), -1, dtype=np.int64))
+
+    def _write_keys(self, keys: np.ndarray, indices: np.ndarray) -> None:
+        records = np.empty(len(keys), dtype=SPILL_RECORD)
+        records["key"], records["index"] = keys, indices
+        partition = (keys >> np.uint64(64 - self.partition_bits)).astype(np.int64)
+        order = np.argsort(partition, kind="stable")
+        bounds = np.searchsorted(partition[order], np.arange(len(self._partitions) + 1))
+        for p, handle in enumerate(self._partitions):
+            if bounds[p + 1] > bounds[p]:
+                handle.write(records[order[bounds[p]:bounds[p + 1]]].tobytes())
+
+    def _append_pending(self, mates: List[FastqBatch], keys: np.ndarray) -> None:
+        self._write_keys(keys, self.pending + np.arange(len(keys), dtype=np.int64))
+        for handle, batch in zip(self._pending_handles, mates):
+            handle.write(batch.to_fastq())
+        self.pending += len(keys)
+
+    def _resolve(self) -> np.ndarray:
+        """Bitmap (little-endian bits) of the pending reads to keep, built one partition at a time."""
+        keep = np.zeros((self.pending + 7) // 8, dtype=np.uint8)
+        for path in self._partition_paths():
+            records = np.fromfile(path, dtype=SPILL_RECORD)
+            path.unlink()
+            if not len(records):
+                continue
+            order = np.lexsort((records["index"], records["key"]))
+            keys, indices = records["key"][order], records["index"][order]
+            first = np.ones(len(keys), dtype=bool)
+            first[1:] = keys[1:] != keys[:-1]
+            kept = indices[first & (indices >= 0)]
+            np.bitwise_or.at(keep, kept >> 3, (1 << (kept & 7)).astype(np.uint8))
+        return keep
+
+    def finish(self) -> Iterator[List[FastqBatch]]:
+        """Kept pending reads (or pairs) after a spill, in input order; nothing if the run never spilled."""
+        if not self.spilled:
+            return
+        try:
+            for handle in self._partitions + self._pending_handles:
+                handle.close()
+            with METRICS.stage("dedup"):
+                keep = self._resolve()
+            readers = [FastqReader(self.folder / f"pending_{mate}.fastq", max_batch_bases=None)
+                       for mate in range(self.mates)]
+            try:
+                batches = paired_batches(*readers) if self.mates == 2 else ([batch] for batch in readers[0])
+                start = 0
+                for mates in batches:
+                    end = start + len(mates[0])
+                    bits = np.unpackbits(keep[start >> 3:(end + 7) >> 3], bitorder="little")
+                    selected = bits[start & 7:(start & 7) + end - start].astype(bool)
+                    self._count_dropped(mates, ~selected)
+                    start = end
+                    yield [batch.subset(selected) for batch in mates]
+            finally:
+                for reader in readers:
+                    reader.close()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Remove the spill files."""
+        for handle in self._partitions + self._pending_handles:
+            handle.close()
+        if self.folder is not None:
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+    def __enter__(self) -> "Deduplicator":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def record(self, stats) -> None:
+        """Take the removed duplicates out of a ``TrimStats``'s output counts and add the dedup counters."""
+        stats.dedup_reads += self.reads
+        stats.duplicates += self.duplicates
+        stats.reads_out -= self.duplicates * self.mates
+        stats.bases_out -= self.duplicate_bases
+        if hasattr(stats, "pairs_out"):
+            stats.pairs_out -= self.duplicates
+        METRICS.count("dedup_in", self.reads)
+        METRICS.count("duplicates", self.duplicates)
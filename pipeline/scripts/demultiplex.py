@@ -0,0 +1,449 @@
+"""Barcode demultiplexing of pooled lanes in a single pass, ahead of QC and trimming.
+
+Reads of a pooled lane carry their index read(s) in the header (Casava
+1.8+ ``... 1:N:0:ATCACG+GTTTCG`` or older ``...#ATCACG/1`` names). Every
+index sequence within ``mismatches`` substitutions of a barcode (per index
+read, as bcl2fastq counts them) is enumerated once into a hash table, so
+assigning a read is one lookup of its packed index; a batch only looks up
+its distinct indexes. Index sequences close to two samples' barcodes are
+left out of the table, and their reads are undetermined.
+
+Each lane is streamed once and every sample's reads are appended to
+in-memory buffers that a single background thread writes out through a
+bounded pool of open files (``WriterPool``), so hundreds of samples need
+neither hundreds of threads nor hundreds of file handles.
+"""
+import csv
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from queue import Queue
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from checkpoint import finish_partial, partial_path, remove_partials_on_error, restore_partial_outputs, write_atomic
+from fastq_reader import FastqBatch, FastqReader, open_fastq_output
+from metrics import METRICS
+from scheduler import Sample
+from staging import DEFAULT_QUEUE_DEPTH, prefetch
+from trimming import paired_batches
+
+DEFAULT_MISMATCHES = 1
+UNDETERMINED = "Undetermined"
+DEMUX_FOLDER = "demultiplexed"
+DEMUX_STATS_FILE = "demux_stats.tsv"
+# Bytes buffered per output before they are handed to the writer thread
+DEMUX_BUFFER_SIZE = 256 * 1024
+# Output files kept open at once; others are closed and reopened for appending
+DEFAULT_MAX_OPEN = 64
+
+# Index bases are packed 3 bits each into uint64 keys (N is a base of its own, so it counts as a mismatch)
+INDEX_BASES = "ACGTN"
+MAX_INDEX_BASES = 21
+INDEX_CODES = np.full(256, -1, dtype=np.int64)
+for _code, _base in enumerate(INDEX_BASES):
+    INDEX_CODES[ord(_base)] = INDEX_CODES[ord(_base.lower())] = _code
+
+
+class Barcode:
+    """A sample's index sequence(s) from the barcode sheet."""
+
+    def __init__(self, sample: str, index: str, index2: str = ""):
+        self.sample = sample
+        self.index = index.upper()
+        self.index2 = index2.upper()
+
+    def __repr__(self):
+        return f"Barcode({self.sample}: {self.index}{'+' + self.index2 if self.index2 else ''})"
+
+
+def read_barcode_sheet(sheet_path: Path) -> List[Barcode]:
+    """Read a CSV/TSV barcode sheet with ``sample``, ``index`` and optional ``index2`` columns.
+
+    All barcodes must use A/C/G/T only and have the same index lengths.
+    """
+    sheet_path = Path(sheet_path)
+    with open(sheet_path, "r", newline="") as handle:
+        dialect = csv.Sniffer().sniff(handle.read(4096), delimiters=",\t")
+        handle.seek(0)
+        rows = list(csv.DictReader(handle, dialect=dialect))
+
+    barcodes = []
+    for line, row in enumerate(rows, 2):
+        row = {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+        if not row.get("sample") or not row.get("index"):
+            raise ValueError(f"{sheet_path.name}, line {line}: 'sample' and 'index' are required")
+        if "/" in row["sample"] or row["sample"] == UNDETERMINED:
+            raise ValueError(f"{sheet_path.name}, line {line}: invalid sample name '{row['sample']}'")
+        barcode = Barcode(row["sample"], row["index"], row.get("index2", ""))
+        if set(barcode.index + barcode.index2) - set("ACGT"):
+            raise ValueError(f"{sheet_path.name}, line {line}: barcodes may only contain A, C, G and T")
+        if barcodes and (len(barcode.index), len(barcode.index2)) != (len(barcodes[0].index),
+                                                                       len(barcodes[0].index2)):
+            raise ValueError(f"{sheet_path.name}, line {line}: every barcode must have the same index lengths")
+        barcodes.append(barcode)
+    if not barcodes:
+        raise ValueError(f"{sheet_path.name}: no barcodes")
+    if len({barcode.sample for barcode in barcodes}) != len(barcodes):
+        raise ValueError(f"{sheet_path.name}: sample names must be unique")
+    return barcodes
+
+
+def pack_index(codes: np.ndarray) -> np.ndarray:
+    """uint64 keys of ``(n, bases)`` index base codes (``INDEX_CODES``), 3 bits per base."""
+    shifts = (3 * np.arange(codes.shape[1])).astype(np.uint64)
+    return (codes.astype(np.uint64) << shifts).sum(axis=1, dtype=np.uint64)
+
+
+def mismatch_variants(sequence: str, mismatches: int) -> Dict[str, int]:
+    """Every sequence within ``mismatches`` substitutions (by A/C/G/T/N) of ``sequence``, with its distance."""
+    variants = {sequence: 0}
+    for distance in range(1, mismatches + 1):
+        for positions in itertools.combinations(range(len(sequence)), distance):
+            choices = [[base for base in INDEX_BASES if base != sequence[i]] for i in positions]
+            for bases in itertools.product(*choices):
+                variant = list(sequence)
+                for i, base in zip(positions, bases):
+                    variant[i] = base
+                variants.setdefault("".join(variant), distance)
+    return variants
+
+
+def parse_index(header: bytes) -> Optional[bytes]:
+    """Index field of a read name (``i7`` or ``i7+i5``), or ``None`` if the header carries none.
+
+    Casava 1.8+ names have it as the last ``:`` field of the comment,
+    older names after ``#`` (up to the ``/1`` mate suffix).
+    """
+    words = header.split(None, 1)
+    if len(words) == 2 and b":" in words[1]:
+        return words[1].rsplit(b":", 1)[1].strip()
+    if words and b"#" in words[0]:
+        return words[0].split(b"#", 1)[1].split(b"/", 1)[0]
+    return None
+
+
+class BarcodeTable:
+    """Hash table from every index sequence within ``mismatches`` of a barcode to its sample.
+
+    Mismatches are allowed in each index read separately. A sequence within
+    reach of two barcodes goes to the closer one; at equal distance it is
+    ambiguous and left out (``ambiguous`` counts them). Two samples with the
+    same barcode are an error.
+    """
+
+    def __init__(self, barcodes: Sequence[Barcode], mismatches: int = DEFAULT_MISMATCHES):
+        self.samples = [barcode.sample for barcode in barcodes]
+        self.lengths = (len(barcodes[0].index), len(barcodes[0].index2))
+        self.mismatches = mismatches
+        if sum(self.lengths) > MAX_INDEX_BASES:
+            raise ValueError(f"Index reads of {sum(self.lengths)} bases exceed the {MAX_INDEX_BASES} supported")
+
+        entries: Dict[int, Tuple[int, int]] = {}
+        for sample_id, barcode in enumerate(barcodes):
+            first = mismatch_variants(barcode.index, mismatches)
+            second = mismatch_variants(barcode.index2, mismatches) if barcode.index2 else {"": 0}
+            pairs = list(itertools.product(first.items(), second.items()))
+            keys = self._pack([variant + variant2 for (variant, _), (variant2, _) in pairs]).tolist()
+            for key, ((_, distance), (_, distance2)) in zip(keys, pairs):
+                distance += distance2
+                current = entries.get(key)
+                if current is None or distance < current[1]:
+                    entries[key] = (sample_id, distance)
+                elif distance == current[1] and current[0] != sample_id:
+                    if distance == 0:
+                        raise ValueError(f"Samples {self.samples[current[0]]} and {barcode.sample} "
+                                         f"share the barcode {barcode.index}{barcode.index2}")
+                    entries[key] = (-1, distance)
+        self.table = {key: entry for key, entry in entries.items() if entry[0] >= 0}
+        self.ambiguous = len(entries) - len(self.table)
+
+    @staticmethod
+    def _pack(sequences: Sequence[str]) -> np.ndarray:
+        data = np.frombuffer("".join(sequences).encode(), dtype=np.uint8)
+        return pack_index(INDEX_CODES[data].reshape(len(sequences), -1))
+
+    def read_keys(self, batch: FastqBatch) -> np.ndarray:
+        """Packed index of each read in ``batch`` (-1 where the header has no valid index of the right length).
+
+        The last ``:`` field of every header is cut out at once from the
+        batch's header buffer; headers in another layout are parsed with
+        ``parse_index``.
+        """
+        first, second = self.lengths
+        field = first + second + (1 if second else 0)
+        data = np.frombuffer(batch.header_data, dtype=np.uint8)
+        starts, ends = batch.header_offsets[:-1], batch.header_offsets[1:]
+        keys = np.full(len(batch), -1, dtype=np.int64)
+        parsed = np.zeros(len(batch), dtype=bool)
+        colons = np.flatnonzero(data == ord(':'))
+        if len(colons):
+            last = colons[np.maximum(np.searchsorted(colons, ends) - 1, 0)]
+            parsed = (last >= starts) & (ends - last - 1 == field)
+            rows = np.flatnonzero(parsed)
+            if len(rows):
+                fields = data[last[rows][:, None] + 1 + np.arange(field)]
+                valid = np.ones(len(rows), dtype=bool)
+                if second:
+                    valid = fields[:, first] == ord('+')
+                    fields = np.delete(fields, first, axis=1)
+                codes = INDEX_CODES[fields]
+                valid &= (codes >= 0).all(axis=1)
+                keys[rows[valid]] = pack_index(codes[valid]).astype(np.int64)
+                parsed[rows[~valid]] = False
+        for i in np.flatnonzero(~parsed).tolist():
+            index = parse_index(batch.header(i))
+            if index is None:
+                continue
+            bases = index.replace(b"+", b"") if second else index
+            codes = INDEX_CODES[np.frombuffer(bases, dtype=np.uint8)]
+            if len(bases) == first + second and (codes >= 0).all():
+                keys[i] = int(pack_index(codes[None, :])[0])
+        return keys
+
+    def assign(self, batch: FastqBatch) -> Tuple[np.ndarray, np.ndarray]:
+        """``(sample, mismatches)`` of each read in ``batch``; sample -1 for undetermined reads."""
+        keys = self.read_keys(batch)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        entries = np.array([self.table.get(key, (-1, 0)) for key in unique.tolist()], dtype=np.int64).reshape(-1, 2)
+        return entries[inverse.ravel(), 0], entries[inverse.ravel(), 1]
+
+
+class DemuxStats:
+    """Reads assigned to each sample (with and without index mismatches) and undetermined reads."""
+
+    def __init__(self, barcodes: Sequence[Barcode]):
+        self.barcodes = list(barcodes)
+        self.perfect = np.zeros(len(self.barcodes), dtype=np.int64)
+        self.mismatched = np.zeros(len(self.barcodes), dtype=np.int64)
+        self.undetermined = 0
+        self.elapsed = 0.0
+
+    @property
+    def reads(self) -> int:
+        return int(self.perfect.sum() + self.mismatched.sum()) + self.undetermined
+
+    @property
+    def undetermined_fraction(self) -> float:
+        return self.undetermined / self.reads if self.reads else 0.0
+
+    def add(self, samples: np.ndarray, mismatches: np.ndarray) -> None:
+        assigned = samples >= 0
+        self.perfect += np.bincount(samples[assigned & (mismatches == 0)], minlength=len(self.barcodes))
+        self.mismatched += np.bincount(samples[assigned & (mismatches > 0)], minlength=len(self.barcodes))
+        self.undetermined += int((~assigned).sum())
+
+    def record_metrics(self) -> None:
+        METRICS.count("demux_reads", self.reads)
+        METRICS.count("demux_undetermined", self.undetermined)
+
+    def summary(self) -> str:
+        rate = self.reads / self.elapsed if self.elapsed else 0.0
+        return (f"Demultiplexed {self.reads} reads into {int(((self.perfect + self.mismatched) > 0).sum())} of "
+                f"{len(self.barcodes)} samples; {self.undetermined_fraction * 100:.2f}% undetermined "
+                f"({rate:,.0f} reads/s)")
+
+    def write(self, path: Path) -> Path:
+        """Per-barcode read counts as TSV, with an ``Undetermined`` row."""
+        reads = max(self.reads, 1)
+        lines = ["\t".join(["sample", "index", "index2", "reads", "perfect_index", "mismatched_index", "percent"])]
+        for i, barcode in enumerate(self.barcodes):
+            total = int(self.perfect[i] + self.mismatched[i])
+            lines.append("\t".join([barcode.sample, barcode.index, barcode.index2, str(total), str(self.perfect[i]),
+                                    str(self.mismatched[i]), f"{total / reads * 100:.4f}"]))
+        lines.append("\t".join([UNDETERMINED, "", "", str(self.undetermined), "", "",
+                                f"{self.undetermined / reads * 100:.4f}"]))
+        write_atomic(path, "\n".join(lines) + "\n")
+        return path
+
+
+class WriterPool:
+    """Buffered appends to many FASTQ outputs, written by one background thread through a few open files.
+
+    ``write(output, data)`` adds to that output's buffer; full buffers are
+    queued (at most ``depth`` at a time) for the writer thread, which keeps
+    up to ``max_open`` files open and closes the least recently used one to
+    open another. Outputs are written to ``checkpoint.partial_path`` names
+    and renamed into place by ``close``; every output exists afterwards,
+    empty if nothing was written to it. Errors on the writer thread are
+    raised by the next ``write`` or ``close``. If ``close`` fails, or the
+    ``with`` block raises (``abort``), the partial outputs are removed
+    instead, so an incomplete output never appears under its final name.
+    """
+
+    def __init__(self, paths: Sequence[Path], compresslevel: Optional[int] = None,
+                 buffer_size: int = DEMUX_BUFFER_SIZE, max_open: int = DEFAULT_MAX_OPEN,
+                 depth: int = DEFAULT_QUEUE_DEPTH):
+        self.paths = [Path(path) for path in paths]
+        self.compresslevel = compresslevel
+        self.buffer_size = buffer_size
+        self.max_open = max(1, max_open)
+        self._buffers = [bytearray() for _ in self.paths]
+        self._started = [False] * len(self.paths)
+        self._handles: "OrderedDict[int, object]" = OrderedDict()
+        self._queue: Queue = Queue(maxsize=max(depth, 1))
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._drain, name="demux-writer", daemon=True)
+        self._thread.start()
+        self.closed = False
+
+    def _handle(self, output: int):
+        handle = self._handles.pop(output, None)
+        if handle is None:
+            if len(self._handles) >= self.max_open:
+                self._handles.popitem(last=False)[1].close()
+            handle = open_fastq_output(partial_path(self.paths[output]), self.compresslevel,
+                                       append=self._started[output])
+            self._started[output] = True
+        self._handles[output] = handle
+        return handle
+
+    def _drain(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is None:
+                output, data = item
+                try:
+                    with METRICS.stage("write"):
+                        self._handle(output).write(data)
+                    METRICS.count("bytes_out", len(data))
+                except BaseException as e:
+                    self._error = e
+
+    def _raise(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _flush(self, output: int) -> None:
+        if self._buffers[output]:
+            self._queue.put((output, bytes(self._buffers[output])))
+            self._buffers[output].clear()
+
+    def write(self, output: int, data: bytes) -> None:
+        self._raise()
+        self._buffers[output] += data
+        if len(self._buffers[output]) >= self.buffer_size:
+            self._flush(output)
+
+    def close(self) -> None:
+        """Write out every buffer, close all files and publish the outputs."""
+        if self.closed:
+            return
+        self.closed = True
+        with remove_partials_on_error(self.paths):
+            try:
+                for output in range(len(self.paths)):
+                    self._flush(output)
+                self._queue.put(None)
+                self._thread.join()
+                self._raise()
+                for output in range(len(self.paths)):
+                    if not self._started[output]:
+                        self._handle(output)
+            finally:
+                for handle in self._handles.values():
+                    handle.close()
+            for path in self.paths:
+                finish_partial(path)
+
+    def abort(self) -> None:
+        """Stop the writer thread, close all files and remove the partial outputs without publishing them."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._queue.put(None)
+            self._thread.join()
+        finally:
+            for handle in self._handles.values():
+                handle.close()
+            restore_partial_outputs(self.paths, None)
+
+    def __enter__(self) -> "WriterPool":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def demux_outputs(folder: Path, names: Sequence[str], paired: bool, compresslevel: Optional[int] = None):
+    """Output paths of each name: ``[name_R1, name_R2]`` for paired lanes, ``[name]`` otherwise."""
+    suffix = ".fastq.gz" if compresslevel is not None else ".fastq"
+    mates = ["_R1", "_R2"] if paired else [""]
+    return [[folder / f"{name}{mate}{suffix}" for mate in mates] for name in names]
+
+
+def demultiplex(lanes: Sequence[Sample], barcodes: Sequence[Barcode], output_folder: Path,
+                mismatches: int = DEFAULT_MISMATCHES, compresslevel: Optional[int] = None,
+                queue_depth: int = DEFAULT_QUEUE_DEPTH, show_progress: bool = True) -> Tuple[List[Sample], DemuxStats]:
+    """Split pooled ``lanes`` into one FASTQ file (or R1/R2 pair) per barcode in a single pass over each lane.
+
+    Reads are assigned by the index in their header (the R1 header for
+    paired lanes), allowing ``mismatches`` per index read. Reads of every
+    lane go to the same per-sample outputs, and unassigned reads to
+    ``Undetermined``. The per-barcode counts are written to
+    ``DEMUX_STATS_FILE``. Returns the samples that received reads, ready
+    for the QC and trimming stages, and the counts.
+    """
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    paired = lanes[0].paired
+    if any(lane.paired != paired for lane in lanes):
+        raise ValueError("Lanes to demultiplex together must all be single-end or all paired-end")
+    table = BarcodeTable(barcodes, mismatches)
+    if table.ambiguous:
+        print(f"Warning: {table.ambiguous} index sequences are within {mismatches} mismatch(es) of two barcodes; "
+              f"their reads are left undetermined")
+    outputs = demux_outputs(output_folder, table.samples + [UNDETERMINED], paired, compresslevel)
+    undetermined = len(table.samples)
+    stats = DemuxStats(barcodes)
+    start = time.perf_counter()
+
+    with METRICS.stage("demux"), WriterPool([path for paths in outputs for path in paths], compresslevel,
+                                            depth=queue_depth) as pool:
+        for lane in lanes:
+            print(f"\nDemultiplexing {', '.join(path.name for path in lane.files)}...")
+            # Mates must land in batches of the same size, so paired batches are cut by read count only
+            readers = [FastqReader(path, max_batch_bases=None) if paired else FastqReader(path)
+                       for path in lane.files]
+            try:
+                streams = [prefetch(METRICS.timed_iter("read", reader), queue_depth) for reader in readers]
+                batches = paired_batches(*streams) if paired else ((batch,) for batch in streams[0])
+                for mates in batches:
+                    samples, sample_mismatches = table.assign(mates[0])
+                    stats.add(samples, sample_mismatches)
+                    samples[samples < 0] = undetermined
+                    order = np.argsort(samples, kind='stable')
+                    present, first = np.unique(samples[order], return_index=True)
+                    for sample, rows in zip(present.tolist(), np.split(order, first[1:])):
+                        for mate, batch in enumerate(mates):
+                            pool.write(sample * len(mates) + mate, batch.subset(rows).to_fastq())
+                    if show_progress:
+                        print(f"Progress: {readers[0].progress * 100:.2f}%", end='\r')
+                if show_progress:
+                    print()
+                METRICS.count("bytes_in", sum(reader.bytes_read for reader in readers))
+            finally:
+                for reader in readers:
+                    reader.close()
+    stats.elapsed = time.perf_counter() - start
+    stats.record_metrics()
+    stats.write(output_folder / DEMUX_STATS_FILE)
+    print(stats.summary())
+
+    assigned = stats.perfect + stats.mismatched
+    samples = []
+    for i, name in enumerate(table.samples):
+        if assigned[i]:
+            samples.append(Sample(name, *outputs[i]))
+        else:
+            print(f"Warning: no reads found for sample {name}")
+    return samples, stats
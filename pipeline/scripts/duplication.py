@@ -0,0 +1,205 @@
+import heapq
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from fastq_reader import FastqBatch
+
+# FastQC tracks the first 100,000 distinct sequences to estimate duplication levels
+DEFAULT_MAX_DISTINCT = 100_000
+# Space-Saving capacity; every sequence above total/capacity reads is guaranteed to be kept
+DEFAULT_HEAVY_HITTERS = 10_000
+
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def hash_sequences(seqs: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Deterministic 64-bit FNV-1a hash of each row of a padded uint8 matrix.
+
+    Unlike ``hash()``, the result does not depend on the interpreter's hash
+    seed, so hashes from different worker processes can be compared.
+    """
+    hashes = np.full(len(lengths), FNV_OFFSET, dtype=np.uint64)
+    columns = np.arange(seqs.shape[1])
+    with np.errstate(over="ignore"):
+        for column in columns:
+            active = column < lengths
+            mixed = (hashes ^ seqs[:, column].astype(np.uint64)) * FNV_PRIME
+            hashes = np.where(active, mixed, hashes)
+        hashes = (hashes ^ lengths.astype(np.uint64)) * FNV_PRIME
+    return hashes
+
+
+class ExactSequenceCounter:
+    """Exact per-sequence counts in a dict keyed by the full read sequence."""
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+
+    def add(self, sequences: List[bytes], batch: FastqBatch) -> None:
+        for seq in sequences:
+            self.counts[seq] += 1
+
+    def merge(self, other: "ExactSequenceCounter") -> None:
+        for seq, count in other.counts.items():
+            self.counts[seq] += count
+
+    def duplication_levels(self, total: int) -> Dict[int, float]:
+        levels = defaultdict(int)
+        for count in self.counts.values():
+            levels[count] += 1
+        return levels
+
+    def top_sequences(self, min_count: float) -> List[Tuple[bytes, int]]:
+        """Sequences seen more than ``min_count`` times, most frequent first."""
+        frequent = [(seq, count) for seq, count in self.counts.items() if count > min_count]
+        frequent.sort(key=lambda x: x[1], reverse=True)
+        return frequent
+
+    def notes(self, total: int) -> List[str]:
+        return []
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitter summary (Metwally et al.) with a fixed number of counters.
+
+    Each tracked item's count overestimates its true count by at most its
+    recorded error, which never exceeds ``total / capacity``.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_HEAVY_HITTERS):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self._heap = []
+
+    def _min_count(self) -> int:
+        while self._heap:
+            count, item = self._heap[0]
+            if self.counts.get(item) == count:
+                return count
+            heapq.heappop(self._heap)
+        return 0
+
+    def _rebuild_heap(self) -> None:
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def add(self, item, weight: int = 1) -> None:
+        if item in self.counts:
+            self.counts[item] += weight
+            heapq.heappush(self._heap, (self.counts[item], item))
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (weight, item))
+        else:
+            floor = self._min_count()
+            _, evicted = heapq.heappop(self._heap)
+            del self.counts[evicted]
+            del self.errors[evicted]
+            self.counts[item] = floor + weight
+            self.errors[item] = floor
+            heapq.heappush(self._heap, (floor + weight, item))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """Combine two summaries; items missing from a full summary are credited with its minimum count."""
+        own_floor = self._min_count() if len(self.counts) >= self.capacity else 0
+        other_floor = other._min_count() if len(other.counts) >= other.capacity else 0
+        counts, errors = {}, {}
+        for item in set(self.counts) | set(other.counts):
+            counts[item] = self.counts.get(item, own_floor) + other.counts.get(item, other_floor)
+            errors[item] = (self.errors.get(item, own_floor) + other.errors.get(item, other_floor))
+        kept = sorted(counts, key=counts.get, reverse=True)[:self.capacity]
+        self.counts = {item: counts[item] for item in kept}
+        self.errors = {item: errors[item] for item in kept}
+        self._rebuild_heap()
+
+    def max_error(self) -> int:
+        return max(self.errors.values(), default=0)
+
+
+class BoundedSequenceCounter:
+    """Fixed-memory duplication and overrepresentation estimates.
+
+    Duplication levels follow FastQC: only the first ``max_distinct`` distinct
+    sequences (by 64-bit hash) are tracked, they keep being counted for the
+    whole file, and each level is corrected for the chance that a sequence
+    with that duplication level was first seen after the limit was reached.
+    Overrepresented sequences come from a Space-Saving summary.
+    """
+
+    def __init__(self, max_distinct: int = DEFAULT_MAX_DISTINCT, heavy_hitters: int = DEFAULT_HEAVY_HITTERS):
+        self.max_distinct = max_distinct
+        self.tracked = {}
+        self.count_at_limit = 0
+        self.total = 0
+        self.heavy = SpaceSaving(heavy_hitters)
+
+    def add(self, sequences: List[bytes], batch: FastqBatch) -> None:
+        tracked = self.tracked
+        for key in hash_sequences(batch.seqs, batch.lengths).tolist():
+            self.total += 1
+            if len(tracked) < self.max_distinct:
+                tracked[key] = tracked.get(key, 0) + 1
+                self.count_at_limit = self.total
+            elif key in tracked:
+                tracked[key] += 1
+        for seq, count in Counter(sequences).items():
+            self.heavy.add(seq, count)
+
+    def merge(self, other: "BoundedSequenceCounter") -> None:
+        # Shards are merged in file order, so the other shard's sequences come after ours
+        frozen = len(self.tracked) >= self.max_distinct
+        for key, count in other.tracked.items():
+            if key in self.tracked:
+                self.tracked[key] += count
+            elif len(self.tracked) < self.max_distinct:
+                self.tracked[key] = count
+        if not frozen:
+            self.count_at_limit = self.total + other.count_at_limit
+        self.total += other.total
+        self.heavy.merge(other.heavy)
+
+    @staticmethod
+    def _corrected_count(count_at_limit: int, total: int, level: int, observed: int) -> float:
+        """FastQC's extrapolation of how many sequences have ``level`` duplicates in the whole file."""
+        if count_at_limit == total or total - observed < count_at_limit:
+            return float(observed)
+        p_not_seeing = 1.0
+        limit_of_caring = 1.0 - observed / (observed + 0.01)
+        for i in range(count_at_limit):
+            p_not_seeing *= ((total - i) - level) / (total - i)
+            if p_not_seeing < limit_of_caring:
+                p_not_seeing = 0.0
+                break
+        return observed / (1.0 - p_not_seeing)
+
+    def duplication_levels(self, total: int) -> Dict[int, float]:
+        observed = defaultdict(int)
+        for count in self.tracked.values():
+            observed[count] += 1
+        return {
+            level: self._corrected_count(self.count_at_limit, self.total, level, n)
+            for level, n in sorted(observed.items())
+        }
+
+    def top_sequences(self, min_count: float) -> List[Tuple[bytes, int]]:
+        frequent = [(seq, count) for seq, count in self.heavy.counts.items() if count > min_count]
+        frequent.sort(key=lambda x: x[1], reverse=True)
+        return frequent
+
+    def notes(self, total: int) -> List[str]:
+        sampled = self.count_at_limit / total * 100 if total else 100.0
+        bound = total / self.heavy.capacity
+        return [
+            f"Duplication levels estimated from the first {len(self.tracked)} distinct sequences "
+            f"({sampled:.1f}% of reads), extrapolated as in FastQC",
+            f"Overrepresented counts are Space-Saving estimates (capacity {self.heavy.capacity}): "
+            f"each may overcount by at most {self.heavy.max_error()} reads; "
+            f"every sequence above {bound:.0f} reads is guaranteed to be listed",
+        ]
@@ -0,0 +1,269 @@
+"""Persistent side-car index of FASTQ record offsets for random access, sharding and sampling.
+
+    python fastq_index.py [--interval K] FASTQ [...]
+
+builds ``<file>.fqi`` next to each FASTQ (plain, gzip or BGZF) in one
+byte-level scan. Later runs load it with memory mapping to get the record
+count instantly, jump to any read and split the file into shards of equal
+read counts without rescanning it.
+"""
+import argparse
+import io
+import struct
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from checkpoint import atomic_path
+from fastq_reader import (CARRIAGE_RETURN, DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_SIZE, NEWLINE, BgzfReader, FastqBatch,
+                          FastqReader, _skip, bgzf_block_table, is_bgzf, is_gzip, open_fastq)
+
+INDEX_SUFFIX = ".fqi"
+INDEX_MAGIC = b"FQINDEX\0"
+INDEX_VERSION = 1
+# Records between two stored offsets; 10M reads need 1,000 entries (8 KB)
+DEFAULT_INDEX_INTERVAL = 10_000
+
+PLAIN, GZIP, BGZF = 0, 1, 2
+FORMAT_NAMES = {PLAIN: "plain", GZIP: "gzip", BGZF: "bgzf"}
+
+# magic, version, format, interval, file size, mtime (ns), records, total bases, max length, offsets, blocks
+_HEADER = struct.Struct("<8sIIqqqqqqqq")
+
+
+def index_path(fastq_file: Union[str, Path]) -> Path:
+    fastq_file = Path(fastq_file)
+    return fastq_file.with_name(fastq_file.name + INDEX_SUFFIX)
+
+
+def _file_format(fastq_file: Path) -> int:
+    if not is_gzip(fastq_file):
+        return PLAIN
+    return BGZF if is_bgzf(fastq_file) else GZIP
+
+
+def _scan(handle, interval: int) -> Tuple[np.ndarray, int, int, int]:
+    """One pass over a decompressed FASTQ stream: (offsets of every ``interval``-th record, records, bases, max length).
+
+    Only newline positions are located (with NumPy, per chunk); records are
+    assumed to be four lines, as ``FastqReader`` does.
+    """
+    offsets: List[np.ndarray] = []
+    line = total_bases = max_length = 0
+    position = line_start = 0
+    last_byte = NEWLINE
+    for chunk in iter(lambda: handle.read(DEFAULT_CHUNK_SIZE), b""):
+        buf = np.frombuffer(chunk, dtype=np.uint8)
+        newlines = np.flatnonzero(buf == NEWLINE)
+        if len(newlines):
+            numbers = line + np.arange(len(newlines))
+            starts = np.concatenate([[line_start], newlines[:-1] + 1 + position])
+            before = np.where(newlines > 0, buf[np.maximum(newlines - 1, 0)], last_byte)
+            ends = newlines + position - (before == CARRIAGE_RETURN)
+
+            sequence = numbers % 4 == 1
+            lengths = ends[sequence] - starts[sequence]
+            total_bases += int(lengths.sum())
+            max_length = max(max_length, int(lengths.max(initial=0)))
+
+            indexed = (numbers % 4 == 0) & ((numbers // 4) % interval == 0)
+            offsets.append(starts[indexed])
+
+            line += len(newlines)
+            line_start = position + int(newlines[-1]) + 1
+        last_byte = int(buf[-1])
+        position += len(chunk)
+
+    if position > line_start:
+        # Final line without a trailing newline
+        if line % 4 == 0 and (line // 4) % interval == 0:
+            offsets.append(np.array([line_start]))
+        elif line % 4 == 1:
+            length = position - line_start - (last_byte == CARRIAGE_RETURN)
+            total_bases += length
+            max_length = max(max_length, length)
+        line += 1
+    records = line // 4
+    offsets_array = np.concatenate(offsets).astype(np.int64) if offsets else np.zeros(0, dtype=np.int64)
+    return offsets_array[:-(-records // interval) if records else 0], records, total_bases, max_length
+
+
+class FastqIndex:
+    """Record count, base totals and sparse record offsets of one FASTQ file.
+
+    ``offsets[i]`` is the position of record ``i * interval`` in the
+    decompressed stream. BGZF files also keep their block table
+    (``blocks``: compressed and decompressed offset of each block), so any
+    decompressed position can be reached by inflating at most one block
+    before it. Plain gzip files get counts and offsets too, but reaching an
+    offset still means decompressing everything before it (``seekable`` is
+    False). The index is stored as ``<file>.fqi``: a fixed header followed by
+    the raw int64 arrays, which ``load`` memory-maps.
+    """
+
+    def __init__(self, fastq_file: Union[str, Path], file_format: int, interval: int, file_size: int,
+                 mtime_ns: int, records: int, total_bases: int, max_length: int,
+                 offsets: np.ndarray, blocks: np.ndarray):
+        self.fastq_file = Path(fastq_file)
+        self.format = file_format
+        self.interval = interval
+        self.file_size = file_size
+        self.mtime_ns = mtime_ns
+        self.records = records
+        self.total_bases = total_bases
+        self.max_length = max_length
+        self.offsets = offsets
+        self.blocks = blocks
+
+    @property
+    def seekable(self) -> bool:
+        return self.format != GZIP
+
+    @classmethod
+    def build(cls, fastq_file: Union[str, Path], interval: int = DEFAULT_INDEX_INTERVAL,
+              save: bool = True) -> "FastqIndex":
+        """Scan ``fastq_file`` once and (by default) write the side-car index next to it."""
+        fastq_file = Path(fastq_file)
+        stat = fastq_file.stat()
+        file_format = _file_format(fastq_file)
+        blocks = bgzf_block_table(fastq_file) if file_format == BGZF else np.zeros((0, 2), dtype=np.int64)
+        with open_fastq(fastq_file) as handle:
+            offsets, records, total_bases, max_length = _scan(handle, interval)
+        index = cls(fastq_file, file_format, interval, stat.st_size, stat.st_mtime_ns, records, total_bases,
+                    max_length, offsets, blocks)
+        if save:
+            index.save()
+        return index
+
+    def save(self, path: Optional[Path] = None) -> Path:
+        path = path or index_path(self.fastq_file)
+        header = _HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.format, self.interval, self.file_size,
+                              self.mtime_ns, self.records, self.total_bases, self.max_length,
+                              len(self.offsets), len(self.blocks))
+        with atomic_path(path) as temporary, open(temporary, "wb") as handle:
+            handle.write(header)
+            handle.write(np.ascontiguousarray(self.offsets, dtype="<i8").tobytes())
+            handle.write(np.ascontiguousarray(self.blocks, dtype="<i8").tobytes())
+        return path
+
+    @classmethod
+    def load(cls, fastq_file: Union[str, Path], path: Optional[Path] = None) -> Optional["FastqIndex"]:
+        """The saved index of ``fastq_file``, or ``None`` if there is none or the file changed since."""
+        fastq_file = Path(fastq_file)
+        path = path or index_path(fastq_file)
+        try:
+            with open(path, "rb") as handle:
+                fields = _HEADER.unpack(handle.read(_HEADER.size))
+            stat = fastq_file.stat()
+        except (OSError, struct.error):
+            return None
+        (magic, version, file_format, interval, file_size, mtime_ns, records, total_bases, max_length,
+         n_offsets, n_blocks) = fields
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            return None
+        if (file_size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        data = np.memmap(path, dtype="<i8", mode="r", offset=_HEADER.size, shape=(n_offsets + 2 * n_blocks,)) \
+            if n_offsets + n_blocks else np.zeros(0, dtype=np.int64)
+        return cls(fastq_file, file_format, interval, file_size, mtime_ns, records, total_bases, max_length,
+                   data[:n_offsets], data[n_offsets:].reshape(n_blocks, 2))
+
+    @property
+    def decompressed_size(self) -> int:
+        """Size of the decompressed stream (known exactly for plain and BGZF files)."""
+        if self.format == PLAIN:
+            return self.file_size
+        if self.format == BGZF and len(self.blocks):
+            # The last block is the empty BGZF end-of-file marker or the final data block
+            with open(self.fastq_file, "rb") as handle:
+                handle.seek(self.file_size - 4)
+                return int(self.blocks[-1, 1]) + struct.unpack("<I", handle.read(4))[0]
+        return -1
+
+    def record_offset(self, record: int) -> Tuple[int, int]:
+        """(offset of the nearest indexed record at or before ``record``, records to skip from there)."""
+        if not 0 <= record <= self.records:
+            raise IndexError(f"record {record} out of range (0-{self.records})")
+        if record == self.records:
+            return self.decompressed_size, 0
+        slot = record // self.interval
+        return int(self.offsets[slot]), record - slot * self.interval
+
+    def shard_ranges(self, n_shards: int) -> List[Tuple[int, int]]:
+        """Split into up to ``n_shards`` record-aligned ranges holding (nearly) equal numbers of reads.
+
+        Cuts fall on indexed records, so shard sizes differ by at most
+        ``interval`` reads. Ranges are offsets in the decompressed stream;
+        the last one ends at ``None`` (end of file).
+        """
+        slots = len(self.offsets)
+        cuts = sorted({min(slots - 1, round(i * slots / n_shards)) for i in range(n_shards)}) if slots else [0]
+        starts = [int(self.offsets[slot]) if slots else 0 for slot in cuts]
+        return [(start, end) for start, end in zip(starts, starts[1:] + [None])]
+
+    def open_range(self, start: int = 0, end: Optional[int] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> FastqReader:
+        """``FastqReader`` over the decompressed byte range ``[start, end)`` (record-aligned).
+
+        For BGZF files decompression starts at the block holding ``start``
+        instead of at the beginning of the file.
+        """
+        if self.format != BGZF or not start:
+            return FastqReader(self.fastq_file, batch_size=batch_size, chunk_size=chunk_size, start=start, end=end)
+        block = int(np.searchsorted(self.blocks[:, 1], start, side="right")) - 1
+        handle = io.BufferedReader(BgzfReader(self.fastq_file, start=int(self.blocks[block, 0])),
+                                   buffer_size=DEFAULT_CHUNK_SIZE)
+        _skip(handle, start - int(self.blocks[block, 1]))
+        return FastqReader.positioned(handle, start, end, batch_size=batch_size, chunk_size=chunk_size)
+
+    def batches(self, first: int = 0, stop: Optional[int] = None,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[FastqBatch]:
+        """Batches holding records ``first`` up to (not including) ``stop``."""
+        stop = self.records if stop is None else min(stop, self.records)
+        offset, skip = self.record_offset(first)
+        remaining = stop - first
+        with self.open_range(offset, batch_size=batch_size) as reader:
+            for batch in reader:
+                if skip:
+                    dropped = min(skip, len(batch))
+                    batch = batch.subset(np.arange(dropped, len(batch)))
+                    skip -= dropped
+                if remaining <= 0:
+                    break
+                if len(batch) > remaining:
+                    batch = batch.subset(np.arange(remaining))
+                if len(batch):
+                    remaining -= len(batch)
+                    yield batch
+
+
+def load_or_build_index(fastq_file: Union[str, Path], interval: int = DEFAULT_INDEX_INTERVAL) -> FastqIndex:
+    return FastqIndex.load(fastq_file) or FastqIndex.build(fastq_file, interval)
+
+
+def open_range(fastq_file: Union[str, Path], start: int = 0, end: Optional[int] = None,
+               index: Optional[FastqIndex] = None) -> FastqReader:
+    """Reader over a record-aligned byte range, starting at the right BGZF block when ``index`` is given."""
+    if index is not None:
+        return index.open_range(start, end)
+    return FastqReader(fastq_file, start=start, end=end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build side-car record offset indexes for FASTQ files.")
+    parser.add_argument("fastq_files", nargs="+", type=Path, help="plain, gzip or BGZF FASTQ files")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INDEX_INTERVAL,
+                        help="records between stored offsets")
+    args = parser.parse_args()
+    for fastq_file in args.fastq_files:
+        try:
+            index = FastqIndex.build(fastq_file, args.interval)
+            print(f"{fastq_file.name}: {index.records} reads, {index.total_bases} bases, "
+                  f"max length {index.max_length} ({FORMAT_NAMES[index.format]}) -> {index_path(fastq_file).name}")
+        except Exception as e:
+            print(f"Error indexing {fastq_file.name}: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
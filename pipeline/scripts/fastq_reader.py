@@ -0,0 +1,576 @@
+import gzip
+import io
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+# Number of reads per batch handed to the QC accumulator and the trimmer
+DEFAULT_BATCH_SIZE = 8192
+# Bases in a batch's padded (reads x longest read) matrices; long reads get fewer reads per batch
+DEFAULT_BATCH_BASES = 4 * 1024 * 1024
+# Bytes requested from the underlying file per read() call
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Buffer used for uncompressed FASTQ outputs so each batch becomes a single write() call
+OUTPUT_BUFFER_SIZE = 4 * 1024 * 1024
+# Default gzip level for compressed outputs (matches gzip's own default)
+DEFAULT_COMPRESSLEVEL = 6
+# Threads used to inflate BGZF blocks in parallel
+DEFAULT_DECOMPRESS_THREADS = min(4, os.cpu_count() or 1)
+# BGZF blocks handed to each decompression task
+BGZF_BLOCKS_PER_TASK = 64
+
+GZIP_MAGIC = b"\x1f\x8b"
+BGZF_MAX_BLOCK_SIZE = 1 << 16
+PHRED_OFFSET = 33
+NEWLINE = ord("\n")
+CARRIAGE_RETURN = ord("\r")
+
+
+def _ragged_index(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Flat indices covering ``starts[i]:starts[i] + lengths[i]`` for every i, in order."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(np.asarray(starts, dtype=np.int64) - offsets, lengths) + np.arange(total, dtype=np.int64)
+
+
+def fastq_stem(fastq_file: Union[str, Path]) -> str:
+    """File name without ``.gz`` and the FASTQ extension (``x.fastq.gz`` -> ``x``)."""
+    name = Path(fastq_file).name
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return Path(name).stem
+
+
+def is_gzip(fastq_file: Union[str, Path]) -> bool:
+    with open(fastq_file, "rb") as handle:
+        return handle.read(2) == GZIP_MAGIC
+
+
+def _is_bgzf_header(header: bytes) -> bool:
+    """A gzip member with an extra field whose first subfield is ``BC`` (the BGZF block size)."""
+    return len(header) >= 16 and header[:2] == GZIP_MAGIC and header[3] & 4 and header[12:14] == b"BC"
+
+
+def is_bgzf(fastq_file: Union[str, Path]) -> bool:
+    with open(fastq_file, "rb") as handle:
+        return bool(_is_bgzf_header(handle.read(18)))
+
+
+class BgzfReader(io.RawIOBase):
+    """Sequential reader for BGZF files that inflates independent blocks on a thread pool.
+
+    BGZF (the blocked gzip used by bgzip/samtools) stores data as a series of
+    small gzip members, each of which can be decompressed on its own. Groups of
+    blocks are inflated ahead of the consumer; zlib releases the GIL, so
+    decompression proceeds in parallel with parsing. ``start`` is the
+    compressed offset of the block to begin at (see ``next_bgzf_block``).
+    """
+
+    def __init__(self, path: Union[str, Path], threads: int = DEFAULT_DECOMPRESS_THREADS,
+                 blocks_per_task: int = BGZF_BLOCKS_PER_TASK, start: int = 0):
+        super().__init__()
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._threads = max(1, threads)
+        self._pool = ThreadPoolExecutor(max_workers=self._threads)
+        self._blocks_per_task = blocks_per_task
+        self._pending = deque()
+        self._buffer = b""
+        self._position = 0
+        self._exhausted = False
+
+    def readable(self) -> bool:
+        return True
+
+    def compressed_tell(self) -> int:
+        return self._file.tell()
+
+    def _read_block(self) -> Optional[Tuple[bytes, int]]:
+        """Return the compressed payload and uncompressed size of the next block, or None at EOF."""
+        header = self._file.read(12)
+        if not header:
+            return None
+        if len(header) < 12 or header[:2] != GZIP_MAGIC or not header[3] & 4:
+            raise ValueError("Invalid BGZF block header")
+        extra_length = struct.unpack("<H", header[10:12])[0]
+        extra = self._file.read(extra_length)
+        block_size = None
+        offset = 0
+        while offset + 4 <= len(extra):
+            subfield_length = struct.unpack("<H", extra[offset + 2:offset + 4])[0]
+            if extra[offset:offset + 2] == b"BC":
+                block_size = struct.unpack("<H", extra[offset + 4:offset + 6])[0] + 1
+            offset += 4 + subfield_length
+        if block_size is None:
+            raise ValueError("gzip member without a BGZF block size field")
+        rest = self._file.read(block_size - 12 - extra_length)
+        return rest[:-8], struct.unpack("<I", rest[-4:])[0]
+
+    @staticmethod
+    def _inflate(blocks: List[Tuple[bytes, int]]) -> bytes:
+        parts = []
+        for payload, size in blocks:
+            data = zlib.decompress(payload, -15)
+            if len(data) != size:
+                raise ValueError("BGZF block size mismatch")
+            parts.append(data)
+        return b"".join(parts)
+
+    def _schedule(self) -> None:
+        while not self._exhausted and len(self._pending) < 2 * self._threads:
+            blocks = []
+            while len(blocks) < self._blocks_per_task:
+                block = self._read_block()
+                if block is None:
+                    self._exhausted = True
+                    break
+                blocks.append(block)
+            if blocks:
+                self._pending.append(self._pool.submit(self._inflate, blocks))
+
+    def readinto(self, buffer) -> int:
+        while self._position >= len(self._buffer):
+            self._schedule()
+            if not self._pending:
+                return 0
+            self._buffer = self._pending.popleft().result()
+            self._position = 0
+        n = min(len(buffer), len(self._buffer) - self._position)
+        buffer[:n] = self._buffer[self._position:self._position + n]
+        self._position += n
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._file.close()
+        super().close()
+
+
+def next_bgzf_block(handle: BinaryIO, offset: int) -> Optional[int]:
+    """Compressed offset of the first BGZF block starting at or after ``offset`` (``None`` if there is none).
+
+    The gzip magic bytes can occur inside compressed data, so a candidate is
+    only accepted when its block size leads to another block header or to
+    the end of the file.
+    """
+    file_size = handle.seek(0, io.SEEK_END)
+    handle.seek(offset)
+    # Blocks are at most 64 KiB, so the next header lies within this window
+    window = handle.read(2 * BGZF_MAX_BLOCK_SIZE)
+    position = window.find(GZIP_MAGIC)
+    while position != -1:
+        header = window[position:position + 18]
+        if len(header) < 18:
+            handle.seek(offset + position)
+            header = handle.read(18)
+        if _is_bgzf_header(header):
+            following = offset + position + struct.unpack("<H", header[16:18])[0] + 1
+            if following == file_size:
+                return offset + position
+            if following < file_size:
+                handle.seek(following)
+                if _is_bgzf_header(handle.read(18)):
+                    return offset + position
+        position = window.find(GZIP_MAGIC, position + 1)
+    return None
+
+
+def bgzf_block_table(path: Union[str, Path]) -> np.ndarray:
+    """``(compressed offset, decompressed offset)`` of every block of a BGZF file, like bgzip's ``.gzi``.
+
+    Only block headers and size trailers are read; nothing is decompressed.
+    """
+    entries = []
+    compressed = decompressed = 0
+    with open(path, "rb") as handle:
+        file_size = handle.seek(0, io.SEEK_END)
+        while compressed < file_size:
+            handle.seek(compressed)
+            header = handle.read(18)
+            if not _is_bgzf_header(header):
+                raise ValueError(f"Invalid BGZF block header at offset {compressed}")
+            block_size = struct.unpack("<H", header[16:18])[0] + 1
+            handle.seek(compressed + block_size - 4)
+            entries.append((compressed, decompressed))
+            decompressed += struct.unpack("<I", handle.read(4))[0]
+            compressed += block_size
+    return np.array(entries, dtype=np.int64).reshape(-1, 2)
+
+
+def bgzf_compression_ratio(path: Union[str, Path], blocks: int = 16) -> float:
+    """Decompressed bytes per compressed byte over the first ``blocks`` blocks of a BGZF file."""
+    reader = BgzfReader(path, threads=1)
+    try:
+        decompressed = 0
+        for _ in range(blocks):
+            block = reader._read_block()
+            if block is None:
+                break
+            decompressed += block[1]
+        return decompressed / max(reader.compressed_tell(), 1)
+    finally:
+        reader.close()
+
+
+def open_fastq(fastq_file: Union[str, Path], threads: int = DEFAULT_DECOMPRESS_THREADS) -> BinaryIO:
+    """Open a FASTQ file for binary reading, streaming through gzip or BGZF decompression as needed."""
+    with open(fastq_file, "rb") as probe:
+        header = probe.read(18)
+    if header[:2] != GZIP_MAGIC:
+        return open(fastq_file, "rb")
+    if _is_bgzf_header(header):
+        return io.BufferedReader(BgzfReader(fastq_file, threads), buffer_size=DEFAULT_CHUNK_SIZE)
+    return gzip.open(fastq_file, "rb")
+
+
+def open_fastq_output(fastq_file: Union[str, Path], compresslevel: Optional[int] = None,
+                      append: bool = False) -> BinaryIO:
+    """Open a FASTQ output for binary writing.
+
+    Paths ending in ``.gz`` are gzip-compressed at ``compresslevel``
+    (``DEFAULT_COMPRESSLEVEL`` when not given). With ``append`` new data is
+    added after the existing content; for gzip output it forms a new member,
+    which gzip readers decompress as one continuous stream.
+    """
+    mode = "ab" if append else "wb"
+    if str(fastq_file).endswith(".gz"):
+        level = DEFAULT_COMPRESSLEVEL if compresslevel is None else compresslevel
+        return gzip.open(fastq_file, mode, compresslevel=level)
+    return open(fastq_file, mode, buffering=OUTPUT_BUFFER_SIZE)
+
+
+def _compressed_position(handle: BinaryIO) -> int:
+    """Position in the underlying (possibly compressed) file, for progress reporting."""
+    if isinstance(handle, gzip.GzipFile):
+        return handle.fileobj.tell()
+    if isinstance(handle, io.BufferedReader) and isinstance(handle.raw, BgzfReader):
+        return handle.raw.compressed_tell()
+    return handle.tell()
+
+
+class FastqBatch:
+    """A batch of FASTQ records stored as dense NumPy matrices.
+
+    ``seqs`` holds the raw sequence bytes and ``quals`` the Phred scores
+    (quality byte minus 33), both as ``(n, width)`` uint8 matrices padded
+    with zeros past each read's length. Headers (without the leading ``@``)
+    are concatenated in ``header_data`` and delimited by ``header_offsets``.
+    """
+
+    __slots__ = ("seqs", "quals", "lengths", "header_data", "header_offsets")
+
+    def __init__(self, seqs: np.ndarray, quals: np.ndarray, lengths: np.ndarray,
+                 header_data: bytes, header_offsets: np.ndarray):
+        self.seqs = seqs
+        self.quals = quals
+        self.lengths = lengths
+        self.header_data = header_data
+        self.header_offsets = header_offsets
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    @property
+    def width(self) -> int:
+        return self.seqs.shape[1]
+
+    def mask(self) -> np.ndarray:
+        """Boolean ``(n, width)`` matrix marking the valid base positions of each read."""
+        return np.arange(self.width) < self.lengths[:, None]
+
+    def header(self, i: int) -> bytes:
+        return self.header_data[self.header_offsets[i]:self.header_offsets[i + 1]]
+
+    def headers(self) -> List[bytes]:
+        data, offsets = self.header_data, self.header_offsets.tolist()
+        return [data[offsets[i]:offsets[i + 1]] for i in range(len(self))]
+
+    def sequences(self) -> List[bytes]:
+        """Return each read's sequence as a ``bytes`` object."""
+        flat, width = self.seqs.tobytes(), self.width
+        return [flat[i * width:i * width + length] for i, length in enumerate(self.lengths.tolist())]
+
+    def subset(self, selection: np.ndarray) -> "FastqBatch":
+        """Return a new batch with only the selected reads (boolean mask or index array)."""
+        index = np.flatnonzero(selection) if selection.dtype == bool else np.asarray(selection, dtype=np.int64)
+        starts = self.header_offsets[index]
+        header_lengths = self.header_offsets[index + 1] - starts
+        header_bytes = np.frombuffer(self.header_data, dtype=np.uint8)[_ragged_index(starts, header_lengths)]
+        lengths = self.lengths[index]
+        width = int(lengths.max()) if len(lengths) else 0
+        return FastqBatch(
+            self.seqs[index, :width], self.quals[index, :width], lengths, header_bytes.tobytes(),
+            np.concatenate([[0], np.cumsum(header_lengths)]).astype(np.int64),
+        )
+
+    def truncate(self, lengths: np.ndarray) -> "FastqBatch":
+        """Return a copy with every read cut to at most ``lengths`` bases from the 3' end."""
+        lengths = np.minimum(self.lengths, lengths)
+        width = int(lengths.max()) if len(lengths) else 0
+        mask = np.arange(width) < lengths[:, None]
+        return FastqBatch(self.seqs[:, :width] * mask, self.quals[:, :width] * mask, lengths,
+                          self.header_data, self.header_offsets)
+
+    def to_fastq(self) -> bytes:
+        """Serialize the batch back to four-line FASTQ text."""
+        header_lengths = np.diff(self.header_offsets)
+        lengths = self.lengths.astype(np.int64)
+        record_lengths = header_lengths + 2 * lengths + 6
+        starts = np.cumsum(record_lengths) - record_lengths
+        out = np.empty(int(record_lengths.sum()), dtype=np.uint8)
+        mask = self.mask()
+
+        out[starts] = ord("@")
+        out[_ragged_index(starts + 1, header_lengths)] = np.frombuffer(self.header_data, dtype=np.uint8)
+        seq_line = starts + 1 + header_lengths + 1
+        out[seq_line - 1] = NEWLINE
+        out[_ragged_index(seq_line, lengths)] = self.seqs[mask]
+        plus_line = seq_line + lengths
+        out[plus_line] = NEWLINE
+        out[plus_line + 1] = ord("+")
+        out[plus_line + 2] = NEWLINE
+        qual_line = plus_line + 3
+        out[_ragged_index(qual_line, lengths)] = self.quals[mask] + PHRED_OFFSET
+        out[qual_line + lengths] = NEWLINE
+        return out.tobytes()
+
+
+def _parse_records(buf: np.ndarray, line_starts: np.ndarray, line_ends: np.ndarray) -> FastqBatch:
+    """Build a FastqBatch from the start/end offsets of complete four-line records."""
+    header_starts, seq_starts, plus_starts, qual_starts = (line_starts[i::4] for i in range(4))
+    header_ends, seq_ends, _, qual_ends = (line_ends[i::4] for i in range(4))
+
+    if not (np.all(buf[header_starts] == ord("@")) and np.all(buf[plus_starts] == ord("+"))):
+        raise ValueError("Malformed FASTQ record: expected '@' header and '+' separator lines")
+    lengths = seq_ends - seq_starts
+    if not np.array_equal(lengths, qual_ends - qual_starts):
+        raise ValueError("Malformed FASTQ record: sequence and quality lengths differ")
+
+    width = int(lengths.max()) if len(lengths) else 0
+    columns = np.arange(width)
+    mask = columns < lengths[:, None]
+    seqs = np.zeros((len(lengths), width), dtype=np.uint8)
+    quals = np.zeros((len(lengths), width), dtype=np.uint8)
+    seqs[mask] = buf[(seq_starts[:, None] + columns)[mask]]
+    quals[mask] = buf[(qual_starts[:, None] + columns)[mask]] - PHRED_OFFSET
+
+    header_lengths = header_ends - header_starts - 1
+    header_data = buf[_ragged_index(header_starts + 1, header_lengths)].tobytes()
+    header_offsets = np.concatenate([[0], np.cumsum(header_lengths)]).astype(np.int64)
+    return FastqBatch(seqs, quals, lengths.astype(np.int64), header_data, header_offsets)
+
+
+def _batch_bounds(lengths: np.ndarray, batch_size: int,
+                  max_bases: Optional[int]) -> List[Tuple[int, int, bool]]:
+    """``(first, last, full)`` record ranges splitting records with sequences of ``lengths`` into batches.
+
+    A batch holds ``batch_size`` records, or fewer when its padded matrix
+    (records x longest sequence) would exceed ``max_bases`` (at least one
+    record, however long). ``full`` is False for a final batch that more
+    records could still be added to.
+    """
+    bounds = []
+    first = 0
+    while first < len(lengths):
+        last = min(first + batch_size, len(lengths))
+        full = last - first == batch_size
+        if max_bases is not None:
+            padded = np.arange(1, last - first + 1) * np.maximum.accumulate(lengths[first:last])
+            fits = max(1, int(np.searchsorted(padded, max_bases, side="right")))
+            full = full or fits < last - first
+            last = first + fits
+        bounds.append((first, last, full))
+        first = last
+    return bounds
+
+
+def _skip(handle: BinaryIO, count: int) -> None:
+    """Read and discard ``count`` bytes from a stream that cannot seek."""
+    while count > 0:
+        skipped = len(handle.read(min(count, DEFAULT_CHUNK_SIZE)))
+        if not skipped:
+            break
+        count -= skipped
+
+
+class FastqReader:
+    """Raw four-line FASTQ reader that yields ``FastqBatch`` objects of ``batch_size`` reads.
+
+    Records are located by scanning for newline bytes with NumPy rather than
+    building one ``SeqRecord`` per read. ``bytes_read`` tracks how far into the
+    file the reader has consumed (after decompression) and ``progress`` the
+    fraction of the input file processed. Paths to ``.gz`` and BGZF files are
+    decompressed on the fly. ``start``/``end`` restrict reading to a byte range
+    that must be aligned to record boundaries (see ``shard_ranges``); for
+    compressed input they are offsets into the decompressed stream, and
+    reaching ``start`` means decompressing everything before it. ``offset``
+    is the decompressed position just past the last record yielded, which is
+    a valid ``start`` for resuming. Batches of long reads hold fewer than
+    ``batch_size`` reads so that their matrices stay within
+    ``max_batch_bases`` (``None`` cuts batches by read count only, as paired
+    files read in lockstep need).
+    """
+
+    def __init__(self, source: Union[str, Path, BinaryIO], batch_size: int = DEFAULT_BATCH_SIZE,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, start: int = 0, end: Optional[int] = None,
+                 max_batch_bases: Optional[int] = DEFAULT_BATCH_BASES):
+        if isinstance(source, (str, Path)):
+            self.handle = open_fastq(source)
+            self._owns_handle = True
+            self._file_size = Path(source).stat().st_size
+        else:
+            self.handle = source
+            self._owns_handle = False
+            self._file_size = None
+        if start:
+            if self.handle.seekable():
+                self.handle.seek(start)
+            else:
+                _skip(self.handle, start)
+        self.batch_size = batch_size
+        self.max_batch_bases = max_batch_bases
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self.offset = start
+        self._remaining = None if end is None else end - start
+
+    @classmethod
+    def positioned(cls, handle: BinaryIO, offset: int, end: Optional[int] = None, owns_handle: bool = True,
+                   **options) -> "FastqReader":
+        """Reader over ``handle``, which the caller has already moved to decompressed offset ``offset``.
+
+        ``end`` and the reader's ``offset`` are in the same coordinates as
+        ``offset``. Closing the reader closes ``handle`` unless
+        ``owns_handle`` is False. ``options`` are passed to the constructor.
+        """
+        reader = cls(handle, end=None if end is None else end - offset, **options)
+        reader._owns_handle = owns_handle
+        reader.offset = offset
+        return reader
+
+    @property
+    def progress(self) -> float:
+        """Fraction of the input consumed so far (0-1)."""
+        if not self._file_size:
+            return 0.0
+        return min(_compressed_position(self.handle) / self._file_size, 1.0)
+
+    def _read_chunk(self) -> bytes:
+        if self._remaining is None:
+            return self.handle.read(self.chunk_size)
+        chunk = self.handle.read(min(self.chunk_size, self._remaining))
+        self._remaining -= len(chunk)
+        return chunk
+
+    def __enter__(self) -> "FastqReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._owns_handle:
+            self.handle.close()
+
+    def __iter__(self) -> Iterator[FastqBatch]:
+        pending = b""
+        pending_start = self.offset
+        eof = False
+        while not eof:
+            chunk = self._read_chunk()
+            if chunk:
+                self.bytes_read += len(chunk)
+                pending += chunk
+            else:
+                eof = True
+                if not pending.strip():
+                    break
+                if not pending.endswith(b"\n"):
+                    pending += b"\n"
+
+            buf = np.frombuffer(pending, dtype=np.uint8)
+            newlines = np.flatnonzero(buf == NEWLINE)
+            n_records = len(newlines) // 4
+            # Sequence line lengths (plus one for CRLF line ends) size the batches
+            seq_lengths = newlines[1:n_records * 4:4] - newlines[:n_records * 4:4] - 1
+            batches = _batch_bounds(seq_lengths, self.batch_size, self.max_batch_bases)
+            if batches and not batches[-1][2] and not eof:
+                batches.pop()
+            if not batches and not eof:
+                continue
+
+            n_records = batches[-1][1] if batches else 0
+            line_ends = newlines[:n_records * 4]
+            line_starts = np.concatenate([[0], line_ends[:-1] + 1]) if len(line_ends) else line_ends
+            line_ends = line_ends - (buf[np.maximum(line_ends - 1, 0)] == CARRIAGE_RETURN)
+
+            for first, last, _ in batches:
+                lines = slice(first * 4, last * 4)
+                batch = _parse_records(buf, line_starts[lines], line_ends[lines])
+                self.offset = pending_start + int(newlines[last * 4 - 1]) + 1
+                yield batch
+
+            consumed = int(newlines[n_records * 4 - 1]) + 1 if n_records else 0
+            if eof and consumed < len(pending) and pending[consumed:].strip():
+                raise ValueError("Truncated FASTQ record at end of file")
+            pending = pending[consumed:]
+            pending_start += consumed
+
+
+def read_batches(source: Union[str, Path, BinaryIO], batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[FastqBatch]:
+    """Iterate over ``FastqBatch`` objects from a FASTQ path or binary handle."""
+    with FastqReader(source, batch_size=batch_size) as reader:
+        yield from reader
+
+
+def next_record_start(handle: BinaryIO, offset: int, file_size: int) -> int:
+    """Return the offset of the first FASTQ record starting at or after ``offset``.
+
+    A quality line may itself begin with ``@``, so a candidate header is only
+    accepted when its third line starts with ``+`` and the sequence and
+    quality lines have equal length.
+    """
+    if offset <= 0:
+        return 0
+    window_size = 1 << 16
+    while True:
+        handle.seek(offset - 1)
+        window = handle.read(window_size)
+        # Line starts inside the window; index 0 is the byte just before ``offset``
+        line_starts = (np.flatnonzero(np.frombuffer(window, dtype=np.uint8) == NEWLINE) + 1).tolist()
+        for n, start in enumerate(line_starts):
+            if n + 4 >= len(line_starts) and len(window) == window_size:
+                break
+            lines = window[start:].split(b"\n", 4)
+            if len(lines) < 4:
+                break
+            header, seq, plus, qual = (line.rstrip(b"\r") for line in lines[:4])
+            if header.startswith(b"@") and plus.startswith(b"+") and len(seq) == len(qual):
+                return offset - 1 + start
+        if len(window) < window_size:
+            return file_size
+        window_size *= 4
+
+
+def shard_ranges(fastq_file: Union[str, Path], n_shards: int) -> List[Tuple[int, int]]:
+    """Split a FASTQ file into up to ``n_shards`` byte ranges aligned to record boundaries."""
+    file_size = Path(fastq_file).stat().st_size
+    with open(fastq_file, "rb") as handle:
+        cuts = [0]
+        for i in range(1, n_shards):
+            cut = next_record_start(handle, file_size * i // n_shards, file_size)
+            if cut > cuts[-1]:
+                cuts.append(cut)
+    cuts.append(file_size)
+    return [(a, b) for a, b in zip(cuts, cuts[1:]) if b > a]
@@ -1,379 +1,649 @@
-from Bio import SeqIO
-from Bio.Seq import Seq
-from collections import defaultdict
-import matplotlib.pyplot as plt
+import copy
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Optional
-
-# Common adapter sequences (expand as needed)
-ADAPTERS = [
-    "AGATCGGAAGAGCACACGTCTGAACTCCAGTCA",  # TruSeq Universal Adapter
-    "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGT",  # TruSeq Adapter Index 1
-]
-
-# Dictionary of known overrepresented sequences (Adapters, Primers, Contaminants)
-KNOWN_SEQ = {
-    "TruSeq Adapter, Index 7": "AGATCGGAAGAGCACACGTCTGAACTCCAGTCAC",
-    "TruSeq Universal Adapter": "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGTA",
-    "TruSeq Read 1 Adapter": "AGATCGGAAGAGCGGTTCAGCAGGAATGCCGAG",
-    "TruSeq Read 2 Adapter": "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGT",
-    "Illumina Multiplexing PCR Primer 1.0": "AATGATACGGCGACCACCGAGATCTACAC",
-    "Illumina Multiplexing PCR Primer 2.0": "CAAGCAGAAGACGGCATACGAGAT",
-    "Nextera Transposase Adapter": "CTGTCTCTTATACACATCT",
-    "Nextera Read 1 Adapter": "TCGTCGGCAGCGTCAGATGTGTATAAGAGACAG",
-    "Nextera Read 2 Adapter": "GTCTCGTGGGCTCGGAGATGTGTATAAGAGACAG",
-    "PhiX Control Library": "GTTTTCCCAGTCACGACGTTG",
-    "Small RNA Adapter (Read 1)": "TGGAATTCTCGGGTGCCAAGG",
-    "Small RNA Adapter (Read 2)": "CTGTAGGCACCATCAATAGATCGGAAGAGCACACGTCT",
+from statistics import NormalDist
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
+
+from adapters import ADAPTERS, KNOWN_GROUP, KNOWN_SEQ, QC_ADAPTER_GROUP, default_adapter_index  # noqa: F401
+from checkpoint import atomic_path
+from duplication import (DEFAULT_HEAVY_HITTERS, DEFAULT_MAX_DISTINCT, BoundedSequenceCounter,
+                         ExactSequenceCounter, hash_sequences)
+from fastq_index import FastqIndex, open_range
+from fastq_reader import FastqBatch, FastqReader, fastq_stem, is_gzip, shard_ranges
+from kmers import DEFAULT_KMER_SIZE, KmerCounter, group_label
+from metrics import METRICS
+from plots import PLOT_FOLDER, chart_paths, render_charts
+from position_bins import DEFAULT_POSITION_BINS, PositionBins
+from qc_summary import (HEADLINE_METRICS, build_summary, json_summary_path, save_summary, save_summary_json,
+                        structured_summary, summary_path)
+from sampling import DEFAULT_PREVIEW_BLOCKS, DEFAULT_PREVIEW_READS, sample_reads
+from staging import DEFAULT_QUEUE_DEPTH, prefetch
+
+# Phred scores are binned 0-93 (the printable Sanger range) for per-position histograms
+MAX_PHRED = 93
+QUALITY_BINS = MAX_PHRED + 1
+
+# Per-position base counters use A, T, C, G, N columns; anything else is ignored
+BASE_CODES = "ATCGN"
+BASE_LOOKUP = np.full(256, len(BASE_CODES), dtype=np.int64)
+for _code, _base in enumerate(BASE_CODES):
+    BASE_LOOKUP[ord(_base)] = _code
+
+# Report labels and units of the headline metrics a preview gives confidence intervals for
+HEADLINE_LABELS = {
+    'mean_gc': ("GC Content", "%"),
+    'mean_seq_quality': ("Average Per Sequence Quality", ""),
+    'max_adapter_percent': ("Maximum Adapter Content", "%"),
+    'duplicate_percent': ("Duplicate Reads", "%"),
 }
 
+# Tile names up to this many bytes are matched as packed integers; longer ones are parsed per read
+TILE_KEY_BYTES = 8
+
+
+def parse_tile(header: bytes) -> Optional[bytes]:
+    """Tile field of an Illumina read name, or ``None`` if the header carries none.
+
+    Handles the Casava 1.8+ layout (``inst:run:flowcell:lane:tile:x:y``, tile
+    is the 5th field), the older ``inst:lane:tile:x:y#index/read`` layout
+    (3rd field) and SRA headers that keep the original Illumina name as the
+    second word (``SRR001666.1 inst:lane:tile:x:y length=36``).
+    """
+    for word in header.split(None, 2)[:2]:
+        fields = word.split(b':')
+        if len(fields) >= 7:
+            return fields[4]
+        if len(fields) >= 5:
+            return fields[2]
+    return None
+
+
+def tile_order(tile: str):
+    """Sort key placing numeric tiles in numeric order (``2`` before ``10``), others after by name."""
+    return (0, int(tile), tile) if tile.isdigit() else (1, 0, tile)
+
 
 def generate_quality_charts(report_data: Dict, fastqc_folder: Path, file_stem: str) -> Optional[List[Path]]:
     """Generate visualizations for quality metrics."""
     try:
-        fig_dir = fastqc_folder / "plots"
-        fig_dir.mkdir(exist_ok=True)
-        plot_paths = []
-
-        def save_plot(fig_num: int, plot_func):
-            plt.figure(figsize=(15, 12))
-            plot_func()
-            plot_path = fig_dir / f"{file_stem}_quality_plots{fig_num}.png"
-            plt.savefig(plot_path, dpi=150, bbox_inches='tight')
-            plot_paths.append(plot_path)
-            plt.close()
-
-        def create_blank_plot(title: str, message: str):
-            """Create a blank plot with a centered message."""
-            plt.text(0.5, 0.5, message, ha='center', va='center', fontsize=14, color='gray')
-            plt.title(title)
-            plt.axis('off')
-
-        def plot_original_metrics():
-            plt.subplot(2, 2, 1)
-            positions = list(report_data['quality_stats'].keys())
-            means = [v['mean'] for v in report_data['quality_stats'].values()]
-            medians = [v['median'] for v in report_data['quality_stats'].values()]
-            q25 = [v['q25'] for v in report_data['quality_stats'].values()]
-            q75 = [v['q75'] for v in report_data['quality_stats'].values()]
-
-            if positions:
-                plt.plot(positions, means, label='Mean')
-                plt.plot(positions, medians, label='Median')
-                plt.fill_between(positions, q25, q75, alpha=0.3, label='IQR (25-75%)')
-                plt.xlabel('Position in Read (bp)')
-                plt.ylabel('Phred Quality Score')
-                plt.title('Per-Base Sequence Quality')
-                plt.legend()
-                plt.grid(True)
-            else:
-                create_blank_plot("Per-Base Sequence Quality", "No data available")
-
-            plt.subplot(2, 2, 2)
-            if report_data['gc_content']:
-                plt.hist(report_data['gc_content'], bins=np.arange(0, 101, 5), edgecolor='black', alpha=0.7)
-                plt.xlabel('GC Content (%)')
-                plt.ylabel('Number of Sequences')
-                plt.title('GC Content Distribution')
-                plt.grid(True)
-            else:
-                create_blank_plot("GC Content Distribution", "No data available")
-
-            plt.subplot(2, 2, 3)
-            lengths = report_data['lengths']
-            if lengths:
-                max_len = max(lengths)
-                bins = np.linspace(0, max_len + 10, 50)
-                plt.hist(lengths, bins=bins, edgecolor='black', alpha=0.7)
-                plt.xlabel('Sequence Length (bp)')
-                plt.ylabel('Count')
-                plt.title('Sequence Length Distribution')
-                plt.grid(True)
-            else:
-                create_blank_plot("Sequence Length Distribution", "No data available")
-
-            plt.subplot(2, 2, 4)
-            overrep = report_data.get('overrepresented', [])
-            if overrep:
-                sequences, counts = zip(*[(seq[:20] + '...', count) for seq, count in overrep])
-                plt.barh(sequences, counts)
-                plt.xlabel('Count')
-                plt.title('Top Overrepresented Sequences')
-                plt.gca().invert_yaxis()
-            else:
-                create_blank_plot("Top Overrepresented Sequences", "No overrepresented sequences (>0.1% of total)")
-
-        def plot_new_metrics():
-            plt.figure(figsize=(18, 20))
-            plt.subplots_adjust(hspace=0.5, wspace=0.3)
-
-            def plot_per_tile_quality():
-                plt.subplot(3, 2, 1)
-                if report_data.get('per_tile_mean'):
-                    tiles = sorted(report_data['per_tile_mean'].keys())
-                    if tiles:
-                        positions = sorted(report_data['per_tile_mean'][tiles[0]].keys())
-                        data = np.array([[report_data['per_tile_mean'][tile].get(pos, 0) for pos in positions] for tile in tiles])
-                        plt.imshow(data, aspect='auto', cmap='viridis', interpolation='nearest')
-                        plt.colorbar(label='Mean Quality Score')
-                        plt.xlabel('Position in Read')
-                        plt.ylabel('Tile')
-                        plt.title('Per Tile Sequence Quality')
-                        plt.xticks(np.arange(len(positions))[::10], positions[::10], rotation=45)
-                        plt.yticks(np.arange(len(tiles))[::2], tiles[::2])
-                    else:
-                        create_blank_plot("Per Tile Sequence Quality", "No tile data available")
-                else:
-                    create_blank_plot("Per Tile Sequence Quality", "No tile information available")
-
-            def plot_per_sequence_quality():
-                plt.subplot(3, 2, 2)
-                per_seq_qual = report_data.get('per_seq_quality', [])
-                if per_seq_qual:
-                    plt.hist(per_seq_qual, bins=50, edgecolor='black', alpha=0.7)
-                    plt.xlabel('Average Quality Score per Read')
-                    plt.ylabel('Count')
-                    plt.title('Per Sequence Quality Scores')
-                    plt.grid(True)
-                else:
-                    create_blank_plot("Per Sequence Quality Scores", "No data available")
-
-            def plot_per_base_sequence_content():
-                plt.subplot(3, 2, 3)
-                if report_data.get('per_base_percent'):
-                    positions = sorted(report_data['per_base_percent'].keys())
-                    a = [report_data['per_base_percent'][pos].get('A', 0) for pos in positions]
-                    t = [report_data['per_base_percent'][pos].get('T', 0) for pos in positions]
-                    c = [report_data['per_base_percent'][pos].get('C', 0) for pos in positions]
-                    g = [report_data['per_base_percent'][pos].get('G', 0) for pos in positions]
-                    plt.plot(positions, a, label='A', color='green')
-                    plt.plot(positions, t, label='T', color='red')
-                    plt.plot(positions, c, label='C', color='blue')
-                    plt.plot(positions, g, label='G', color='black')
-                    plt.xlabel('Position in Read')
-                    plt.ylabel('Percentage')
-                    plt.title('Per Base Sequence Content')
-                    plt.legend()
-                    plt.grid(True)
-                else:
-                    create_blank_plot("Per Base Sequence Content", "No data available")
-
-            # def plot_per_base_n_content():
-            #     plt.subplot(3, 2, 4)
-            #     if report_data.get('per_base_n_percent'):
-            #         positions = sorted(report_data['per_base_n_percent'].keys())
-            #         n_percent = [report_data['per_base_n_percent'][pos] for pos in positions]
-                    
-            #         # Plot the N content
-            #         plt.plot(positions, n_percent, color='purple', label='N Content')
-                    
-            #         # Add labels and title
-            #         plt.xlabel('Position in Read (bp)')
-            #         plt.ylabel('Percentage of N')
-            #         plt.title('Per Base N Content')
-                    
-            #         # Add grid for better readability
-            #         plt.grid(True)
-                    
-            #         # Optionally, add a legend
-            #         plt.legend()
-            #     else:
-            #         create_blank_plot("Per Base N Content", "No data available")
-
-            def plot_adapter_content():
-                plt.subplot(3, 2, 5)
-                if report_data.get('adapter_percent'):
-                    positions = sorted(report_data['adapter_percent'].keys())
-                    adapter_percent = [report_data['adapter_percent'][pos] for pos in positions]
-                    plt.plot(positions, adapter_percent, color='orange')
-                    plt.xlabel('Position in Read')
-                    plt.ylabel('Percentage of Reads with Adapter')
-                    plt.title('Adapter Content')
-                    plt.grid(True)
-                else:
-                    create_blank_plot("Adapter Content", "No adapter data")
-
-            def plot_duplication_levels():
-                plt.subplot(3, 2, 6)
-                duplication = report_data.get('duplication_levels', {})
-                if duplication and report_data.get('total_seqs', 0) > 0:
-                    x = sorted(duplication.keys())
-                    y = [(duplication[k] * k) / report_data['total_seqs'] * 100 for k in x]
-                    plt.plot(x, y, marker='o', linestyle='-')
-                    plt.xlabel('Duplication Level (Number of Occurrences)')
-                    plt.ylabel('Percentage of Total Reads (%)')
-                    plt.title('Sequence Duplication Levels')
-                    plt.grid(True)
-                else:
-                    create_blank_plot("Sequence Duplication Levels", "No duplication data")
-
-            plot_per_tile_quality()
-            plot_per_sequence_quality()
-            plot_per_base_sequence_content()
-            plot_per_base_n_content()
-            plot_adapter_content()
-            plot_duplication_levels()
-
-        save_plot(1, plot_original_metrics)
-        save_plot(2, plot_new_metrics)
-        return plot_paths
-
+        return render_charts(build_summary(report_data), fastqc_folder / PLOT_FOLDER, file_stem)
     except Exception as e:
         print(f"Error generating charts: {str(e)}")
         return None
 
 
-def fastqc_analysis(fastq_file: Path, fastqc_folder: Path) -> None:
-    """Perform comprehensive quality analysis with visualization."""
-    report_data = {
-        'quality_stats': defaultdict(list),
-        'gc_content': [],
-        'lengths': [],
-        'overrepresented': [],
-        'per_tile_quality': defaultdict(lambda: defaultdict(list)),
-        'per_seq_quality': [],
-        'per_base_content': defaultdict(lambda: {'A': 0, 'T': 0, 'C': 0, 'G': 0}),
-        'per_base_n_content': defaultdict(int),
-        'duplication_levels': defaultdict(int),
-        'adapter_content': defaultdict(int),
-        'total_seqs': 0,
-    }
-
-    try:
-        sequence_cache = defaultdict(int)
-        print(f"\nAnalyzing {fastq_file.name}...")
-        total_sequences = sum(1 for _ in SeqIO.parse(fastq_file, "fastq"))
-        processed_sequences = 0
-
-        with open(fastq_file, "r") as handle:
-            for record in SeqIO.parse(handle, "fastq"):
-                seq_len = len(record)
-                report_data['lengths'].append(seq_len)
-                gc = (record.seq.count('G') + record.seq.count('C')) / seq_len * 100
-                report_data['gc_content'].append(gc)
-                quals = record.letter_annotations['phred_quality']
-                avg_qual = np.mean(quals)
-                report_data['per_seq_quality'].append(avg_qual)
-
-                for pos, score in enumerate(quals):
-                    report_data['quality_stats'][pos].append(score)
-
-                seq = str(record.seq).upper()
-                for pos, base in enumerate(seq):
-                    if base in ['A', 'T', 'C', 'G']:
-                        report_data['per_base_content'][pos][base] += 1
-                    elif base == 'N':
-                        report_data['per_base_n_content'][pos] += 1
-
-                record_id = record.id
-                parts = record_id.split(':')
-                if len(parts) >= 5:
-                    tile = parts[4]
-                    for pos, score in enumerate(quals):
-                        report_data['per_tile_quality'][tile][pos].append(score)
-
-                for adapter in ADAPTERS:
-                    adapter_upper = adapter.upper()
-                    start = seq.find(adapter_upper)
-                    if start != -1:
-                        end = start + len(adapter_upper)
-                        for p in range(start, end):
-                            if p < seq_len:
-                                report_data['adapter_content'][p] += 1
-                        rc_adapter = str(Seq(adapter_upper).reverse_complement())
-                        start = seq.find(rc_adapter)
-                        if start != -1:
-                            end = start + len(rc_adapter)
-                            for p in range(start, end):
-                                if p < seq_len:
-                                    report_data['adapter_content'][p] += 1
-
-                seq_str = str(record.seq)
-                sequence_cache[seq_str] += 1
-                processed_sequences += 1
-                print(f"Progress: {processed_sequences / total_sequences * 100:.2f}%", end='\r')
-
-        report_data['total_seqs'] = len(report_data['lengths'])
-        print(f"Total Sequences: {report_data['total_seqs']}")
-
-        quality_stats = {
-            pos: {
-                'mean': np.mean(scores),
-                'median': np.median(scores),
-                'q25': sorted(scores)[int(len(scores) * 0.25)] if scores else 0,
-                'q75': sorted(scores)[int(len(scores) * 0.75)] if scores else 0
-            }
-            for pos, scores in report_data['quality_stats'].items()
-        }
-        report_data['quality_stats'] = quality_stats
-
-        per_tile_mean = {
-            tile: {pos: np.mean(scores) for pos, scores in positions.items()}
-            for tile, positions in report_data['per_tile_quality'].items()
-        }
-        report_data['per_tile_mean'] = per_tile_mean
-
-        per_base_percent = {
-            pos: {base: (count / total) * 100 for base, count in bases.items()}
-            for pos, bases in report_data['per_base_content'].items()
-            if (total := sum(bases.values()) + report_data['per_base_n_content'].get(pos, 0)) > 0
-        }
-        report_data['per_base_percent'] = per_base_percent
-
-        report_data['per_base_n_percent'] = {
-            pos: (count / report_data['total_seqs']) * 100
-            for pos, count in report_data['per_base_n_content'].items()
+class QCAccumulator:
+    """Streaming accumulator for FASTQ quality metrics.
+
+    All per-position metrics are kept as fixed-size NumPy count arrays with
+    one row per position bin (``position_bins.PositionBins``: single bases
+    for short reads, ever wider bins further into long reads), so memory
+    depends neither on the number of reads nor, in practice, on their
+    length. Duplicate and overrepresented sequences are counted exactly by
+    default; ``bounded_duplication`` switches to fixed-memory estimates (see
+    ``duplication.BoundedSequenceCounter``).
+    K-mers of ``kmer_size`` bases are counted per position group for the
+    enrichment report (``kmers.KmerCounter``); ``None`` skips them.
+    """
+
+    def __init__(self, bounded_duplication: bool = False, max_distinct: int = DEFAULT_MAX_DISTINCT,
+                 heavy_hitters: int = DEFAULT_HEAVY_HITTERS, kmer_size: Optional[int] = DEFAULT_KMER_SIZE,
+                 position_bins: PositionBins = DEFAULT_POSITION_BINS):
+        self.bins = position_bins
+        self.total_seqs = 0
+        self.total_bases = 0
+        self.quality_hist = np.zeros((0, QUALITY_BINS), dtype=np.int64)
+        self.base_counts = np.zeros((0, len(BASE_CODES)), dtype=np.int64)
+        self.adapter_counts = np.zeros(0, dtype=np.int64)
+        self.length_counts = np.zeros(1, dtype=np.int64)
+        # GC base and quality totals per read length, so per-read means can be averaged exactly
+        self.gc_by_length = np.zeros(1, dtype=np.int64)
+        self.quality_by_length = np.zeros(1, dtype=np.int64)
+        self.gc_hist = np.zeros(101, dtype=np.int64)
+        self.seq_quality_hist = np.zeros(QUALITY_BINS, dtype=np.int64)
+        # Tile names are interned to row numbers of dense (tiles x position bins) quality sum/count arrays
+        self.tile_ids: Dict[bytes, int] = {}
+        self.tile_sums = np.zeros((0, 0), dtype=np.int64)
+        self.tile_counts = np.zeros((0, 0), dtype=np.int64)
+        if bounded_duplication:
+            self.sequence_counter = BoundedSequenceCounter(max_distinct, heavy_hitters)
+        else:
+            self.sequence_counter = ExactSequenceCounter()
+        self.kmers = KmerCounter(kmer_size) if kmer_size else None
+
+    def _grow(self, length: int) -> None:
+        """Extend the per-length arrays to reads of ``length`` bases and the per-bin arrays to their bins."""
+        extra = length + 1 - len(self.length_counts)
+        if extra > 0:
+            self.length_counts = np.concatenate([self.length_counts, np.zeros(extra, dtype=np.int64)])
+            self.gc_by_length = np.concatenate([self.gc_by_length, np.zeros(extra, dtype=np.int64)])
+            self.quality_by_length = np.concatenate([self.quality_by_length, np.zeros(extra, dtype=np.int64)])
+        extra = self.bins.count(length) - self.quality_hist.shape[0]
+        if extra <= 0:
+            return
+        self.quality_hist = np.vstack([self.quality_hist, np.zeros((extra, QUALITY_BINS), dtype=np.int64)])
+        self.base_counts = np.vstack([self.base_counts, np.zeros((extra, len(BASE_CODES)), dtype=np.int64)])
+        self.adapter_counts = np.concatenate([self.adapter_counts, np.zeros(extra, dtype=np.int64)])
+        self._grow_tiles(len(self.tile_ids))
+
+    def _grow_tiles(self, tiles: int) -> None:
+        """Extend the tile arrays to ``tiles`` rows and the current number of position bins."""
+        rows, columns = self.tile_sums.shape
+        shape = (max(tiles, rows), self.quality_hist.shape[0])
+        if shape == (rows, columns):
+            return
+        for name in ('tile_sums', 'tile_counts'):
+            grown = np.zeros(shape, dtype=np.int64)
+            grown[:rows, :columns] = getattr(self, name)
+            setattr(self, name, grown)
+
+    def _intern_tile(self, tile: bytes) -> int:
+        tile_id = self.tile_ids.get(tile)
+        if tile_id is None:
+            tile_id = self.tile_ids[tile] = len(self.tile_ids)
+        return tile_id
+
+    def _tile_rows(self, batch: FastqBatch) -> np.ndarray:
+        """Interned tile ID of each read in ``batch`` (-1 for reads without a tile).
+
+        The tile field is located for all headers at once from the positions
+        of colons and spaces in the batch's header buffer, and tile names of
+        up to 8 bytes are compared as packed integers, so only the few
+        distinct tiles of a batch are interned in Python. Headers that do not
+        fit this fast path (e.g. SRA-style names) are parsed with ``parse_tile``.
+        """
+        data = np.frombuffer(batch.header_data, dtype=np.uint8)
+        starts, ends = batch.header_offsets[:-1], batch.header_offsets[1:]
+        rows = np.full(len(batch), -1, dtype=np.int64)
+        colons = np.flatnonzero(data == ord(':'))
+        fast = np.zeros(len(batch), dtype=bool)
+        if len(colons):
+            spaces = np.append(np.flatnonzero((data == ord(' ')) | (data == ord('\t'))), len(data))
+            word_ends = np.minimum(spaces[np.searchsorted(spaces, starts)], ends)
+            first = np.searchsorted(colons, starts)
+            count = np.searchsorted(colons, word_ends) - first
+            # Casava 1.8+ names have 6 colons (tile after the 4th), older ones 4 (tile after the 2nd)
+            field = np.where(count >= 6, 4, 2)
+            parsed = count >= 4
+            last = len(colons) - 1
+            tile_starts = colons[np.minimum(first + field - 1, last)] + 1
+            tile_lengths = colons[np.minimum(first + field, last)] - tile_starts
+            fast = parsed & (tile_lengths > 0) & (tile_lengths <= TILE_KEY_BYTES)
+            if fast.any():
+                lengths = tile_lengths[fast]
+                valid = np.arange(TILE_KEY_BYTES) < lengths[:, None]
+                keys = np.zeros((len(lengths), TILE_KEY_BYTES), dtype=np.uint8)
+                keys[valid] = data[(tile_starts[fast][:, None] + np.arange(TILE_KEY_BYTES))[valid]]
+                unique, inverse = np.unique(keys.view(np.uint64).ravel(), return_inverse=True)
+                ids = [self._intern_tile(key.tobytes().rstrip(b'\0')) for key in unique]
+                rows[fast] = np.array(ids, dtype=np.int64)[inverse]
+        for i in np.flatnonzero(~fast).tolist():
+            tile = parse_tile(batch.header(i))
+            if tile is not None:
+                rows[i] = self._intern_tile(tile)
+        return rows
+
+    def add_batch(self, batch: FastqBatch) -> None:
+        """Add a batch of reads to the running totals."""
+        batch = batch.subset(batch.lengths > 0)
+        if len(batch) == 0:
+            return
+        width = batch.width
+        self._grow(width)
+        bins = self.bins.count(width)
+        position_bins = self.bins.index(np.arange(width))
+        lengths = batch.lengths
+        mask = batch.mask()
+        positions = np.broadcast_to(position_bins, mask.shape)[mask]
+        quals = np.minimum(batch.quals, MAX_PHRED).astype(np.int64)
+
+        with METRICS.stage("qc.content"):
+            self.total_seqs += len(batch)
+            self.total_bases += int(lengths.sum())
+            self.length_counts[:width + 1] += np.bincount(lengths, minlength=width + 1)
+
+            gc_bases = ((batch.seqs == ord('G')) | (batch.seqs == ord('C'))).sum(axis=1)
+            gc = gc_bases / lengths * 100
+            self.gc_by_length[:width + 1] += np.bincount(lengths, weights=gc_bases,
+                                                         minlength=width + 1).astype(np.int64)
+            self.gc_hist += np.bincount(gc.astype(np.int64), minlength=101)
+
+            qual_sums = (quals * mask).sum(axis=1)
+            avg_qual = qual_sums / lengths
+            self.quality_by_length[:width + 1] += np.bincount(lengths, weights=qual_sums,
+                                                              minlength=width + 1).astype(np.int64)
+            self.seq_quality_hist += np.bincount(avg_qual.astype(np.int64), minlength=QUALITY_BINS)
+            self.quality_hist[:bins] += np.bincount(
+                positions * QUALITY_BINS + quals[mask], minlength=bins * QUALITY_BINS
+            ).reshape(bins, QUALITY_BINS)
+
+            upper = batch.seqs & 0xDF
+            codes = BASE_LOOKUP[upper[mask]]
+            known = codes < len(BASE_CODES)
+            self.base_counts[:bins] += np.bincount(
+                positions[known] * len(BASE_CODES) + codes[known], minlength=bins * len(BASE_CODES)
+            ).reshape(bins, len(BASE_CODES))
+
+        with METRICS.stage("qc.tiles"):
+            read_tiles = self._tile_rows(batch)
+            if (read_tiles >= 0).any():
+                self._grow_tiles(len(self.tile_ids))
+                base_tiles = np.broadcast_to(read_tiles[:, None], mask.shape)[mask]
+                tiled = base_tiles >= 0
+                cells = self.tile_sums.size
+                index = base_tiles[tiled] * self.tile_sums.shape[1] + positions[tiled]
+                self.tile_sums += np.bincount(index, weights=quals[mask][tiled],
+                                              minlength=cells).astype(np.int64).reshape(self.tile_sums.shape)
+                self.tile_counts += np.bincount(index, minlength=cells).reshape(self.tile_counts.shape)
+
+        upper_batch = FastqBatch(upper, batch.quals, lengths, batch.header_data, batch.header_offsets)
+        with METRICS.stage("qc.adapters"):
+            adapter_index = default_adapter_index()
+            matches = adapter_index.exact_matches(upper, lengths, (QC_ADAPTER_GROUP,))
+            if matches:
+                # Reads with adapter at each base, from +1/-1 marks at the start and end of every match
+                _, starts, pattern_ids = np.array(matches, dtype=np.int64).T
+                pattern_lengths = np.array([len(pattern) for pattern in adapter_index.patterns], dtype=np.int64)
+                marks = np.bincount(starts, minlength=width + 1) \
+                    - np.bincount(starts + pattern_lengths[pattern_ids], minlength=width + 1)
+                self.adapter_counts[:bins] += np.bincount(position_bins, weights=np.cumsum(marks[:width]),
+                                                          minlength=bins).astype(np.int64)
+
+        if self.kmers is not None:
+            with METRICS.stage("qc.kmers"):
+                self.kmers.add(upper, lengths)
+
+        with METRICS.stage("qc.duplication"):
+            self.sequence_counter.add(upper_batch.sequences(), upper_batch)
+
+    def checkpoint_state(self) -> "QCAccumulator":
+        """Shallow copy to checkpoint, leaving out an exact duplication counter.
+
+        The exact counter holds every distinct sequence, so pickling it would
+        make each checkpoint larger than the last; the bounded one is kept.
+        A copy without it has ``sequence_counter`` set to ``None`` until
+        ``recount_sequences`` rebuilds it.
+        """
+        state = copy.copy(self)
+        if isinstance(self.sequence_counter, ExactSequenceCounter):
+            state.sequence_counter = None
+        return state
+
+    def recount_sequences(self, batches: Iterable[FastqBatch]) -> None:
+        """Rebuild the exact duplication counter left out by ``checkpoint_state`` from the reads added so far."""
+        self.sequence_counter = ExactSequenceCounter()
+        for batch in batches:
+            batch = batch.subset(batch.lengths > 0)
+            upper_batch = FastqBatch(batch.seqs & 0xDF, batch.quals, batch.lengths, batch.header_data,
+                                     batch.header_offsets)
+            self.sequence_counter.add(upper_batch.sequences(), upper_batch)
+
+    def merge(self, other: "QCAccumulator") -> "QCAccumulator":
+        """Fold another accumulator (e.g. from a file shard) into this one.
+
+        Every field is an exact count, so merging shards in file order gives the
+        same result as analyzing the whole file serially. Both must use the
+        same position bins.
+        """
+        if other.bins != self.bins:
+            raise ValueError(f"Cannot merge QC results with different position bins ({self.bins} vs {other.bins})")
+        lengths = len(other.length_counts)
+        self._grow(lengths - 1)
+        width = other.quality_hist.shape[0]
+        self.total_seqs += other.total_seqs
+        self.total_bases += other.total_bases
+        self.quality_hist[:width] += other.quality_hist
+        self.base_counts[:width] += other.base_counts
+        self.adapter_counts[:width] += other.adapter_counts
+        self.length_counts[:lengths] += other.length_counts
+        self.gc_by_length[:lengths] += other.gc_by_length
+        self.quality_by_length[:lengths] += other.quality_by_length
+        self.gc_hist += other.gc_hist
+        self.seq_quality_hist += other.seq_quality_hist
+        # Both sides interned tiles in their own order; map the other's rows onto ours
+        rows = np.array([self._intern_tile(tile) for tile in other.tile_ids], dtype=np.int64)
+        self._grow_tiles(len(self.tile_ids))
+        self.tile_sums[rows, :width] += other.tile_sums[:, :width]
+        self.tile_counts[rows, :width] += other.tile_counts[:, :width]
+        self.sequence_counter.merge(other.sequence_counter)
+        if self.kmers is not None and other.kmers is not None:
+            self.kmers.merge(other.kmers)
+        return self
+
+    def _mean_per_read(self, totals_by_length: np.ndarray) -> float:
+        """Average of ``total / length`` over all reads, from per-length totals."""
+        lengths = np.flatnonzero(self.length_counts)
+        return float((totals_by_length[lengths] / lengths).sum() / self.total_seqs)
+
+    def quality_stats(self) -> Dict[str, np.ndarray]:
+        """Mean, median and quartiles of each covered position bin, computed from the histograms.
+
+        ``bins`` holds the covered bin numbers and each statistic one value per covered bin.
+        """
+        hist = self.quality_hist
+        n = hist.sum(axis=1)
+        covered = np.flatnonzero(n)
+        hist, n = hist[covered], n[covered]
+        cumulative = np.cumsum(hist, axis=1)
+
+        def order_stat(rank):
+            return np.argmax(cumulative > rank[:, None], axis=1)
+
+        return {
+            'bins': covered,
+            'mean': (hist * np.arange(QUALITY_BINS)).sum(axis=1) / n,
+            'median': (order_stat((n - 1) // 2) + order_stat(n // 2)) / 2,
+            'q25': order_stat((n * 0.25).astype(np.int64)),
+            'q75': order_stat((n * 0.75).astype(np.int64)),
         }
 
-        report_data['adapter_percent'] = {
-            pos: (count / report_data['total_seqs']) * 100
-            for pos, count in report_data['adapter_content'].items()
+    def finalize(self) -> Dict:
+        """Convert the running totals into the report dictionary used for charts and reports."""
+        with METRICS.stage("qc.finalize"):
+            return self._report_data()
+
+    def _report_data(self) -> Dict:
+        total = self.total_seqs
+        report_data = {
+            'total_seqs': total,
+            'mean_length': self.total_bases / total if total else 0.0,
+            'mean_gc': self._mean_per_read(self.gc_by_length) * 100 if total else 0.0,
+            'mean_seq_quality': self._mean_per_read(self.quality_by_length) if total else 0.0,
+            'gc_hist': self.gc_hist,
+            'length_counts': self.length_counts,
+            'per_seq_quality_hist': self.seq_quality_hist,
+            'quality_stats': self.quality_stats(),
         }
 
-        for count in sequence_cache.values():
-            report_data['duplication_levels'][count] += 1
-
-        def find_known_sequence(seq: str) -> Optional[str]:
-            for name, known_seq in KNOWN_SEQ.items():
-                if known_seq in seq:
-                    return name
-                rc_seq = str(Seq(known_seq).reverse_complement())
-                if rc_seq in seq:
-                    return name
-            return None
-
-        if report_data['total_seqs'] > 0:
+        bins = self.quality_hist.shape[0]
+        report_data['position_bin_starts'] = self.bins.starts(bins)
+        report_data['position_bin_ends'] = self.bins.ends(bins)
+        sizes = self.bins.sizes(bins)
+
+        names = [tile.decode(errors='replace') for tile in self.tile_ids]
+        order = sorted(range(len(names)), key=lambda row: tile_order(names[row]))
+        tile_bins = np.flatnonzero(self.tile_counts.any(axis=0))
+        counts = self.tile_counts[order][:, tile_bins]
+        report_data['tiles'] = [names[row] for row in order]
+        report_data['tile_bins'] = tile_bins
+        report_data['tile_mean'] = np.divide(self.tile_sums[order][:, tile_bins], counts,
+                                             out=np.full(counts.shape, np.nan), where=counts > 0)
+
+        acgt = self.base_counts[:, :4]
+        n_counts = self.base_counts[:, 4]
+        totals = acgt.sum(axis=1) + n_counts
+        report_data['base_bins'] = np.flatnonzero(totals)
+        report_data['base_percent'] = acgt[report_data['base_bins']] / totals[report_data['base_bins'], None] * 100
+        # N and adapter content are the average over the bases of a bin of the percentage of reads
+        report_data['n_bins'] = np.flatnonzero(n_counts)
+        report_data['n_percent'] = n_counts[report_data['n_bins']] / (total * sizes[report_data['n_bins']]) * 100
+        report_data['adapter_percent'] = self.adapter_counts / (total * sizes) * 100 if total else np.zeros(0)
+
+        report_data['kmer_content'] = self.kmers.enriched() if self.kmers is not None else None
+
+        report_data['duplication_levels'] = self.sequence_counter.duplication_levels(total)
+        report_data['estimation_notes'] = self.sequence_counter.notes(total)
+
+        if total > 0:
+            top_sequences = [(seq.decode(), count) for seq, count in self.sequence_counter.top_sequences(total * 0.001)]
+            known_names = default_adapter_index().name_sequences([seq for seq, _ in top_sequences], KNOWN_GROUP)
             overrepresented_sequences = [
-                (seq, count, find_known_sequence(seq) or "Unknown Overrepresented Sequence")
-                for seq, count in sequence_cache.items()
-                if count / report_data['total_seqs'] > 0.001
+                (seq, count, name or "Unknown Overrepresented Sequence")
+                for (seq, count), name in zip(top_sequences, known_names)
             ]
-            overrepresented_sequences.sort(key=lambda x: x[1], reverse=True)
             report_data['overrepresented'] = [(seq[:50], count) for seq, count, _ in overrepresented_sequences[:10]]
         else:
             report_data['overrepresented'] = []
 
-        report_path = fastqc_folder / f"{fastq_file.stem}_qc_report.txt"
-        with open(report_path, "w") as report:
-            report.write(f"FASTQ Quality Report: {fastq_file.name}\n")
-            report.write("=" * 50 + "\n")
-            report.write(f"Total Sequences: {report_data['total_seqs']}\n")
-            report.write(f"Average Length: {np.mean(report_data['lengths']):.1f} bp\n")
-            report.write(f"GC Content: {np.mean(report_data['gc_content']):.1f}%\n")
-            report.write(f"Average Per Sequence Quality: {np.mean(report_data['per_seq_quality']):.1f}\n")
-            report.write(f"Maximum Adapter Content: {max(report_data['adapter_percent'].values(), default=0):.2f}%\n\n")
-            report.write("Overrepresented Sequences:\n")
-            for seq, count in report_data['overrepresented']:
-                report.write(f"Sequence: {seq}, Count: {count}, Percentage: {(count / report_data['total_seqs']) * 100:.5f}%\n")
+        return report_data
+
+
+def write_qc_report(report_data: Dict, fastq_file: Path, fastqc_folder: Path, render_plots: bool = True) -> Path:
+    """Write the summaries (``.npz`` and JSON), text report and charts for an analyzed FASTQ file.
+
+    With ``render_plots=False`` only the summary is written for the charts;
+    ``plots.render_pending`` draws them later.
+    """
+    stem = fastq_stem(fastq_file)
+    with METRICS.stage("report.summary"):
+        summary = build_summary(report_data)
+        save_summary(summary, summary_path(fastq_file, fastqc_folder))
+        save_summary_json(structured_summary(summary, stem), json_summary_path(fastq_file, fastqc_folder))
+    plot_paths = None
+    if render_plots:
+        try:
+            with METRICS.stage("charts"):
+                plot_paths = render_charts(summary, fastqc_folder / PLOT_FOLDER, stem)
+        except Exception as e:
+            print(f"Error generating charts: {str(e)}")
+
+    report_path = fastqc_folder / f"{stem}_qc_report.txt"
+    with atomic_path(report_path) as temporary, open(temporary, "w") as report:
+        report.write(f"FASTQ Quality Report: {fastq_file.name}\n")
+        report.write("=" * 50 + "\n")
+        report.write(f"Total Sequences: {report_data['total_seqs']}\n")
+        report.write(f"Average Length: {report_data['mean_length']:.1f} bp\n")
+        report.write(f"GC Content: {report_data['mean_gc']:.1f}%\n")
+        report.write(f"Average Per Sequence Quality: {report_data['mean_seq_quality']:.1f}\n")
+        report.write(f"Maximum Adapter Content: {np.max(report_data['adapter_percent'], initial=0):.2f}%\n\n")
+        sampling = report_data.get('sampling')
+        if sampling:
+            report.write(f"Preview: {sampling['reads']} reads sampled from {sampling['blocks']} {sampling['method']} "
+                         f"(~{sampling['fraction'] * 100:.2f}% of an estimated {sampling['estimated_total']:.0f} reads)\n")
+            report.write(f"Preview Estimates ({sampling['confidence'] * 100:.0f}% confidence intervals):\n")
+            for metric in HEADLINE_METRICS:
+                label, unit = HEADLINE_LABELS[metric]
+                estimate, lower, upper = report_data['headline_intervals'][metric]
+                report.write(f"{label}: {estimate:.2f}{unit} ({lower:.2f}-{upper:.2f}{unit})\n")
+            report.write("\n")
+        report.write("Overrepresented Sequences:\n")
+        for seq, count in report_data['overrepresented']:
+            report.write(f"Sequence: {seq}, Count: {count}, Percentage: {(count / report_data['total_seqs']) * 100:.5f}%\n")
+        report.write("\n")
+        kmer_content = report_data.get('kmer_content')
+        if kmer_content:
+            report.write(f"Enriched K-mers (k={kmer_content['kmer_size']}):\n")
+            for i, kmer in enumerate(kmer_content['sequences']):
+                position = int(np.searchsorted(kmer_content['group_starts'], kmer_content['max_positions'][i]))
+                report.write(f"Sequence: {kmer}, Count: {kmer_content['counts'][i]}, "
+                             f"P-value: {kmer_content['pvalues'][i]:.2e}, "
+                             f"Obs/Exp Max: {kmer_content['max_obs_exp'][i]:.2f}, "
+                             f"Max Obs/Exp Position: {group_label(position)}\n")
+            report.write("\n")
+        if report_data.get('estimation_notes'):
+            report.write("Estimation Error Bounds:\n")
+            for note in report_data['estimation_notes']:
+                report.write(f"{note}\n")
             report.write("\n")
 
-            plot_paths = generate_quality_charts(report_data, fastqc_folder, fastq_file.stem)
-            if plot_paths:
-                for i, path in enumerate(plot_paths, 1):
-                    report.write(f"Quality plots part {i} saved to: {path}\n")
-
+        if plot_paths:
+            for i, path in enumerate(plot_paths, 1):
+                report.write(f"Quality plots part {i} saved to: {path}\n")
+        elif not render_plots:
+            for i, path in enumerate(chart_paths(fastqc_folder / PLOT_FOLDER, stem), 1):
+                report.write(f"Quality plots part {i} (rendered separately): {path}\n")
+    return report_path
+
+
+def _analyze_shard(fastq_file: Path, start: int, end: int, options: Dict) -> QCAccumulator:
+    """Worker entry point: accumulate QC metrics for one byte range of a FASTQ file."""
+    accumulator = QCAccumulator(**options)
+    with open_range(fastq_file, start, end, FastqIndex.load(fastq_file)) as reader:
+        for batch in reader:
+            accumulator.add_batch(batch)
+    return accumulator
+
+
+def _analyze_parallel(fastq_file: Path, workers: int, options: Dict,
+                      index: Optional[FastqIndex] = None) -> QCAccumulator:
+    """Analyze record-aligned shards of ``fastq_file`` in a process pool and merge them in file order.
+
+    With an offset index the shards hold equal numbers of reads (and BGZF
+    input can be sharded); otherwise a plain file is split by byte size.
+    """
+    shards = index.shard_ranges(workers) if index is not None else shard_ranges(fastq_file, workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_analyze_shard, fastq_file, start, end, options) for start, end in shards]
+        accumulator = QCAccumulator(**options)
+        for done, future in enumerate(futures, 1):
+            accumulator.merge(future.result())
+            print(f"Progress: {done / len(futures) * 100:.2f}%", end='\r')
+    return accumulator
+
+
+def _ratio_interval(values: np.ndarray, counts: np.ndarray, z: float) -> Tuple[float, float, float]:
+    """Ratio estimate ``sum(values) / sum(counts)`` with a normal interval from the spread between blocks.
+
+    Standard linearized variance of a ratio estimator under cluster sampling,
+    with blocks as clusters; reads within a block are not independent.
+    """
+    total = counts.sum()
+    estimate = values.sum() / total
+    if len(values) < 2:
+        return float(estimate), np.nan, np.nan
+    residuals = values - estimate * counts
+    error = np.sqrt(len(values) / (len(values) - 1) * (residuals ** 2).sum()) / total
+    return float(estimate), float(estimate - z * error), float(estimate + z * error)
+
+
+def headline_intervals(blocks: List[QCAccumulator], duplicates: np.ndarray,
+                       confidence: float = 0.95) -> Dict[str, Tuple[float, float, float]]:
+    """(estimate, lower, upper) for each of ``HEADLINE_METRICS`` from per-block accumulators of a sample.
+
+    ``duplicates`` is the number of reads in each block whose sequence
+    occurred earlier in the sample. Adapter content is taken at the position
+    where the whole sample has the most adapter, as in the report.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    counts = np.array([block.total_seqs for block in blocks], dtype=np.float64)
+    adapter_totals = np.zeros(max(len(block.adapter_counts) for block in blocks), dtype=np.int64)
+    for block in blocks:
+        adapter_totals[:len(block.adapter_counts)] += block.adapter_counts
+    # Adapter counts are summed over the bases of each position bin
+    sizes = blocks[0].bins.sizes(len(adapter_totals))
+    peak = int(np.argmax(adapter_totals / sizes)) if len(adapter_totals) else 0
+    per_block = {
+        'mean_gc': [block._mean_per_read(block.gc_by_length) * block.total_seqs * 100 if block.total_seqs else 0.0
+                    for block in blocks],
+        'mean_seq_quality': [block._mean_per_read(block.quality_by_length) * block.total_seqs
+                             if block.total_seqs else 0.0 for block in blocks],
+        'max_adapter_percent': [block.adapter_counts[peak] * 100 / sizes[peak] if peak < len(block.adapter_counts)
+                                else 0 for block in blocks],
+        'duplicate_percent': duplicates * 100,
+    }
+    return {metric: _ratio_interval(np.asarray(per_block[metric], dtype=np.float64), counts, z)
+            for metric in HEADLINE_METRICS}
+
+
+def preview_analysis(fastq_file: Path, fastqc_folder: Path, reads: int = DEFAULT_PREVIEW_READS,
+                     blocks: int = DEFAULT_PREVIEW_BLOCKS, confidence: float = 0.95, seed: int = 0,
+                     render_plots: bool = True) -> None:
+    """Quick QC of about ``reads`` reads sampled across the whole file, for go/no-go calls.
+
+    Reads are taken from ``blocks`` evenly spaced places in plain and BGZF
+    files, so the time taken does not grow with the file size (plain gzip
+    has to be decompressed fully; see ``sampling.sample_reads``). The report
+    and charts are those of ``fastqc_analysis`` computed on the sample, plus
+    ``confidence`` intervals for the headline metrics. Files too small for
+    sampling to pay off are analyzed completely.
+    """
+    try:
+        print(f"\nPreviewing {fastq_file.name}...")
+        sample = sample_reads(fastq_file, reads, blocks, seed)
+        if sample is None:
+            print("File is small; analyzing all reads")
+            fastqc_analysis(fastq_file, fastqc_folder, render_plots=render_plots)
+            return
+
+        # K-mers are counted once for the whole sample rather than in every block
+        merged = QCAccumulator()
+        accumulators, block_hashes = [], []
+        for block in sample.blocks:
+            accumulator = QCAccumulator(kmer_size=None)
+            hashes = []
+            for batch in block:
+                accumulator.add_batch(batch)
+                merged.kmers.add(batch.seqs & 0xDF, batch.lengths)
+                batch = batch.subset(batch.lengths > 0)
+                hashes.append(hash_sequences(batch.seqs & 0xDF, batch.lengths))
+            accumulators.append(accumulator)
+            block_hashes.append(np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64))
+
+        # Reads repeating a sequence seen earlier in the sample, per block
+        block_ids = np.repeat(np.arange(len(block_hashes)), [len(hashes) for hashes in block_hashes])
+        _, first = np.unique(np.concatenate(block_hashes), return_index=True)
+        repeated = np.ones(len(block_ids), dtype=bool)
+        repeated[first] = False
+        duplicates = np.bincount(block_ids[repeated], minlength=len(block_hashes))
+
+        for accumulator in accumulators:
+            merged.merge(accumulator)
+        report_data = merged.finalize()
+        report_data['headline_intervals'] = headline_intervals(accumulators, duplicates, confidence)
+        report_data['sampling'] = {'method': sample.method, 'reads': sample.reads, 'blocks': len(sample.blocks),
+                                   'estimated_total': sample.estimated_total, 'fraction': sample.fraction,
+                                   'confidence': confidence}
+        report_data['estimation_notes'] = report_data['estimation_notes'] + [
+            "Preview of a sample of reads: counts describe the sample; duplicate reads are counted within "
+            "the sample, so the whole file has at least as many"
+        ]
+        print(f"Sampled Sequences: {sample.reads} (~{sample.fraction * 100:.2f}% of the file)")
+
+        report_path = write_qc_report(report_data, fastq_file, fastqc_folder, render_plots)
+        print(f"Quality report generated: {report_path.name}")
+    except Exception as e:
+        print(f"Error in preview analysis: {str(e)}")
+
+
+def fastqc_analysis(fastq_file: Path, fastqc_folder: Path, workers: int = 1, bounded_duplication: bool = False,
+                    max_distinct: int = DEFAULT_MAX_DISTINCT, heavy_hitters: int = DEFAULT_HEAVY_HITTERS,
+                    render_plots: bool = True, queue_depth: int = DEFAULT_QUEUE_DEPTH,
+                    kmer_size: Optional[int] = DEFAULT_KMER_SIZE,
+                    position_bins: PositionBins = DEFAULT_POSITION_BINS,
+                    progress: Optional[Callable[[float], None]] = None) -> None:
+    """Perform comprehensive quality analysis with visualization in a single streaming pass.
+
+    Gzip/BGZF input is decompressed on the fly. With ``workers > 1`` an
+    uncompressed file, or a BGZF file with an offset index (``fastq_index.py``),
+    is split into record-aligned shards that are analyzed in parallel
+    processes; the merged report is identical to the serial one.
+    ``bounded_duplication`` caps the memory used for duplication and
+    overrepresented-sequence estimates (``max_distinct`` tracked sequences,
+    ``heavy_hitters`` Space-Saving counters) and adds error bounds to the report.
+    Positionally enriched k-mers of ``kmer_size`` bases are reported (``None`` skips them).
+    Per-position metrics are kept per ``position_bins`` bin, so long reads do
+    not need a row for every base.
+    ``render_plots=False`` defers the charts (see ``plots.render_pending``).
+    In a serial run the next ``queue_depth`` batches are read and parsed on a
+    background thread while the current one is analyzed, and ``progress`` is
+    called with the fraction of the file read after each batch.
+    """
+    options = {'bounded_duplication': bounded_duplication, 'max_distinct': max_distinct,
+               'heavy_hitters': heavy_hitters, 'kmer_size': kmer_size, 'position_bins': position_bins}
+    try:
+        print(f"\nAnalyzing {fastq_file.name}...")
+        with METRICS.stage("fastqc"):
+            index = FastqIndex.load(fastq_file) if workers > 1 else None
+            if workers > 1 and (not is_gzip(fastq_file) or (index is not None and index.seekable)):
+                accumulator = _analyze_parallel(fastq_file, workers, options, index)
+            else:
+                accumulator = QCAccumulator(**options)
+                with FastqReader(fastq_file) as reader:
+                    for batch in prefetch(METRICS.timed_iter("read", reader), queue_depth):
+                        accumulator.add_batch(batch)
+                        print(f"Progress: {reader.progress * 100:.2f}%", end='\r')
+                        if progress is not None:
+                            progress(reader.progress)
+                    METRICS.count("bytes_in", reader.bytes_read)
+            METRICS.count("reads_in", accumulator.total_seqs)
+            METRICS.count("bases_in", accumulator.total_bases)
+
+            report_data = accumulator.finalize()
+            print(f"Total Sequences: {report_data['total_seqs']}")
+
+            report_path = write_qc_report(report_data, fastq_file, fastqc_folder, render_plots)
         print(f"\nQuality report generated: {report_path.name}")
 
     except Exception as e:
-        print(f"Error analyzing {fastq_file.name}: {str(e)}")
\ No newline at end of file
+        print(f"Error analyzing {fastq_file.name}: {str(e)}")
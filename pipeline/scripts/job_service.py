@@ -0,0 +1,629 @@
+"""Local HTTP job service behind the webpage's FASTQ analyzer.
+
+    python job_service.py [--port 8765] [--workers N] [--max-upload 20G] [-o jobs]
+    (or ``rna-seek serve``)
+
+Endpoints (JSON unless noted):
+
+    POST   /jobs                      multipart upload: ``file`` (FASTQ, optionally .gz), ``trim`` (1/0)
+    GET    /jobs/<id>                 job state: status, progress, queue position, reports
+    GET    /jobs/<id>/events          text/event-stream of the job state until it finishes
+    GET    /jobs/<id>/summary/<report>            structured QC summary (``raw`` or ``trimmed``)
+    GET    /jobs/<id>/charts/<report>/<page>.png  chart page 1 or 2, rendered on first request
+    GET    /jobs/<id>/trimmed         trimmed reads (FASTQ)
+    DELETE /jobs/<id>                 cancel a queued job or delete a finished one
+
+Uploads are streamed from the socket to disk in ``UPLOAD_CHUNK_SIZE``
+pieces, still compressed, so no upload is ever held in memory. Jobs run on
+a process pool of ``workers`` processes, fed by a queue that takes one job
+from each user in turn, so a user with many uploads cannot starve the
+others; each user also has a limit on jobs in the system and concurrent
+uploads. Users are told apart by client address, and a job is only visible
+to the user who uploaded it. Behind an authenticating reverse proxy, run
+with ``--trust-user-header`` to tell users apart by the ``X-User`` header
+instead; the proxy must set it on every request (replacing any value the
+client sent), since anyone who can reach the service directly can claim to
+be any user. Workers report progress through a small file per job, which
+the event streams poll.
+"""
+import argparse
+import json
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from email.message import Message
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from checkpoint import atomic_path, write_atomic
+from qc_summary import json_summary_path, summary_path, summary_stem
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_JOB_FOLDER = Path("jobs")
+DEFAULT_MAX_UPLOAD = 20 * 1024 ** 3
+# Jobs a user may have queued or running, and uploads a user may stream at once
+DEFAULT_JOBS_PER_USER = 4
+DEFAULT_UPLOADS_PER_USER = 2
+# Charts rendered at once across all requests
+DEFAULT_CHART_RENDERERS = 2
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_PART_HEADERS = 16 * 1024
+MAX_FIELD_SIZE = 1024
+# Seconds between progress polls of an event stream, and between keep-alive comments when nothing changes
+EVENT_POLL_INTERVAL = 0.5
+EVENT_KEEPALIVE = 15.0
+# Progress is written by the worker when it has moved on by at least this fraction
+PROGRESS_STEP = 0.01
+
+FASTQ_SUFFIXES = (".fastq", ".fq", ".fastq.gz", ".fq.gz")
+REPORTS = ("raw", "trimmed")
+CHART_PAGES = (1, 2)
+FINISHED = ("done", "failed", "cancelled")
+UPLOAD_FOLDER = "upload"
+REPORT_FOLDERS = {"raw": "quality_reports", "trimmed": "trimmed_reports"}
+TRIMMED_FOLDER = "trimmed_reads"
+PROGRESS_FILE = "progress"
+JOB_FILE = "job.json"
+# Set by an authenticating proxy in front of the service (see --trust-user-header)
+USER_HEADER = "X-User"
+
+
+class ServiceError(Exception):
+    """A request the service refuses, with the HTTP status to answer."""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class MultipartReader:
+    """Streaming ``multipart/form-data`` parser that reads at most ``length`` bytes from ``stream``.
+
+    ``next_part`` returns the headers of the next part (``None`` after the
+    last one) and ``read_part`` passes its body to a callback in chunks,
+    holding no more than one chunk plus the boundary in memory.
+    """
+
+    def __init__(self, stream: BinaryIO, boundary: bytes, length: int, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.stream = stream
+        self.remaining = length
+        self.chunk_size = chunk_size
+        self.delimiter = b"\r\n--" + boundary
+        # The first boundary has no leading line break; pretend it does
+        self.buffer = b"\r\n"
+        self.read_part(lambda data: None)
+
+    def _fill(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        data = self.stream.read(min(self.chunk_size, self.remaining))
+        if not data:
+            return False
+        self.remaining -= len(data)
+        self.buffer += data
+        return True
+
+    def _need(self, size: int) -> None:
+        while len(self.buffer) < size:
+            if not self._fill():
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "Truncated multipart body")
+
+    def next_part(self) -> Optional[Dict[str, str]]:
+        self._need(2)
+        if self.buffer.startswith(b"--"):
+            return None
+        if not self.buffer.startswith(b"\r\n"):
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Malformed multipart boundary")
+        while b"\r\n\r\n" not in self.buffer:
+            if len(self.buffer) > MAX_PART_HEADERS or not self._fill():
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "Malformed multipart part headers")
+        head, self.buffer = self.buffer[2:].split(b"\r\n\r\n", 1)
+        headers = {}
+        for line in head.decode("utf-8", "replace").split("\r\n"):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return headers
+
+    def read_part(self, write: Callable[[bytes], object]) -> None:
+        keep = len(self.delimiter) - 1
+        while True:
+            end = self.buffer.find(self.delimiter)
+            if end >= 0:
+                write(self.buffer[:end])
+                self.buffer = self.buffer[end + len(self.delimiter):]
+                return
+            if len(self.buffer) > keep:
+                write(self.buffer[:-keep])
+                self.buffer = self.buffer[-keep:]
+            if not self._fill():
+                raise ServiceError(HTTPStatus.BAD_REQUEST, "Truncated multipart body")
+
+
+def content_disposition(headers: Dict[str, str]):
+    """``(field name, file name or None)`` of a multipart part."""
+    message = Message()
+    message["content-disposition"] = headers.get("content-disposition", "")
+    return message.get_param("name", header="content-disposition"), message.get_filename()
+
+
+def run_job(upload: Path, folder: Path, trim: bool) -> Dict:
+    """Process-pool task: QC (and trimming plus QC of the trimmed reads) of one uploaded file.
+
+    Progress is written to the job's ``PROGRESS_FILE`` as the file is read.
+    Returns the trimming statistics (empty without trimming).
+    """
+    from fastqc import fastqc_analysis
+    from pipeline import fused_single_end, trimmed_path
+
+    last = [0.0]
+
+    def progress(fraction: float) -> None:
+        if fraction - last[0] >= PROGRESS_STEP or fraction >= 1.0:
+            last[0] = fraction
+            write_atomic(folder / PROGRESS_FILE, f"{fraction:.4f}")
+
+    raw_folder = folder / REPORT_FOLDERS["raw"]
+    raw_folder.mkdir(parents=True, exist_ok=True)
+    if not trim:
+        fastqc_analysis(upload, raw_folder, render_plots=False, progress=progress)
+        if not summary_path(upload, raw_folder).exists():
+            raise RuntimeError(f"Quality analysis of {upload.name} failed")
+        return {}
+    trimmed_folder = folder / REPORT_FOLDERS["trimmed"]
+    trimmed_folder.mkdir(parents=True, exist_ok=True)
+    (folder / TRIMMED_FOLDER).mkdir(parents=True, exist_ok=True)
+    stats = fused_single_end(upload, trimmed_path(folder / TRIMMED_FOLDER, "trimmed_", upload), raw_folder,
+                             trimmed_folder, show_progress=False, render_plots=False, progress=progress)
+    return vars(stats)
+
+
+class Job:
+    """One uploaded file and its place in the service."""
+
+    def __init__(self, user: str, name: str, folder: Path, trim: bool):
+        self.id = folder.name
+        self.user = user
+        self.name = name
+        self.folder = folder
+        self.trim = trim
+        self.status = "queued"
+        self.error = None
+        self.stats = {}
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def upload(self) -> Path:
+        return self.folder / UPLOAD_FOLDER / self.name
+
+    @property
+    def reports(self) -> List[str]:
+        return list(REPORTS) if self.trim else ["raw"]
+
+    def report_file(self, report: str) -> Path:
+        """The file a report's summaries are named after (the upload or the trimmed reads)."""
+        if report == "raw":
+            return self.upload
+        from pipeline import trimmed_path
+        return trimmed_path(self.folder / TRIMMED_FOLDER, "trimmed_", self.upload)
+
+    def progress(self) -> float:
+        if self.status == "done":
+            return 1.0
+        try:
+            return float((self.folder / PROGRESS_FILE).read_text())
+        except (OSError, ValueError):
+            return 0.0
+
+    def state(self, position: Optional[int] = None) -> Dict:
+        state = {"id": self.id, "name": self.name, "trim": self.trim, "status": self.status,
+                 "progress": round(self.progress(), 4), "position": position, "error": self.error,
+                 "created": self.created, "started": self.started, "finished": self.finished}
+        if self.status == "done":
+            state["reports"] = {report: {"summary": f"/jobs/{self.id}/summary/{report}",
+                                         "charts": [f"/jobs/{self.id}/charts/{report}/{page}.png"
+                                                    for page in CHART_PAGES]}
+                                for report in self.reports}
+            state["stats"] = self.stats
+            if self.trim:
+                state["trimmed"] = f"/jobs/{self.id}/trimmed"
+        return state
+
+
+class JobService:
+    """Jobs, their fair queue and the process pool that runs them.
+
+    Queued jobs wait in one FIFO per user; whenever a worker is free the
+    next job is taken from the user whose last job started longest ago
+    (round robin). ``changed`` is notified on every status change.
+    """
+
+    def __init__(self, folder: Path = DEFAULT_JOB_FOLDER, workers: int = 1, max_upload: int = DEFAULT_MAX_UPLOAD,
+                 jobs_per_user: int = DEFAULT_JOBS_PER_USER, uploads_per_user: int = DEFAULT_UPLOADS_PER_USER,
+                 chart_renderers: int = DEFAULT_CHART_RENDERERS):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.workers = max(1, workers)
+        self.max_upload = max_upload
+        self.jobs_per_user = jobs_per_user
+        self.uploads_per_user = uploads_per_user
+        self.jobs: Dict[str, Job] = {}
+        self.queues: Dict[str, deque] = {}
+        # Dispatch count at which each user last had a job started
+        self.served: Dict[str, int] = {}
+        self.dispatched = 0
+        self.uploads: Dict[str, int] = {}
+        self.running = 0
+        # Reentrant: a job that fails at once finishes inside ``_dispatch``
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.charts = threading.Semaphore(max(1, chart_renderers))
+        self.chart_locks: Dict[str, threading.Lock] = {}
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def job(self, job_id: str, user: Optional[str] = None) -> Job:
+        """The job ``job_id``; with a ``user``, only if that user submitted it (other users' jobs are not found)."""
+        job = self.jobs.get(job_id)
+        if job is None or (user is not None and job.user != user):
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"No job {job_id}")
+        return job
+
+    def _active(self, user: str) -> int:
+        return sum(job.user == user and job.status not in FINISHED for job in self.jobs.values())
+
+    def _turns(self) -> List[str]:
+        """Users with queued jobs, the one served longest ago (or never) first."""
+        return sorted(self.queues, key=lambda user: self.served.get(user, 0))
+
+    def queue_order(self) -> List[Job]:
+        """Queued jobs in the order they will start."""
+        queues = [self.queues[user] for user in self._turns()]
+        return [queue[depth] for depth in range(max(map(len, queues), default=0))
+                for queue in queues if depth < len(queue)]
+
+    def state(self, job: Job) -> Dict:
+        with self.lock:
+            position = self.queue_order().index(job) if job.status == "queued" else None
+            return job.state(position)
+
+    def submit(self, user: str, stream: BinaryIO, content_type: str, length: Optional[int]) -> Job:
+        """Stream a multipart upload to a new job's folder and queue the job."""
+        if length is None:
+            raise ServiceError(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+        if length > self.max_upload:
+            raise ServiceError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                               f"Uploads are limited to {self.max_upload / 2 ** 30:.1f} GiB")
+        message = Message()
+        message["content-type"] = content_type or ""
+        boundary = message.get_param("boundary")
+        if message.get_content_type() != "multipart/form-data" or not boundary:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "Expected a multipart/form-data upload")
+        with self.lock:
+            if self._active(user) + self.uploads.get(user, 0) >= self.jobs_per_user:
+                raise ServiceError(HTTPStatus.TOO_MANY_REQUESTS,
+                                   f"At most {self.jobs_per_user} jobs per user may be queued or running")
+            if self.uploads.get(user, 0) >= self.uploads_per_user:
+                raise ServiceError(HTTPStatus.TOO_MANY_REQUESTS,
+                                   f"At most {self.uploads_per_user} uploads per user at a time")
+            self.uploads[user] = self.uploads.get(user, 0) + 1
+
+        folder = self.folder / uuid.uuid4().hex
+        try:
+            name, fields = self._receive(MultipartReader(stream, boundary.encode("latin-1"), length),
+                                         folder / UPLOAD_FOLDER)
+        except BaseException:
+            shutil.rmtree(folder, ignore_errors=True)
+            raise
+        finally:
+            with self.lock:
+                self.uploads[user] -= 1
+
+        job = Job(user, name, folder, trim=fields.get("trim", "1").lower() not in ("0", "false", "no", "off"))
+        with self.changed:
+            self.jobs[job.id] = job
+            self.queues.setdefault(user, deque()).append(job)
+            self._dispatch()
+            self.changed.notify_all()
+        write_atomic(folder / JOB_FILE, json.dumps({"user": user, **job.state()}, indent=2))
+        print(f"Job {job.id}: {name} from {user} ({job.upload.stat().st_size} bytes)")
+        return job
+
+    @staticmethod
+    def _receive(reader: MultipartReader, upload_folder: Path):
+        """Write the ``file`` part to ``upload_folder``; returns its name and the small form fields."""
+        name, fields = None, {}
+        while True:
+            headers = reader.next_part()
+            if headers is None:
+                break
+            field, filename = content_disposition(headers)
+            if field == "file" and filename and name is None:
+                name = Path(filename.replace("\\", "/")).name
+                if not name.lower().endswith(FASTQ_SUFFIXES) or name.startswith("."):
+                    raise ServiceError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+                                       "Expected a .fastq, .fq, .fastq.gz or .fq.gz file")
+                upload_folder.mkdir(parents=True, exist_ok=True)
+                with atomic_path(upload_folder / name) as temporary, open(temporary, "wb") as handle:
+                    reader.read_part(handle.write)
+            else:
+                value = bytearray()
+
+                def collect(data: bytes) -> None:
+                    value.extend(data)
+                    if len(value) > MAX_FIELD_SIZE:
+                        raise ServiceError(HTTPStatus.BAD_REQUEST, f"Form field '{field}' is too long")
+
+                reader.read_part(collect)
+                if field:
+                    fields[field] = value.decode("utf-8", "replace")
+        if name is None:
+            raise ServiceError(HTTPStatus.BAD_REQUEST, "No 'file' in the upload")
+        return name, fields
+
+    def _dispatch(self) -> None:
+        """Start queued jobs while workers are free (called with the lock held)."""
+        while self.running < self.workers and self.queues:
+            user = self._turns()[0]
+            queue = self.queues[user]
+            job = queue.popleft()
+            if not queue:
+                del self.queues[user]
+            self.dispatched += 1
+            self.served[user] = self.dispatched
+            job.status, job.started = "running", time.time()
+            self.running += 1
+            future = self.executor.submit(run_job, job.upload, job.folder, job.trim)
+            future.add_done_callback(lambda future, job=job: self._finished(job, future))
+
+    def _finished(self, job: Job, future) -> None:
+        with self.changed:
+            self.running -= 1
+            job.finished = time.time()
+            try:
+                job.stats = future.result()
+                job.status = "done"
+            except Exception as e:
+                job.status, job.error = "failed", str(e)
+            self._dispatch()
+            self.changed.notify_all()
+        write_atomic(job.folder / JOB_FILE, json.dumps({"user": job.user, **job.state()}, indent=2, default=str))
+        print(f"Job {job.id}: {job.status}{f' ({job.error})' if job.error else ''}")
+
+    def delete(self, job_id: str, user: Optional[str] = None) -> None:
+        """Cancel a queued job or delete a finished one with its files."""
+        with self.changed:
+            job = self.job(job_id, user)
+            if job.status == "running":
+                raise ServiceError(HTTPStatus.CONFLICT, "A running job cannot be cancelled")
+            if job.status == "queued":
+                queue = self.queues[job.user]
+                queue.remove(job)
+                if not queue:
+                    del self.queues[job.user]
+                job.status, job.finished = "cancelled", time.time()
+                self.changed.notify_all()
+            del self.jobs[job_id]
+        shutil.rmtree(job.folder, ignore_errors=True)
+
+    def summary(self, job_id: str, report: str, user: Optional[str] = None) -> Path:
+        job = self._done(job_id, report, user)
+        return json_summary_path(job.report_file(report), job.folder / REPORT_FOLDERS[report])
+
+    def chart(self, job_id: str, report: str, page: int, user: Optional[str] = None) -> Path:
+        """A chart page, rendered from the job's summary the first time it is asked for."""
+        from plots import PLOT_FOLDER, chart_paths, is_stale, render_summary_file
+
+        job = self._done(job_id, report, user)
+        if page not in CHART_PAGES:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"No chart page {page}")
+        summary = summary_path(job.report_file(report), job.folder / REPORT_FOLDERS[report])
+        with self.lock:
+            lock = self.chart_locks.setdefault(str(summary), threading.Lock())
+        with lock:
+            if is_stale(summary):
+                with self.charts:
+                    render_summary_file(summary)
+        return chart_paths(summary.parent / PLOT_FOLDER, summary_stem(summary))[page - 1]
+
+    def trimmed(self, job_id: str, user: Optional[str] = None) -> Path:
+        return self._done(job_id, "trimmed", user).report_file("trimmed")
+
+    def _done(self, job_id: str, report: str, user: Optional[str] = None) -> Job:
+        job = self.job(job_id, user)
+        if job.status != "done":
+            raise ServiceError(HTTPStatus.CONFLICT, f"Job {job_id} is {job.status}")
+        if report not in job.reports:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"Job {job_id} has no {report} report")
+        return job
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a ``JobService`` (``self.server.service``)."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "rna-seek-jobs"
+
+    @property
+    def service(self) -> JobService:
+        return self.server.service
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _cors(self) -> None:
+        self.send_header("Access-Control-Allow-Origin", self.server.allow_origin)
+        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self.send_header("Access-Control-Allow-Methods", "GET, POST, DELETE, OPTIONS")
+
+    def _json(self, data, status: HTTPStatus = HTTPStatus.OK) -> None:
+        body = json.dumps(data, default=str).encode()
+        self.send_response(status)
+        self._cors()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _file(self, path: Path, content_type: str) -> None:
+        if not path.exists():
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"{path.name} is missing")
+        self.send_response(HTTPStatus.OK)
+        self._cors()
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(path.stat().st_size))
+        if content_type == "application/octet-stream":
+            self.send_header("Content-Disposition", f'attachment; filename="{path.name}"')
+        self.end_headers()
+        with open(path, "rb") as handle:
+            shutil.copyfileobj(handle, self.wfile, UPLOAD_CHUNK_SIZE)
+
+    def _user(self) -> str:
+        """The user a request is from: its client address, or the proxy's ``USER_HEADER`` when that is trusted."""
+        if not self.server.trust_user_header:
+            return self.client_address[0]
+        user = self.headers.get(USER_HEADER)
+        if not user:
+            raise ServiceError(HTTPStatus.UNAUTHORIZED, f"Missing {USER_HEADER} header")
+        return user
+
+    def _route(self, method: str) -> None:
+        parts = [part for part in urlparse(self.path).path.split("/") if part]
+        user = self._user()
+        if method == "POST" and parts == ["jobs"]:
+            length = self.headers.get("Content-Length")
+            job = self.service.submit(user, self.rfile, self.headers.get("Content-Type"),
+                                      int(length) if length is not None else None)
+            self._json(self.service.state(job), HTTPStatus.ACCEPTED)
+        elif method == "DELETE" and len(parts) == 2 and parts[0] == "jobs":
+            self.service.delete(parts[1], user)
+            self._json({"id": parts[1], "deleted": True})
+        elif method != "GET" or len(parts) < 2 or parts[0] != "jobs":
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"No route {method} {self.path}")
+        elif len(parts) == 2:
+            self._json(self.service.state(self.service.job(parts[1], user)))
+        elif parts[2:] == ["events"]:
+            self._events(self.service.job(parts[1], user))
+        elif len(parts) == 4 and parts[2] == "summary":
+            self._file(self.service.summary(parts[1], parts[3], user), "application/json")
+        elif len(parts) == 5 and parts[2] == "charts" and parts[4] in ("1.png", "2.png"):
+            self._file(self.service.chart(parts[1], parts[3], int(parts[4][0]), user), "image/png")
+        elif parts[2:] == ["trimmed"]:
+            self._file(self.service.trimmed(parts[1], user), "application/octet-stream")
+        else:
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"No route {method} {self.path}")
+
+    def _events(self, job: Job) -> None:
+        """Server-sent ``state`` events whenever the job's state changes, until it finishes."""
+        self.send_response(HTTPStatus.OK)
+        self._cors()
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        last, sent = None, time.monotonic()
+        while True:
+            state = self.service.state(job)
+            if state != last:
+                self.wfile.write(f"event: state\ndata: {json.dumps(state, default=str)}\n\n".encode())
+                self.wfile.flush()
+                last, sent = state, time.monotonic()
+            elif time.monotonic() - sent > EVENT_KEEPALIVE:
+                self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+                sent = time.monotonic()
+            if state["status"] in FINISHED:
+                return
+            with self.service.changed:
+                self.service.changed.wait(EVENT_POLL_INTERVAL)
+
+    def _handle(self, method: str) -> None:
+        try:
+            self._route(method)
+        except ServiceError as e:
+            # An upload refused before its body was read leaves the body on the connection
+            self.close_connection = True
+            self._json({"error": str(e)}, e.status)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except Exception as e:
+            self.close_connection = True
+            print(f"Error handling {method} {self.path}: {str(e)}")
+            self._json({"error": str(e)}, HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def do_DELETE(self) -> None:
+        self._handle("DELETE")
+
+    def do_OPTIONS(self) -> None:
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self._cors()
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def serve(folder: Path = DEFAULT_JOB_FOLDER, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+          workers: Optional[int] = None, max_upload: int = DEFAULT_MAX_UPLOAD,
+          jobs_per_user: int = DEFAULT_JOBS_PER_USER, allow_origin: str = "*", trust_user_header: bool = False) -> None:
+    """Run the job service until interrupted; ``workers`` defaults to the available CPUs.
+
+    ``trust_user_header`` tells users apart by ``USER_HEADER`` instead of
+    client address; only for a service reachable solely through an
+    authenticating proxy that sets it (see the module docstring).
+    """
+    from scheduler import available_cpus
+
+    service = JobService(folder, workers or available_cpus(), max_upload, jobs_per_user)
+    server = ThreadingHTTPServer((host, port), JobHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.allow_origin = allow_origin
+    server.trust_user_header = trust_user_header
+    print(f"Job service on http://{host}:{server.server_port} ({service.workers} worker(s), jobs in {folder})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+def main():
+    from cli import parse_size
+
+    parser = argparse.ArgumentParser(description="Local HTTP job service for the webpage's FASTQ analyzer.")
+    parser.add_argument("-o", "--output", type=Path, default=DEFAULT_JOB_FOLDER, help="folder for job files")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument("--workers", type=int, help="concurrent jobs (default: CPU count)")
+    parser.add_argument("--max-upload", type=parse_size, default=DEFAULT_MAX_UPLOAD, metavar="SIZE",
+                        help="largest accepted upload, e.g. 20G")
+    parser.add_argument("--jobs-per-user", type=int, default=DEFAULT_JOBS_PER_USER,
+                        help="jobs a user may have queued or running")
+    parser.add_argument("--allow-origin", default="*", help="Access-Control-Allow-Origin for the webpage")
+    parser.add_argument("--trust-user-header", action="store_true",
+                        help=f"tell users apart by the {USER_HEADER} header set by an authenticating proxy")
+    args = parser.parse_args()
+    serve(args.output, args.host, args.port, args.workers, args.max_upload, args.jobs_per_user, args.allow_origin,
+          args.trust_user_header)
+
+
+if __name__ == "__main__":
+    main()
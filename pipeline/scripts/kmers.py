@@ -0,0 +1,305 @@
+"""K-mer content: positional k-mer counts and FastQC-style enrichment tests.
+
+Every read of a batch is 2-bit encoded and all of its k-mer windows are
+turned into integer codes at once with NumPy shifts, then counted per
+position group (single bases at the start of the read, where priming
+biases show, wider groups further in; see ``POSITION_GROUP_STEPS``). Up to
+``DENSE_MAX_K`` the counts live in a dense ``(groups, 4**k)`` array; longer
+k-mers go to an open-addressing ``CountTable`` that only holds the
+(k-mer, group) pairs actually seen.
+
+A k-mer is enriched at a position group when it occurs there more often
+than its overall frequency predicts. As in FastQC, the one-sided binomial
+p-value of the observed count is Bonferroni-corrected for the ``4**k``
+possible k-mers, and k-mers below ``KMER_P_VALUE`` are reported by their
+largest observed/expected ratio.
+"""
+import math
+from typing import Dict, Tuple
+
+import numpy as np
+
+DEFAULT_KMER_SIZE = 7
+# Largest k counted in a dense array (4**7 k-mers x 30 groups of int64 is about 4 MB)
+DENSE_MAX_K = 7
+# k-mer codes are built in uint32
+MAX_KMER_SIZE = 16
+# Only k-mers starting in the first KMER_MAX_POSITION bases are counted (up to the last whole group)
+KMER_MAX_POSITION = 500
+# (first base, group size) from that base on, 1-based
+POSITION_GROUP_STEPS = ((1, 1), (10, 5), (50, 10), (100, 50))
+# Corrected p-value below which a k-mer counts as enriched, and how many are reported
+KMER_P_VALUE = 0.01
+KMER_REPORT = 20
+# Only cells this many standard deviations above their expected count get an exact p-value; a corrected
+# p-value below KMER_P_VALUE needs far more (about 5 standard deviations at k = 7)
+CANDIDATE_Z = 3.0
+# Terms of the binomial tail summed before the rest is bounded geometrically
+MAX_TAIL_TERMS = 2000
+
+# 2-bit codes from the ASCII bits ((base >> 1) & 3 for upper-case A, C, T, G), so no lookup table is needed
+CODE_BASES = "ACTG"
+VALID_BASES = tuple(map(ord, CODE_BASES))
+
+
+def _position_groups() -> Tuple[np.ndarray, np.ndarray]:
+    """1-based first and last base of each whole position group within ``KMER_MAX_POSITION``."""
+    starts, ends = [], []
+    position, size = 1, 1
+    steps = dict(POSITION_GROUP_STEPS)
+    while position + steps.get(position, size) - 1 <= KMER_MAX_POSITION:
+        size = steps.get(position, size)
+        starts.append(position)
+        ends.append(position + size - 1)
+        position += size
+    return np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+
+
+GROUP_STARTS, GROUP_ENDS = _position_groups()
+# Group of each 0-based window start
+GROUP_OF = np.repeat(np.arange(len(GROUP_STARTS)), GROUP_ENDS - GROUP_STARTS + 1)
+# Bits of a hashed-table key holding the group (the k-mer code is shifted above them)
+GROUP_BITS = int(len(GROUP_STARTS) - 1).bit_length()
+
+
+def group_label(group: int) -> str:
+    start, end = int(GROUP_STARTS[group]), int(GROUP_ENDS[group])
+    return str(start) if start == end else f"{start}-{end}"
+
+
+def decode_kmer(code: int, k: int) -> str:
+    return "".join(CODE_BASES[(code >> (2 * (k - 1 - i))) & 3] for i in range(k))
+
+
+def window_codes(seqs: np.ndarray, lengths: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Codes of the k-mer windows starting in the first ``KMER_MAX_POSITION`` bases of each read.
+
+    ``seqs`` is a padded upper-case ASCII matrix. Returns ``(codes, valid)``
+    of shape ``(n, windows)``; a window is invalid when it runs past the end
+    of its read or contains a base other than A/C/G/T.
+    """
+    windows = min(seqs.shape[1] - k + 1, len(GROUP_OF))
+    if windows <= 0:
+        return np.zeros((len(seqs), 0), dtype=np.uint32), np.zeros((len(seqs), 0), dtype=bool)
+    seqs = seqs[:, :windows + k - 1]
+    bits = (seqs >> 1) & 3
+    codes = bits[:, :windows].astype(np.uint16 if k <= 8 else np.uint32)
+    for j in range(1, k):
+        codes <<= 2
+        codes |= bits[:, j:j + windows]
+    valid = np.arange(windows) <= (lengths - k)[:, None]
+    # Reads with N (or other IUPAC codes): drop every window that covers one
+    other = (seqs != 0) & (seqs != VALID_BASES[0]) & (seqs != VALID_BASES[1]) & (seqs != VALID_BASES[2]) \
+        & (seqs != VALID_BASES[3])
+    rows = np.flatnonzero(other.any(axis=1))
+    if len(rows):
+        seen = np.zeros((len(rows), seqs.shape[1] + 1), dtype=np.int32)
+        np.cumsum(other[rows], axis=1, out=seen[:, 1:])
+        valid[rows] &= seen[:, k:k + windows] == seen[:, :windows]
+    return codes, valid
+
+
+def binomial_tail(observed: np.ndarray, trials: np.ndarray, p: np.ndarray) -> np.ndarray:
+    """``P(X >= observed)`` for ``X ~ Binomial(trials, p)``, elementwise, for counts above the mean.
+
+    The tail is summed from the observed count upwards; above the mean each
+    term is a shrinking multiple of the last, so few terms are needed.
+    """
+    lgamma = np.vectorize(math.lgamma, otypes=[np.float64])
+    x = observed.astype(np.float64)
+    n = trials.astype(np.float64)
+    log_pmf = lgamma(n + 1) - lgamma(x + 1) - lgamma(n - x + 1) + x * np.log(p) + (n - x) * np.log1p(-p)
+    odds = p / (1 - p)
+    total = np.ones_like(x)
+    term = np.ones_like(x)
+    ratio = np.zeros_like(x)
+    for _ in range(MAX_TAIL_TERMS):
+        ratio = np.maximum(n - x, 0) / (x + 1) * odds
+        term *= ratio
+        total += term
+        x += 1
+        if (term <= 1e-12 * total).all():
+            break
+    else:
+        total += np.where(ratio < 1, term * ratio / np.maximum(1 - ratio, 1e-300), 0.0)
+    return np.minimum(np.exp(log_pmf) * total, 1.0)
+
+
+class CountTable:
+    """Counts of non-negative int64 keys in an open-addressing hash table (linear probing) of NumPy arrays.
+
+    Uses 16 bytes per slot and is kept at most half full. Keys of a batch
+    are inserted together: each round, every pending key looks at its slot
+    and either adds to its own entry, claims an empty slot or moves on.
+    """
+
+    def __init__(self, capacity: int = 1 << 16):
+        self.keys = np.full(capacity, -1, dtype=np.int64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+
+    def _slots(self, keys: np.ndarray) -> np.ndarray:
+        """Fibonacci hashing onto the table's power-of-two capacity."""
+        shift = np.uint64(64 - (len(self.keys).bit_length() - 1))
+        with np.errstate(over="ignore"):
+            return ((keys.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> shift).astype(np.int64)
+
+    def _resize(self, capacity: int) -> None:
+        keys, counts = self.items()
+        self.keys = np.full(capacity, -1, dtype=np.int64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        self._insert(keys, counts)
+
+    def add(self, keys: np.ndarray, counts: np.ndarray) -> None:
+        """Add ``counts`` to the entries of ``keys`` (keys must be distinct)."""
+        capacity = len(self.keys)
+        while (self.size + len(keys)) * 2 > capacity:
+            capacity *= 2
+        if capacity != len(self.keys):
+            self._resize(capacity)
+        self._insert(keys, counts)
+
+    def _insert(self, keys: np.ndarray, counts: np.ndarray) -> None:
+        mask = len(self.keys) - 1
+        slots = self._slots(keys)
+        pending = np.arange(len(keys))
+        while len(pending):
+            current = self.keys[slots[pending]]
+            hit = current == keys[pending]
+            self.counts[slots[pending[hit]]] += counts[pending[hit]]
+            empty = np.flatnonzero(current == -1)
+            # Several keys may want the same empty slot; the first takes it and the others probe on
+            _, first = np.unique(slots[pending[empty]], return_index=True)
+            winners = pending[empty[first]]
+            self.keys[slots[winners]] = keys[winners]
+            self.counts[slots[winners]] = counts[winners]
+            self.size += len(winners)
+            remaining = ~hit
+            remaining[empty[first]] = False
+            moving = pending[remaining & (current != -1)]
+            slots[moving] = (slots[moving] + 1) & mask
+            pending = pending[remaining]
+
+    def items(self) -> Tuple[np.ndarray, np.ndarray]:
+        used = self.keys >= 0
+        return self.keys[used], self.counts[used]
+
+    def merge(self, other: "CountTable") -> None:
+        self.add(*other.items())
+
+
+class KmerCounter:
+    """Per-position-group counts of the k-mers of every read added."""
+
+    def __init__(self, k: int = DEFAULT_KMER_SIZE):
+        if not 1 <= k <= MAX_KMER_SIZE:
+            raise ValueError(f"k-mer size must be between 1 and {MAX_KMER_SIZE}, got {k}")
+        self.k = k
+        self.dense = k <= DENSE_MAX_K
+        if self.dense:
+            self.counts = np.zeros((0, 4 ** k), dtype=np.int64)
+        else:
+            self.table = CountTable()
+
+    def _grow(self, groups: int) -> None:
+        if groups > len(self.counts):
+            self.counts = np.vstack([self.counts, np.zeros((groups - len(self.counts), 4 ** self.k), dtype=np.int64)])
+
+    def add(self, seqs: np.ndarray, lengths: np.ndarray) -> None:
+        """Count the k-mers of a padded upper-case ASCII matrix of reads."""
+        codes, valid = window_codes(seqs, lengths, self.k)
+        if not codes.size:
+            return
+        groups = GROUP_OF[:codes.shape[1]]
+        if self.dense:
+            kmers = 4 ** self.k
+            used = int(groups[-1]) + 1
+            self._grow(used)
+            index = groups * kmers + codes
+            # Invalid windows are counted in a spare group that is dropped
+            index[~valid] = used * kmers
+            self.counts[:used] += np.bincount(index.ravel(), minlength=(used + 1) * kmers)[:-kmers].reshape(used, -1)
+        else:
+            keys = (codes.astype(np.int64) << GROUP_BITS) | groups
+            keys, counts = np.unique(keys[valid], return_counts=True)
+            self.table.add(keys, counts)
+
+    def merge(self, other: "KmerCounter") -> "KmerCounter":
+        if self.dense:
+            self._grow(len(other.counts))
+            self.counts[:len(other.counts)] += other.counts
+        else:
+            self.table.merge(other.table)
+        return self
+
+    def _cells(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """``(code, group, count)`` of every k-mer seen, one entry per group it was seen in."""
+        if self.dense:
+            groups, codes = np.nonzero(self.counts)
+            return codes.astype(np.int64), groups.astype(np.int64), self.counts[groups, codes]
+        keys, counts = self.table.items()
+        return keys >> GROUP_BITS, keys & ((1 << GROUP_BITS) - 1), counts
+
+    def enriched(self, limit: int = KMER_REPORT) -> Dict:
+        """The ``limit`` k-mers with the strongest significant positional enrichment.
+
+        Expected counts assume every k-mer is spread over the read in
+        proportion to the k-mers counted at each position group. Each entry
+        has the k-mer's total count, its smallest corrected p-value and its
+        largest observed/expected ratio with the group where it occurs;
+        ``obs_exp`` holds the ratio at every group for the chart.
+        """
+        codes, groups, counts = self._cells()
+        group_totals = np.bincount(groups, weights=counts, minlength=1)
+        result = {'kmer_size': self.k, 'group_starts': GROUP_STARTS[:len(group_totals)],
+                  'group_ends': GROUP_ENDS[:len(group_totals)],
+                  'sequences': [], 'counts': np.zeros(0, dtype=np.int64), 'pvalues': np.zeros(0),
+                  'max_obs_exp': np.zeros(0), 'max_positions': np.zeros(0, dtype=np.int64),
+                  'obs_exp': np.zeros((0, len(group_totals)))}
+        total = counts.sum()
+        if total == 0:
+            return result
+
+        unique_codes, kmer_ids = np.unique(codes, return_inverse=True)
+        kmer_totals = np.bincount(kmer_ids, weights=counts)
+        p = kmer_totals[kmer_ids] / total
+        trials = group_totals[groups]
+        expected = trials * p
+        candidates = np.flatnonzero((counts - expected) > CANDIDATE_Z * np.sqrt(expected * (1 - p)))
+        if not len(candidates):
+            return result
+        pvalues = binomial_tail(counts[candidates], trials[candidates], p[candidates]) * 4.0 ** self.k
+        significant = candidates[pvalues < KMER_P_VALUE]
+        if not len(significant):
+            return result
+        pvalues = pvalues[pvalues < KMER_P_VALUE]
+
+        # Per k-mer: the group with the highest observed/expected ratio and the smallest p-value
+        ratio = counts[significant] / expected[significant]
+        ids = kmer_ids[significant]
+        order = np.lexsort((-ratio, ids))
+        first = order[np.r_[True, ids[order][1:] != ids[order][:-1]]]
+        best_pvalue = np.full(len(unique_codes), np.inf)
+        np.minimum.at(best_pvalue, ids, pvalues)
+        top = first[np.argsort(-ratio[first], kind='stable')][:limit]
+        top_ids = ids[top]
+
+        obs_exp = np.full((len(top_ids), len(group_totals)), np.nan)
+        row_of = np.full(len(unique_codes), -1)
+        row_of[top_ids] = np.arange(len(top_ids))
+        rows = row_of[kmer_ids]
+        shown = rows >= 0
+        covered = group_totals > 0
+        obs_exp[:, covered] = 0.0
+        obs_exp[rows[shown], groups[shown]] = counts[shown] / expected[shown]
+
+        result.update({
+            'sequences': [decode_kmer(int(code), self.k) for code in unique_codes[top_ids]],
+            'counts': kmer_totals[top_ids].astype(np.int64),
+            'pvalues': best_pvalue[top_ids],
+            'max_obs_exp': ratio[top],
+            'max_positions': GROUP_STARTS[groups[significant[top]]],
+            'obs_exp': obs_exp,
+        })
+        return result
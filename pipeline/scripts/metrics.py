@@ -0,0 +1,315 @@
+"""Run instrumentation: named stage timers, counters, peak memory and opt-in profiling.
+
+Code marks its stages and counts what it processes through the
+process-wide ``METRICS`` registry:
+
+    with METRICS.stage("qc.adapters"):
+        ...
+    METRICS.count("reads_in", len(batch))
+
+Nothing is recorded until ``METRICS.enable()`` is called; while disabled a
+stage is a shared no-op context manager and a count returns immediately.
+Stage names are dotted (``trim.quality`` is part of ``trim``) and nested
+stages are timed independently, so their times overlap. Stages that run on
+several threads at once (e.g. trimming workers) add up the time of every
+thread.
+
+``write_metrics`` saves a run's metrics as JSON and ``write_prometheus``
+as a Prometheus textfile-collector file. Selected stages can additionally
+be profiled with cProfile or with a sampling profiler (collapsed stacks,
+as read by flamegraph.pl and speedscope).
+"""
+import cProfile
+import json
+import resource
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, TypeVar
+
+from checkpoint import write_atomic
+
+T = TypeVar("T")
+
+METRICS_FILE = "run_metrics.json"
+METRICS_VERSION = 1
+PROMETHEUS_PREFIX = "rnaseek"
+PROFILERS = ("cprofile", "sampling")
+# Seconds between two stack samples of the sampling profiler
+SAMPLING_INTERVAL = 0.005
+
+_DISABLED = nullcontext()
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident memory of this process in bytes."""
+    if sys.platform == "darwin":
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        # Unlike ru_maxrss, VmHWM is not carried over from a parent process
+        with open("/proc/self/status", "r") as handle:
+            return next(int(line.split()[1]) for line in handle if line.startswith("VmHWM:")) * 1024
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SamplingProfiler:
+    """Samples the call stack of one thread every ``interval`` seconds from a background thread.
+
+    Costs one stack walk per sample instead of a hook on every call, so it
+    barely slows the profiled code. Samples are kept as collapsed stacks
+    (``outer;inner;leaf count``).
+    """
+
+    def __init__(self, interval: float = SAMPLING_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, thread_id: Optional[int] = None) -> None:
+        if self._thread is not None:
+            raise ValueError("sampling profiler is already running")
+        target = thread_id if thread_id is not None else threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, args=(target,), name="stage-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _sample(self, target: int) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                return
+            stack = [f"{entry.name} ({Path(entry.filename).name}:{entry.lineno})"
+                     for entry in traceback.extract_stack(frame)]
+            self.stacks[";".join(stack)] += 1
+
+    def save(self, path: Path) -> None:
+        write_atomic(path, "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()))
+
+
+class Metrics:
+    """Stage timers and counters of one process, plus the profiles of selected stages.
+
+    ``label`` names the unit of work being measured (e.g. a sample) in
+    profile file names; ``reset`` starts a new unit.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.label = "run"
+        self.profile_stages: Dict[str, str] = {}
+        self.profile_folder: Optional[Path] = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, label: Optional[str] = None) -> None:
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self._profilers: Dict[str, object] = {}
+        self._started = time.perf_counter()
+        if label is not None:
+            self.label = label
+
+    def enable(self, profile: Optional[Dict[str, str]] = None, profile_folder: Optional[Path] = None) -> None:
+        """Start recording; ``profile`` maps stage names to ``"cprofile"`` or ``"sampling"``."""
+        profile = dict(profile or {})
+        unknown = sorted(set(profile.values()) - set(PROFILERS))
+        if unknown:
+            raise ValueError(f"Unknown profiler(s) {', '.join(unknown)} (expected one of {', '.join(PROFILERS)})")
+        self.enabled = True
+        self.profile_stages = profile
+        self.profile_folder = Path(profile_folder) if profile_folder is not None else None
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def stage(self, name: str):
+        """Context manager timing one execution of stage ``name`` (a no-op while disabled)."""
+        if not self.enabled:
+            return _DISABLED
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str) -> Iterator[None]:
+        profiler = self._start_profiler(name) if name in self.profile_stages else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                self._stop_profiler(profiler)
+            with self._lock:
+                self.seconds[name] += elapsed
+                self.calls[name] += 1
+
+    def timed_iter(self, name: str, items: Iterable[T]) -> Iterable[T]:
+        """``items`` with the time spent producing each item recorded under stage ``name``."""
+        if not self.enabled:
+            return items
+        return self._timed_iter(name, items)
+
+    def _timed_iter(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        iterator = iter(items)
+        while True:
+            with self.stage(name):
+                item = next(iterator, _DISABLED)
+            if item is _DISABLED:
+                return
+            yield item
+
+    def count(self, name: str, value: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += value
+
+    def _start_profiler(self, name: str):
+        with self._lock:
+            profiler = self._profilers.get(name)
+            if profiler is None:
+                profiler = cProfile.Profile() if self.profile_stages[name] == "cprofile" else SamplingProfiler()
+                self._profilers[name] = profiler
+        try:
+            if isinstance(profiler, SamplingProfiler):
+                profiler.start()
+            else:
+                profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread (a profiled stage nested in another)
+            return None
+        return profiler
+
+    @staticmethod
+    def _stop_profiler(profiler) -> None:
+        if isinstance(profiler, SamplingProfiler):
+            profiler.stop()
+        else:
+            profiler.disable()
+
+    def save_profiles(self) -> Dict[str, Path]:
+        """Write the profiles collected since the last reset to ``profile_folder``; returns the files by stage."""
+        if self.profile_folder is None or not self._profilers:
+            return {}
+        self.profile_folder.mkdir(parents=True, exist_ok=True)
+        saved = {}
+        for name, profiler in self._profilers.items():
+            if isinstance(profiler, SamplingProfiler):
+                path = self.profile_folder / f"{self.label}_{name}.collapsed"
+                profiler.save(path)
+            else:
+                path = self.profile_folder / f"{self.label}_{name}.prof"
+                profiler.dump_stats(path)
+            saved[name] = path
+        return saved
+
+    def snapshot(self) -> Dict:
+        """Everything recorded since the last reset, as plain JSON-serializable data."""
+        with self._lock:
+            stages = {name: {"seconds": round(self.seconds[name], 6), "calls": self.calls[name]}
+                      for name in sorted(self.seconds)}
+            counters = dict(sorted(self.counters.items()))
+        wall = time.perf_counter() - self._started
+        snapshot = {"wall_seconds": round(wall, 6), "stages": stages, "counters": counters,
+                    "peak_rss_bytes": peak_rss_bytes()}
+        snapshot.update(_rates(counters, wall))
+        return snapshot
+
+
+def _rates(counters: Dict[str, int], seconds: float) -> Dict[str, float]:
+    if seconds <= 0:
+        return {}
+    return {"reads_per_second": round(counters.get("reads_in", 0) / seconds, 1),
+            "mb_per_second": round(counters.get("bytes_in", 0) / 1e6 / seconds, 3)}
+
+
+def combine(snapshots: Iterable[Dict]) -> Dict:
+    """Sum stage times, calls and counters over several snapshots (peak memory is the maximum)."""
+    stages: Dict[str, Dict] = {}
+    counters: Counter = Counter()
+    peak = 0
+    for snapshot in snapshots:
+        for name, stage in snapshot.get("stages", {}).items():
+            total = stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            total["seconds"] = round(total["seconds"] + stage["seconds"], 6)
+            total["calls"] += stage["calls"]
+        counters.update(snapshot.get("counters", {}))
+        peak = max(peak, snapshot.get("peak_rss_bytes", 0))
+    return {"stages": dict(sorted(stages.items())), "counters": dict(sorted(counters.items())), "peak_rss_bytes": peak}
+
+
+def save_snapshot(path: Path, snapshot: Dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(path, json.dumps(snapshot, indent=2))
+
+
+def load_snapshots(folder: Path) -> Dict[str, Dict]:
+    """Per-sample snapshots saved in ``folder`` (``<sample>.json``), by sample name."""
+    snapshots = {}
+    for path in sorted(Path(folder).glob("*.json")):
+        if path.name == METRICS_FILE:
+            continue
+        try:
+            with open(path, "r") as handle:
+                snapshots[path.stem] = json.load(handle)
+        except (OSError, ValueError) as e:
+            print(f"Error reading metrics from {path.name}: {str(e)}")
+    return snapshots
+
+
+def write_metrics(path: Path, run: Dict, samples: Dict[str, Dict]) -> Dict:
+    """Write the run's metrics file: the run's own snapshot, every sample's and their totals."""
+    total = combine([run] + list(samples.values()))
+    total.update(_rates(total["counters"], run.get("wall_seconds", 0.0)))
+    metrics = {"format_version": METRICS_VERSION, "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "run": run, "samples": samples, "total": total}
+    write_atomic(path, json.dumps(metrics, indent=2))
+    return metrics
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_prometheus(path: Path, metrics: Dict) -> None:
+    """Write run metrics in the Prometheus text exposition format (for node_exporter's textfile collector)."""
+    sections = [
+        ("stage_seconds_total", "counter", "Wall time spent in each pipeline stage.", "stages", "seconds"),
+        ("stage_calls_total", "counter", "Number of times each pipeline stage ran.", "stages", "calls"),
+    ]
+    units = dict(metrics["samples"], run=metrics["run"])
+    lines = []
+    for metric, kind, description, section, field in sections:
+        lines += [f"# HELP {PROMETHEUS_PREFIX}_{metric} {description}", f"# TYPE {PROMETHEUS_PREFIX}_{metric} {kind}"]
+        for sample, snapshot in units.items():
+            for stage, values in snapshot.get(section, {}).items():
+                lines.append(f'{PROMETHEUS_PREFIX}_{metric}{{sample="{_label(sample)}",stage="{_label(stage)}"}} '
+                             f'{values[field]}')
+    counters = sorted({name for snapshot in units.values() for name in snapshot.get("counters", {})})
+    for name in counters:
+        lines += [f"# HELP {PROMETHEUS_PREFIX}_{name}_total Pipeline counter {name}.",
+                  f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter"]
+        for sample, snapshot in units.items():
+            if name in snapshot.get("counters", {}):
+                lines.append(f'{PROMETHEUS_PREFIX}_{name}_total{{sample="{_label(sample)}"}} '
+                             f'{snapshot["counters"][name]}')
+    lines += [f"# HELP {PROMETHEUS_PREFIX}_peak_rss_bytes Peak resident memory of the process that ran the sample.",
+              f"# TYPE {PROMETHEUS_PREFIX}_peak_rss_bytes gauge"]
+    for sample, snapshot in units.items():
+        lines.append(f'{PROMETHEUS_PREFIX}_peak_rss_bytes{{sample="{_label(sample)}"}} {snapshot.get("peak_rss_bytes", 0)}')
+    write_atomic(path, "\n".join(lines) + "\n")
+
+
+METRICS = Metrics()
@@ -1,15 +1,27 @@
-import os
+import sys
+import time
+from contextlib import ExitStack
 from pathlib import Path
-import gzip
 
-from fastqc import fastqc_analysis
-from trimming import wasm_trim_reads  # Import wasm_trim_reads function
-
-
-def organize_folders(folder_path, tar_folder, fastqc_folder, trimmed_folder, trimmed_fastqc_folder):
+from cache import DEFAULT_CACHE_SIZE, ResultCache, cache_key
+from checkpoint import RunManifest, finish_partial, partial_path, remove_partials_on_error, restore_partial_outputs
+from dedup import DEFAULT_DEDUP_MEMORY, Deduplicator
+from demultiplex import DEFAULT_MISMATCHES, DEMUX_FOLDER, demultiplex, read_barcode_sheet
+from fastq_reader import FastqReader, fastq_stem, open_fastq_output
+from fastqc import QCAccumulator, preview_analysis, write_qc_report
+from metrics import METRICS, METRICS_FILE, load_snapshots, save_snapshot, write_metrics, write_prometheus
+from aggregate import TABLE_FOLDER, aggregate_reports
+from plots import render_pending
+from qc_summary import json_summary_path, summary_path
+from scheduler import ResourceBudget, Sample, failed_samples, load_samples, run_samples
+from staging import DEFAULT_QUEUE_DEPTH, BackgroundWriter, prefetch
+from trimming import PairedTrimStats, ReadTrimmer, TrimStats, paired_batches
+
+
+def organize_folders(folder_path, fastqc_folder, trimmed_folder, trimmed_fastqc_folder):
     """Create necessary directories if they don't exist."""
     try:
-        for directory in [tar_folder, fastqc_folder, trimmed_folder, trimmed_fastqc_folder]:
+        for directory in [fastqc_folder, trimmed_folder, trimmed_fastqc_folder]:
             directory.mkdir(parents=True, exist_ok=True)
 
         if not folder_path.is_dir():
@@ -22,118 +34,511 @@ def organize_folders(folder_path, tar_folder, fastqc_folder, trimmed_folder, tri
         return False
 
 
-def find_fastq_files(folder_path):
-    """Find all FASTQ files in the directory, including compressed versions."""
-    extensions = ["*.fastq", "*.fq", "*.fastq.gz", "*.fq.gz"]
-    fastq_files = []
-    for ext in extensions:
-        fastq_files.extend(folder_path.glob(ext))
-
-    gz_signal = any(f.suffix == ".gz" for f in fastq_files)
-    return fastq_files, gz_signal
-
-
-def convert_and_move_gz(fastq_files, folder_path, tar_folder):
-    """Decompress gzipped files and move originals to archive folder."""
-    for fastq_file in fastq_files:
-        if fastq_file.suffix == ".gz":
-            output_file = folder_path / fastq_file.with_suffix("").name
-            try:
-                with gzip.open(fastq_file, "rt") as f_in, open(output_file, "w") as f_out:
-                    f_out.write(f_in.read())
-                print(f"Converted {fastq_file.name} to {output_file.name}")
-                tar_file = tar_folder / fastq_file.name
-                fastq_file.rename(tar_file)
-                print(f"Archived {fastq_file.name} to {tar_file}")
-            except Exception as e:
-                print(f"Error processing {fastq_file.name}: {str(e)}")
-
-
-def process_single_end_reads(uncompressed_files, fastqc_folder, trimmed_folder, trimmed_fastqc_folder):
-    """Process single-end reads."""
-    for fastq_file in uncompressed_files:
-        # Step 1: Run FastQC on raw reads
-        print(f"\nRunning FastQC on {fastq_file.name}...")
-        fastqc_analysis(fastq_file, fastqc_folder)
-
-        # Step 2: Trim adapters (single-end)
-        trimmed_output_file = trimmed_folder / fastq_file.name
-        print(f"Trimming adapters from {fastq_file.name}...")
-        wasm_trim_reads(fastq_file, trimmed_output_file)
-
-        # Step 3: Run FastQC on trimmed reads
-        print(f"Running FastQC on trimmed {fastq_file.name}...")
-        fastqc_analysis(trimmed_output_file, trimmed_fastqc_folder)
-
-
-def process_paired_end_reads(forward_files, reverse_files, fastqc_folder, trimmed_folder, trimmed_fastqc_folder):
-    """Process paired-end reads."""
-    for forward_file, reverse_file in zip(forward_files, reverse_files):
-        # Step 1: Run FastQC on raw reads
-        print(f"\nRunning FastQC on {forward_file.name} and {reverse_file.name}...")
-        fastqc_analysis(forward_file, fastqc_folder)
-        fastqc_analysis(reverse_file, fastqc_folder)
-
-        # Step 2: Trim adapters (paired-end)
-        forward_trimmed = trimmed_folder / f"trimmed_1_{forward_file.name}"
-        reverse_trimmed = trimmed_folder / f"trimmed_2_{reverse_file.name}"
-        print(f"Trimming adapters from {forward_file.name} and {reverse_file.name}...")
-        wasm_trim_reads(forward_file, forward_trimmed)
-        wasm_trim_reads(reverse_file, reverse_trimmed)
-
-        # Step 3: Run FastQC on trimmed reads
-        print(f"Running FastQC on trimmed {forward_file.name} and {reverse_file.name}...")
-        fastqc_analysis(forward_trimmed, trimmed_fastqc_folder)
-        fastqc_analysis(reverse_trimmed, trimmed_fastqc_folder)
-
-
-def main():
-    """Main workflow controller."""
-    # Configure paths
-    folder_path = Path(os.path.join("..", "data/fastq_files"))
-    output_path = Path(os.path.join("..", "data/output"))
-    tar_folder = folder_path / "compressed_archive"
+def trimmed_path(trimmed_folder, prefix, fastq_file, compresslevel=None):
+    """Output path for trimmed reads; ``.gz`` is added when the output is compressed."""
+    suffix = ".fastq.gz" if compresslevel is not None else ".fastq"
+    return trimmed_folder / f"{prefix}{fastq_stem(fastq_file)}{suffix}"
+
+
+def _resume_state(checkpoint, key, outputs):
+    """Checkpointed state to resume from (partial outputs cut back to match), or ``None`` to start over."""
+    state = checkpoint.load(key) if checkpoint is not None else None
+    if state is not None:
+        try:
+            restore_partial_outputs(outputs, state["output_sizes"])
+            return state
+        except OSError:
+            # The partial outputs it refers to are gone; the checkpoint is of no use
+            checkpoint.clear()
+            state = None
+    restore_partial_outputs(outputs, None)
+    return state
+
+
+def _recount_sequences(accumulators, files, ends):
+    """Rebuild the exact duplication counters a checkpoint leaves out by reading ``files`` up to ``ends`` again.
+
+    Only the reads are parsed and hashed, which costs far less than the
+    QC and trimming they went through, and a resume is rare, so this keeps
+    every checkpoint bounded in size.
+    """
+    for accumulator, path, end in zip(accumulators, files, ends):
+        if accumulator.sequence_counter is None:
+            with METRICS.stage("recount"), FastqReader(path, end=end) as reader:
+                accumulator.recount_sequences(reader)
+
+
+def _open_outputs(outputs, compresslevel, append=False, queue_depth=DEFAULT_QUEUE_DEPTH):
+    """Partial output files, each compressed and written on its own background thread."""
+    return [BackgroundWriter(open_fastq_output(partial_path(path), compresslevel, append), queue_depth)
+            for path in outputs]
+
+
+def _save_checkpoint(checkpoint, key, offsets, handles, outputs, compresslevel, queue_depth, **state):
+    """Close the partial outputs so they end on a record (and gzip member) boundary, save, and reopen.
+
+    ``offsets`` are the input positions just past the last batch written,
+    which with prefetching lag behind the readers' own positions.
+    """
+    for handle in handles:
+        handle.close()
+    checkpoint.save({
+        "offsets": list(offsets),
+        "output_sizes": [partial_path(path).stat().st_size for path in outputs],
+        **state,
+    }, key)
+    return _open_outputs(outputs, compresslevel, append=True, queue_depth=queue_depth)
+
+
+def _with_offsets(reader, queue_depth):
+    """Prefetched ``(batch, offset after the batch)`` pairs from ``reader``."""
+    return prefetch(((batch, reader.offset) for batch in METRICS.timed_iter("read", reader)), queue_depth)
+
+
+def fused_single_end(fastq_file, trimmed_output, fastqc_folder, trimmed_fastqc_folder, trimmer=None,
+                     compresslevel=None, show_progress=True, checkpoint=None, key=None, render_plots=True,
+                     queue_depth=DEFAULT_QUEUE_DEPTH, progress=None, deduplicator=None):
+    """Raw QC, trimming and trimmed QC for one file from a single read of the raw data.
+
+    Each batch is fed to the raw QC accumulator, then the trimmer, then the
+    trimmed QC accumulator, and the trimmed reads are written as they are
+    produced. Reading and parsing run ahead on a reader thread and the
+    output is compressed and written on a writer thread, with up to
+    ``queue_depth`` batches queued at each hand-off (see ``staging``). Both
+    reports are written at the end.
+
+    Trimmed reads go to a hidden partial file that is renamed into place once
+    complete, and removed if the file fails before a checkpoint refers to it.
+    With a ``checkpoint`` the progress is saved periodically and a
+    rerun with the same ``key`` resumes from the last checkpoint.
+    ``render_plots=False`` leaves the charts to ``plots.render_pending``.
+    ``progress`` is called with the fraction of the file read after each batch.
+    With a ``dedup.Deduplicator`` duplicate reads are removed after trimming
+    (and left out of the trimmed QC); such a run cannot be checkpointed.
+    """
+    trimmer = trimmer or ReadTrimmer()
+    outputs = [trimmed_output]
+    state = _resume_state(checkpoint, key, outputs)
+    if state is None:
+        raw_qc, trimmed_qc, stats, offset = QCAccumulator(), QCAccumulator(), TrimStats(), 0
+    else:
+        (raw_qc, trimmed_qc), stats, offset = state["qc"], state["stats"], state["offsets"][0]
+        print(f"Resuming {fastq_file.name} from byte {offset}")
+        _recount_sequences([raw_qc, trimmed_qc], [fastq_file, partial_path(trimmed_output)], [offset, None])
+    start = time.perf_counter()
+    with remove_partials_on_error(outputs, checkpoint), METRICS.stage("fused"), \
+            FastqReader(fastq_file, start=offset) as reader:
+        handles = _open_outputs(outputs, compresslevel, append=state is not None, queue_depth=queue_depth)
+        try:
+            for batch, offset in _with_offsets(reader, queue_depth):
+                raw_qc.add_batch(batch)
+                trimmed = trimmer.trim_batch(batch, stats)
+                if deduplicator is not None:
+                    trimmed = deduplicator.filter([trimmed])[0]
+                trimmed_qc.add_batch(trimmed)
+                handles[0].write(trimmed.to_fastq())
+                if show_progress:
+                    print(f"Progress: {reader.progress * 100:.2f}%", end='\r')
+                if progress is not None:
+                    progress(reader.progress)
+                if checkpoint is not None and checkpoint.due([offset]):
+                    stats.elapsed += time.perf_counter() - start
+                    start = time.perf_counter()
+                    handles = _save_checkpoint(checkpoint, key, [offset], handles, outputs, compresslevel, queue_depth,
+                                               qc=(raw_qc.checkpoint_state(), trimmed_qc.checkpoint_state()),
+                                               stats=stats)
+            if deduplicator is not None:
+                for (trimmed,) in deduplicator.finish():
+                    trimmed_qc.add_batch(trimmed)
+                    handles[0].write(trimmed.to_fastq())
+                deduplicator.record(stats)
+        finally:
+            for handle in handles:
+                handle.close()
+        METRICS.count("bytes_in", reader.bytes_read)
+    finish_partial(trimmed_output)
+    stats.record_metrics()
+    stats.elapsed += time.perf_counter() - start
+    print(stats.summary())
+
+    for accumulator, path, folder in [(raw_qc, fastq_file, fastqc_folder),
+                                      (trimmed_qc, trimmed_output, trimmed_fastqc_folder)]:
+        report_path = write_qc_report(accumulator.finalize(), path, folder, render_plots)
+        print(f"Quality report generated: {report_path.name}")
+    return stats
+
+
+def fused_paired_end(forward_file, reverse_file, outputs, fastqc_folder, trimmed_fastqc_folder, trimmer=None,
+                     compresslevel=None, show_progress=True, checkpoint=None, key=None, render_plots=True,
+                     queue_depth=DEFAULT_QUEUE_DEPTH, deduplicator=None):
+    """Paired-end version of ``fused_single_end``.
+
+    ``outputs`` holds the forward/reverse paired and forward/reverse unpaired
+    output paths; QC reports are produced for both raw files and both paired outputs.
+    A ``deduplicator`` removes duplicate pairs from the paired outputs.
+    """
+    trimmer = trimmer or ReadTrimmer()
+    state = _resume_state(checkpoint, key, outputs)
+    if state is None:
+        raw_qc = [QCAccumulator(), QCAccumulator()]
+        trimmed_qc = [QCAccumulator(), QCAccumulator()]
+        stats = PairedTrimStats()
+        offsets = [0, 0]
+    else:
+        (raw_qc, trimmed_qc), stats, offsets = state["qc"], state["stats"], state["offsets"]
+        print(f"Resuming {forward_file.name} and {reverse_file.name} from bytes {offsets[0]} and {offsets[1]}")
+        _recount_sequences(raw_qc + trimmed_qc, [forward_file, reverse_file, *map(partial_path, outputs[:2])],
+                           offsets + [None, None])
+    start = time.perf_counter()
+    # Mates must land in batches of the same size, so batches are cut by read count only
+    with remove_partials_on_error(outputs, checkpoint), METRICS.stage("fused"), \
+            FastqReader(forward_file, start=offsets[0], max_batch_bases=None) as forward_reader, \
+            FastqReader(reverse_file, start=offsets[1], max_batch_bases=None) as reverse_reader:
+        handles = _open_outputs(outputs, compresslevel, append=state is not None, queue_depth=queue_depth)
+        try:
+            pairs = paired_batches(_with_offsets(forward_reader, queue_depth),
+                                   _with_offsets(reverse_reader, queue_depth))
+            for (forward, forward_offset), (reverse, reverse_offset) in pairs:
+                raw_qc[0].add_batch(forward)
+                raw_qc[1].add_batch(reverse)
+                trimmed = trimmer.trim_pair(forward, reverse, stats)
+                if deduplicator is not None:
+                    trimmed = deduplicator.filter(list(trimmed[:2])) + list(trimmed[2:])
+                trimmed_qc[0].add_batch(trimmed[0])
+                trimmed_qc[1].add_batch(trimmed[1])
+                for handle, batch in zip(handles, trimmed):
+                    handle.write(batch.to_fastq())
+                if show_progress:
+                    print(f"Progress: {forward_reader.progress * 100:.2f}%", end='\r')
+                if checkpoint is not None and checkpoint.due([forward_offset, reverse_offset]):
+                    stats.elapsed += time.perf_counter() - start
+                    start = time.perf_counter()
+                    qc = ([accumulator.checkpoint_state() for accumulator in raw_qc],
+                          [accumulator.checkpoint_state() for accumulator in trimmed_qc])
+                    handles = _save_checkpoint(checkpoint, key, [forward_offset, reverse_offset], handles, outputs,
+                                               compresslevel, queue_depth, qc=qc, stats=stats)
+            if deduplicator is not None:
+                for pair in deduplicator.finish():
+                    for accumulator, handle, batch in zip(trimmed_qc, handles, pair):
+                        accumulator.add_batch(batch)
+                        handle.write(batch.to_fastq())
+                deduplicator.record(stats)
+        finally:
+            for handle in handles:
+                handle.close()
+        METRICS.count("bytes_in", forward_reader.bytes_read + reverse_reader.bytes_read)
+    for path in outputs:
+        finish_partial(path)
+    stats.record_metrics()
+    stats.elapsed += time.perf_counter() - start
+    print(stats.summary())
+
+    reports = [(raw_qc[0], forward_file, fastqc_folder), (raw_qc[1], reverse_file, fastqc_folder),
+               (trimmed_qc[0], outputs[0], trimmed_fastqc_folder), (trimmed_qc[1], outputs[1], trimmed_fastqc_folder)]
+    for accumulator, path, folder in reports:
+        report_path = write_qc_report(accumulator.finalize(), path, folder, render_plots)
+        print(f"Quality report generated: {report_path.name}")
+    return stats
+
+
+def paired_outputs(trimmed_folder, forward_file, reverse_file, compresslevel=None):
+    """Forward/reverse paired and forward/reverse unpaired output paths for a read pair."""
+    return (
+        trimmed_path(trimmed_folder, "trimmed_1_", forward_file, compresslevel),
+        trimmed_path(trimmed_folder, "trimmed_2_", reverse_file, compresslevel),
+        trimmed_path(trimmed_folder, "unpaired_1_", forward_file, compresslevel),
+        trimmed_path(trimmed_folder, "unpaired_2_", reverse_file, compresslevel),
+    )
+
+
+def report_files(fastq_file, report_folder):
+    """Text report and summaries ``write_qc_report`` produces for ``fastq_file``.
+
+    Charts are left out: they are derived from the summary and re-rendered
+    by ``plots.render_pending`` wherever they are missing.
+    """
+    return [report_folder / f"{fastq_stem(fastq_file)}_qc_report.txt", summary_path(fastq_file, report_folder),
+            json_summary_path(fastq_file, report_folder)]
+
+
+def sample_outputs(sample, fastqc_folder, trimmed_folder, trimmed_fastqc_folder, compresslevel=None):
+    """Trimmed read files and every report file produced for ``sample``."""
+    if sample.paired:
+        trimmed = list(paired_outputs(trimmed_folder, sample.forward, sample.reverse, compresslevel))
+        reported = trimmed[:2]
+    else:
+        trimmed = reported = [trimmed_path(trimmed_folder, "", sample.forward, compresslevel)]
+    files = list(trimmed)
+    for fastq_file in sample.files:
+        files += report_files(fastq_file, fastqc_folder)
+    for fastq_file in reported:
+        files += report_files(fastq_file, trimmed_fastqc_folder)
+    return files
+
+
+def process_sample(sample, fastqc_folder, trimmed_folder, trimmed_fastqc_folder, compresslevel=None,
+                   cache_folder=None, cache_size=DEFAULT_CACHE_SIZE, manifest_folder=None,
+                   queue_depth=DEFAULT_QUEUE_DEPTH, dedup=False, umi=False, dedup_memory=DEFAULT_DEDUP_MEMORY):
+    """Scheduler task: fused QC and trimming for one single-end or paired-end sample.
+
+    With a ``manifest_folder``, a sample already completed for the same
+    inputs and parameters is skipped, and an interrupted one resumes from its
+    last checkpoint. With a ``cache_folder``, a sample whose input content and
+    trimming parameters match a previous run gets that run's outputs restored
+    instead of being processed again. Charts are not rendered here (see
+    ``plots.render_pending``), keeping them off the per-sample critical
+    path. All outputs are written to temporary
+    files and renamed into place, so hard links into the cache are never
+    overwritten and a partial file is never mistaken for a finished one.
+    With ``dedup`` duplicate reads (or pairs, optionally told apart by
+    ``umi``) are removed from the trimmed reads; the duplicate table may use
+    up to ``dedup_memory`` bytes before spilling next to the trimmed reads,
+    and the sample is not checkpointed mid-file.
+    """
+    trimmer = ReadTrimmer()
+    folders = {"quality_reports": fastqc_folder, "trimmed_reads": trimmed_folder,
+               "trimmed_reports": trimmed_fastqc_folder}
+    stats_class = PairedTrimStats if sample.paired else TrimStats
+    outputs = sample_outputs(sample, fastqc_folder, trimmed_folder, trimmed_fastqc_folder, compresslevel)
+    parameters = {"paired": sample.paired, "compresslevel": compresslevel,
+                  "outputs": [path.name for path in outputs], "trimmer": trimmer.parameters()}
+    if dedup:
+        parameters["dedup"] = {"umi": umi}
+    key = cache_key(sample.files, parameters)
+
+    manifest = RunManifest(manifest_folder) if manifest_folder is not None else None
+    if manifest is not None:
+        record = manifest.completed(sample.name, "fused", key)
+        if record is not None:
+            print(f"\nSkipping {sample}: already completed")
+            stats = stats_class()
+            stats.__dict__.update(record["stats"])
+            return stats
+
+    cache = ResultCache(cache_folder, cache_size) if cache_folder is not None else None
+    metadata = cache.restore(key, folders) if cache is not None else None
+    if metadata is not None:
+        print(f"\nReusing cached results for {sample}")
+        stats = stats_class()
+        stats.__dict__.update(metadata["stats"])
+    else:
+        print(f"\nRunning QC and trimming on {sample}...")
+        checkpoint = manifest.checkpoint(sample.name, "fused") if manifest is not None and not dedup else None
+        with ExitStack() as stack:
+            deduplicator = stack.enter_context(Deduplicator(dedup_memory, umi, trimmed_folder)) if dedup else None
+            if sample.paired:
+                stats = fused_paired_end(sample.forward, sample.reverse, outputs[:4], fastqc_folder,
+                                         trimmed_fastqc_folder, trimmer=trimmer, compresslevel=compresslevel,
+                                         show_progress=False, checkpoint=checkpoint, key=key, render_plots=False,
+                                         queue_depth=queue_depth, deduplicator=deduplicator)
+            else:
+                stats = fused_single_end(sample.forward, outputs[0], fastqc_folder, trimmed_fastqc_folder,
+                                         trimmer=trimmer, compresslevel=compresslevel, show_progress=False,
+                                         checkpoint=checkpoint, key=key, render_plots=False, queue_depth=queue_depth,
+                                         deduplicator=deduplicator)
+        if cache is not None:
+            cache.store(key, folders, [path for path in outputs if path.exists()], {"stats": vars(stats)})
+
+    if manifest is not None:
+        manifest.mark_complete(sample.name, "fused", [path for path in outputs if path.exists()], key,
+                               stats=vars(stats))
+        manifest.checkpoint(sample.name, "fused").clear()
+    return stats
+
+
+def demultiplex_lanes(lanes, barcode_sheet, demux_folder, mismatches=DEFAULT_MISMATCHES, compresslevel=None,
+                      manifest_folder=None, queue_depth=DEFAULT_QUEUE_DEPTH):
+    """Split pooled ``lanes`` by the barcodes in ``barcode_sheet`` and return the per-sample inputs for QC.
+
+    With a ``manifest_folder``, lanes already demultiplexed with the same
+    sheet and parameters are not read again.
+    """
+    barcode_sheet = Path(barcode_sheet)
+    key = cache_key([path for lane in lanes for path in lane.files] + [barcode_sheet],
+                    {"mismatches": mismatches, "compresslevel": compresslevel})
+    manifest = RunManifest(manifest_folder) if manifest_folder is not None else None
+    if manifest is not None:
+        record = manifest.completed(DEMUX_FOLDER, "demux", key)
+        if record is not None:
+            print("\nSkipping demultiplexing: already completed")
+            return [Sample(name, *files) for name, files in record["samples"]]
+
+    samples, stats = demultiplex(lanes, read_barcode_sheet(barcode_sheet), demux_folder, mismatches=mismatches,
+                                 compresslevel=compresslevel, queue_depth=queue_depth)
+    if manifest is not None:
+        manifest.mark_complete(DEMUX_FOLDER, "demux", [path for sample in samples for path in sample.files], key,
+                               samples=[(sample.name, [str(path) for path in sample.files]) for sample in samples],
+                               undetermined_fraction=stats.undetermined_fraction)
+    return samples
+
+
+def process_sample_with_metrics(sample, metrics_folder, profile=None, **task_kwargs):
+    """Scheduler task: ``process_sample`` with its stage timings and counters saved to ``metrics_folder``.
+
+    Runs in a worker process, so the sample's metrics (and the profiles of
+    the stages named in ``profile``) are written to files for the main
+    process to combine (see ``write_run_metrics``).
+    """
+    METRICS.enable(profile, metrics_folder / "profiles")
+    METRICS.reset(sample.name)
+    try:
+        return process_sample(sample, **task_kwargs)
+    finally:
+        save_snapshot(metrics_folder / "samples" / f"{sample.name}.json", METRICS.snapshot())
+        METRICS.save_profiles()
+
+
+def write_run_metrics(metrics_folder, prometheus_file=None):
+    """Combine the main process's metrics with every sample's into ``run_metrics.json`` (and Prometheus)."""
+    try:
+        METRICS.save_profiles()
+        metrics = write_metrics(metrics_folder / METRICS_FILE, METRICS.snapshot(),
+                                load_snapshots(metrics_folder / "samples"))
+        if prometheus_file is not None:
+            write_prometheus(prometheus_file, metrics)
+        total = metrics["total"]
+        print(f"Run metrics written to {metrics_folder / METRICS_FILE} "
+              f"({total.get('reads_per_second', 0):,.0f} reads/s, "
+              f"peak RSS {total['peak_rss_bytes'] / 2 ** 20:.0f} MB)")
+    except Exception as e:
+        print(f"Error writing run metrics: {str(e)}")
+
+
+def run_pipeline(folder_path, output_path, compresslevel=None, max_workers=None, memory_budget=None,
+                 cache_size=DEFAULT_CACHE_SIZE, use_cache=True, queue_depth=DEFAULT_QUEUE_DEPTH, metrics=True,
+                 prometheus_file=None, profile=None, render_plots=True, preview_reads=None, barcodes=None,
+                 barcode_mismatches=DEFAULT_MISMATCHES, dedup=False, umi=False, dedup_memory=DEFAULT_DEDUP_MEMORY):
+    """QC, trim and re-QC every sample in ``folder_path`` (a FASTQ folder or sample sheet) into ``output_path``.
+
+    ``folder_path`` may also be a CSV/TSV sample sheet (sample, fastq_1,
+    fastq_2). Trimmed reads are written as ``.fastq.gz`` at ``compresslevel``
+    when it is set. Up to ``max_workers`` samples (default: all CPUs) run at
+    once within ``memory_budget`` bytes (default: 80% of available memory),
+    with ``queue_depth`` batches buffered between the read, compute and write
+    threads of each. Results of unchanged samples are reused from
+    ``output_path/cache`` unless ``use_cache`` is False, LRU-evicted beyond
+    ``cache_size`` bytes; completed stages and mid-file checkpoints are kept
+    in ``output_path/manifest``, so an interrupted run picks up where it
+    stopped. With ``metrics``, per-stage timings and counters go to
+    ``output_path/metrics/run_metrics.json`` (and ``prometheus_file``);
+    ``profile`` maps stage names (e.g. ``"trim"``) to ``"cprofile"`` or
+    ``"sampling"``. ``render_plots=False`` leaves the charts to ``plots.py``.
+    ``preview_reads`` replaces the run with a sampled QC preview of that many
+    reads per file. ``barcodes`` names a barcode sheet to demultiplex the
+    inputs as pooled lanes with first, allowing ``barcode_mismatches`` per
+    index read. ``dedup``, ``umi`` and ``dedup_memory`` are passed to
+    ``process_sample``. The ``rna-seek run`` command (``cli.py``) exposes
+    all of these.
+
+    Returns False when the run could not start (missing input folder,
+    unreadable sample sheet, no FASTQ files) or when any sample failed; the
+    other samples are still processed and reported.
+    """
+    folder_path = Path(folder_path)
+    output_path = Path(output_path)
     trimmed_folder = output_path / "trimmed_reads"
     fastqc_folder = output_path / "quality_reports"
     trimmed_fastqc_folder = output_path / "trimmed_reports"
+    cache_folder = output_path / "cache" if use_cache else None
+    manifest_folder = output_path / "manifest"
+    metrics_folder = output_path / "metrics" if metrics else None
+    profile = profile or {}
 
     # Initialize directory structure
-    if not organize_folders(folder_path, tar_folder, fastqc_folder, trimmed_folder, trimmed_fastqc_folder):
-        return
+    sample_folder = folder_path if folder_path.is_dir() else folder_path.parent
+    if not organize_folders(sample_folder, fastqc_folder, trimmed_folder, trimmed_fastqc_folder):
+        return False
 
-    # Find all FASTQ files
-    fastq_files, gz_signal = find_fastq_files(folder_path)
+    # Pair _R1/_R2 files by name; anything without a mate is single-end
+    try:
+        samples = load_samples(folder_path)
+    except Exception as e:
+        print(f"Error reading samples from {folder_path}: {str(e)}")
+        return False
 
-    if not fastq_files:
+    if not samples:
         print("No FASTQ files found (*.fastq, *.fq, or *.gz versions).")
-        return
+        return False
 
-    print(f"\nFound {len(fastq_files)} FASTQ file(s) in {folder_path}")
+    if metrics_folder is not None:
+        METRICS.enable(profile, metrics_folder / "profiles")
+        METRICS.reset("run")
+        # Per-sample metrics of an earlier run must not be counted again
+        for stale in (metrics_folder / "samples").glob("*.json"):
+            stale.unlink()
+
+    # Pooled lanes are split into one input per sample in a single pass before any QC or trimming
+    if barcodes is not None:
+        lanes = samples
+        try:
+            samples = demultiplex_lanes(lanes, barcodes, output_path / DEMUX_FOLDER, mismatches=barcode_mismatches,
+                                        compresslevel=compresslevel, manifest_folder=manifest_folder,
+                                        queue_depth=queue_depth)
+        except Exception as e:
+            print(f"Error demultiplexing {', '.join(lane.name for lane in lanes)}: {str(e)}")
+            return False
+        if not samples:
+            print("No reads matched the barcode sheet.")
+            return False
 
-    # Process compressed files if found
-    if gz_signal:
-        print("\nProcessing compressed files...")
-        convert_and_move_gz(fastq_files, folder_path, tar_folder)
+    paired = sum(sample.paired for sample in samples)
+    print(f"\nFound {len(samples)} sample(s) in {folder_path} ({paired} paired-end, {len(samples) - paired} single-end)")
+
+    if preview_reads:
+        preview_folder = output_path / "preview_reports"
+        preview_folder.mkdir(parents=True, exist_ok=True)
+        for sample in samples:
+            for fastq_file in sample.files:
+                with METRICS.stage("preview"):
+                    preview_analysis(fastq_file, preview_folder, reads=preview_reads, render_plots=False)
+        if render_plots:
+            with METRICS.stage("charts"):
+                render_pending([preview_folder], max_workers)
+        aggregate_reports([preview_folder], preview_folder / TABLE_FOLDER)
+        if metrics_folder is not None:
+            write_run_metrics(metrics_folder, prometheus_file)
+        print("\nPreview complete!")
+        return True
 
-    # Process all uncompressed FASTQ files
+    # Compressed files are streamed directly; no decompressed copy is written
     print("\nRunning quality analysis...")
-    uncompressed_files = list(folder_path.glob("*.fastq")) + list(folder_path.glob("*.fq"))
-
-    # Check if paired-end or single-end reads
-    if len(uncompressed_files) % 2 == 0:  # Paired-end assumption
-        forward_files = sorted([f for f in uncompressed_files if "_R1" in f.name])
-        reverse_files = sorted([f for f in uncompressed_files if "_R2" in f.name])
+    budget = ResourceBudget(max_workers, memory_budget)
+    task_kwargs = dict(fastqc_folder=fastqc_folder, trimmed_folder=trimmed_folder,
+                       trimmed_fastqc_folder=trimmed_fastqc_folder, compresslevel=compresslevel,
+                       cache_folder=cache_folder, cache_size=cache_size, manifest_folder=manifest_folder,
+                       queue_depth=queue_depth, dedup=dedup, umi=umi, dedup_memory=dedup_memory)
+    with METRICS.stage("samples"):
+        if metrics_folder is not None:
+            results = run_samples(samples, process_sample_with_metrics, budget, metrics_folder=metrics_folder,
+                                  profile=profile, **task_kwargs)
+        else:
+            results = run_samples(samples, process_sample, budget, **task_kwargs)
+
+    if render_plots:
+        with METRICS.stage("charts"):
+            render_pending([fastqc_folder, trimmed_fastqc_folder], budget.max_workers)
+
+    # One table of every raw and trimmed sample's metrics, for dashboards and cross-run comparison
+    with METRICS.stage("aggregate"):
+        aggregate_reports([fastqc_folder, trimmed_fastqc_folder], output_path / TABLE_FOLDER)
+
+    if metrics_folder is not None:
+        write_run_metrics(metrics_folder, prometheus_file)
+
+    failed = failed_samples(results)
+    if failed:
+        print(f"\nProcessing finished with {len(failed)} failed sample(s): {', '.join(failed)}")
+        return False
+    print("\nProcessing complete!")
+    return True
 
-        if len(forward_files) != len(reverse_files):
-            print("Error: Mismatch between forward and reverse files.")
-            return
 
-        process_paired_end_reads(forward_files, reverse_files, fastqc_folder, trimmed_folder, trimmed_fastqc_folder)
-    else:  # Single-end assumption
-        process_single_end_reads(uncompressed_files, fastqc_folder, trimmed_folder, trimmed_fastqc_folder)
+def main(argv=None):
+    """``python pipeline.py [options] FASTQ_FOLDER_OR_SAMPLE_SHEET``, the same as ``rna-seek run`` (see ``cli.py``)."""
+    from cli import main as cli_main
 
-    print("\nProcessing complete!")
+    return cli_main(["run", *(sys.argv[1:] if argv is None else argv)])
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
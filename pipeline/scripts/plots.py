@@ -0,0 +1,277 @@
+"""Quality charts rendered from QC summaries with Matplotlib's object-oriented Agg API.
+
+Charts only need the pre-binned arrays of a ``*_qc_summary.npz`` file, so
+they can be drawn in the analysis process, in a separate process pool, or
+later on demand. Matplotlib is imported on the first render, so importing
+this module (and the QC modules that use it) stays cheap when no charts
+are drawn:
+
+    python plots.py [--workers N] [--force] REPORT_FOLDER_OR_SUMMARY [...]
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from checkpoint import atomic_path
+from qc_summary import find_summaries, load_summary, summary_stem
+
+PLOT_DPI = 150
+PLOT_FOLDER = "plots"
+GC_BIN_WIDTH = 5
+LENGTH_BINS = 50
+# Enriched k-mers drawn in the k-mer content chart
+KMER_LINES = 6
+
+
+def chart_paths(fig_dir: Path, file_stem: str) -> List[Path]:
+    """The PNG files ``render_charts`` writes for ``file_stem``."""
+    return [fig_dir / f"{file_stem}_quality_plots{fig_num}.png" for fig_num in (1, 2)]
+
+
+def _blank(ax, title: str, message: str) -> None:
+    """Blank panel with a centered message."""
+    ax.text(0.5, 0.5, message, ha='center', va='center', fontsize=14, color='gray', transform=ax.transAxes)
+    ax.set_title(title)
+    ax.axis('off')
+
+
+def _histogram(ax, counts: np.ndarray, edges: np.ndarray) -> None:
+    """Draw pre-binned counts as filled bars (equivalent to ``hist`` with ``weights``)."""
+    ax.stairs(counts, edges, fill=True, alpha=0.7)
+    ax.stairs(counts, edges, color='black', linewidth=0.8)
+
+
+def _rebin(counts: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Sum per-value counts (value ``i`` at index ``i``) into histogram bins with the given edges."""
+    return np.histogram(np.arange(len(counts)), bins=edges, weights=counts)[0]
+
+
+def plot_base_quality(ax, summary: Dict[str, np.ndarray]) -> None:
+    positions = summary['quality_positions']
+    if not len(positions):
+        _blank(ax, "Per-Base Sequence Quality", "No data available")
+        return
+    ax.plot(positions, summary['quality_mean'], label='Mean')
+    ax.plot(positions, summary['quality_median'], label='Median')
+    ax.fill_between(positions, summary['quality_q25'], summary['quality_q75'], alpha=0.3, label='IQR (25-75%)')
+    ax.set_xlabel('Position in Read (bp)')
+    ax.set_ylabel('Phred Quality Score')
+    ax.set_title('Per-Base Sequence Quality')
+    ax.legend()
+    ax.grid(True)
+
+
+def plot_gc_content(ax, summary: Dict[str, np.ndarray]) -> None:
+    gc_hist = summary['gc_hist']
+    if not gc_hist.any():
+        _blank(ax, "GC Content Distribution", "No data available")
+        return
+    edges = np.arange(0, 101, GC_BIN_WIDTH)
+    _histogram(ax, _rebin(gc_hist, edges), edges)
+    ax.set_xlabel('GC Content (%)')
+    ax.set_ylabel('Number of Sequences')
+    ax.set_title('GC Content Distribution')
+    ax.grid(True)
+
+
+def plot_length_distribution(ax, summary: Dict[str, np.ndarray]) -> None:
+    length_counts = summary['length_counts']
+    if not length_counts.any():
+        _blank(ax, "Sequence Length Distribution", "No data available")
+        return
+    edges = np.linspace(0, len(length_counts) - 1 + 10, LENGTH_BINS)
+    _histogram(ax, _rebin(length_counts, edges), edges)
+    ax.set_xlabel('Sequence Length (bp)')
+    ax.set_ylabel('Count')
+    ax.set_title('Sequence Length Distribution')
+    ax.grid(True)
+
+
+def plot_overrepresented(ax, summary: Dict[str, np.ndarray]) -> None:
+    sequences = summary['overrepresented_sequences']
+    if not len(sequences):
+        _blank(ax, "Top Overrepresented Sequences", "No overrepresented sequences (>0.1% of total)")
+        return
+    ax.barh([seq[:20] + '...' for seq in sequences.tolist()], summary['overrepresented_counts'])
+    ax.set_xlabel('Count')
+    ax.set_title('Top Overrepresented Sequences')
+    ax.invert_yaxis()
+
+
+def plot_kmer_content(ax, summary: Dict[str, np.ndarray]) -> None:
+    kmers = summary.get('kmer_sequences', np.zeros(0, dtype=str)).tolist()[:KMER_LINES]
+    if not kmers:
+        _blank(ax, "K-mer Content", "No positionally enriched k-mers")
+        return
+    starts, obs_exp = summary['kmer_group_starts'], summary['kmer_obs_exp']
+    for i, kmer in enumerate(kmers):
+        ax.plot(starts, obs_exp[i], label=kmer)
+    ax.set_xlabel('Position in Read (bp)')
+    ax.set_ylabel('Observed / Expected')
+    ax.set_title(f"K-mer Content (k={int(summary['kmer_size'])})")
+    ax.legend()
+    ax.grid(True)
+
+
+def plot_per_tile_quality(ax, summary: Dict[str, np.ndarray]) -> None:
+    tiles, positions = summary['tiles'].tolist(), summary['tile_positions'].tolist()
+    if not tiles:
+        _blank(ax, "Per Tile Sequence Quality", "No tile information available")
+        return
+    image = ax.imshow(summary['tile_mean'], aspect='auto', cmap='viridis', interpolation='nearest')
+    ax.figure.colorbar(image, ax=ax, label='Mean Quality Score')
+    ax.set_xlabel('Position in Read')
+    ax.set_ylabel('Tile')
+    ax.set_title('Per Tile Sequence Quality')
+    # Every 10th column, or about 20 labels when a long read has many more bins
+    step = max(10, len(positions) // 20)
+    ax.set_xticks(np.arange(len(positions))[::step], positions[::step], rotation=45)
+    ax.set_yticks(np.arange(len(tiles))[::2], tiles[::2])
+
+
+def plot_per_sequence_quality(ax, summary: Dict[str, np.ndarray]) -> None:
+    per_seq_qual = summary['per_seq_quality_hist']
+    if not per_seq_qual.any():
+        _blank(ax, "Per Sequence Quality Scores", "No data available")
+        return
+    observed = np.flatnonzero(per_seq_qual)
+    edges = np.arange(observed[0], observed[-1] + 2)
+    _histogram(ax, per_seq_qual[observed[0]:observed[-1] + 1], edges)
+    ax.set_xlabel('Average Quality Score per Read')
+    ax.set_ylabel('Count')
+    ax.set_title('Per Sequence Quality Scores')
+    ax.grid(True)
+
+
+def plot_per_base_content(ax, summary: Dict[str, np.ndarray]) -> None:
+    positions = summary['base_positions']
+    if not len(positions):
+        _blank(ax, "Per Base Sequence Content", "No data available")
+        return
+    for i, (base, color) in enumerate(zip('ATCG', ['green', 'red', 'blue', 'black'])):
+        ax.plot(positions, summary['base_percent'][:, i], label=base, color=color)
+    ax.set_xlabel('Position in Read')
+    ax.set_ylabel('Percentage')
+    ax.set_title('Per Base Sequence Content')
+    ax.legend()
+    ax.grid(True)
+
+
+def plot_per_base_n_content(ax, summary: Dict[str, np.ndarray]) -> None:
+    positions = summary['n_positions']
+    if not len(positions):
+        _blank(ax, "Per Base N Content", "No data available")
+        return
+    ax.plot(positions, summary['n_percent'], color='purple', label='N Content')
+    ax.set_xlabel('Position in Read (bp)')
+    ax.set_ylabel('Percentage of N')
+    ax.set_title('Per Base N Content')
+    ax.grid(True)
+    ax.legend()
+
+
+def plot_adapter_content(ax, summary: Dict[str, np.ndarray]) -> None:
+    positions = summary['adapter_positions']
+    if not len(positions):
+        _blank(ax, "Adapter Content", "No adapter data")
+        return
+    ax.plot(positions, summary['adapter_percent'], color='orange')
+    ax.set_xlabel('Position in Read')
+    ax.set_ylabel('Percentage of Reads with Adapter')
+    ax.set_title('Adapter Content')
+    ax.grid(True)
+
+
+def plot_duplication_levels(ax, summary: Dict[str, np.ndarray]) -> None:
+    levels, total = summary['duplication_levels'], int(summary['total_seqs'])
+    if not len(levels) or total <= 0:
+        _blank(ax, "Sequence Duplication Levels", "No duplication data")
+        return
+    ax.plot(levels, summary['duplication_counts'] * levels / total * 100, marker='o', linestyle='-')
+    ax.set_xlabel('Duplication Level (Number of Occurrences)')
+    ax.set_ylabel('Percentage of Total Reads (%)')
+    ax.set_title('Sequence Duplication Levels')
+    ax.grid(True)
+
+
+CHART_LAYOUTS = [
+    ((15, 18), (3, 2), [plot_base_quality, plot_gc_content, plot_length_distribution, plot_overrepresented,
+                        plot_kmer_content]),
+    ((18, 20), (3, 2), [plot_per_tile_quality, plot_per_sequence_quality, plot_per_base_content,
+                        plot_per_base_n_content, plot_adapter_content, plot_duplication_levels]),
+]
+
+
+def _new_figure(figsize):
+    """Figure attached to an Agg canvas (Matplotlib takes about half a second to import)."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def render_charts(summary: Dict[str, np.ndarray], fig_dir: Path, file_stem: str) -> List[Path]:
+    """Render both chart pages for a summary; each figure is independent of pyplot's global state."""
+    fig_dir.mkdir(parents=True, exist_ok=True)
+    paths = chart_paths(fig_dir, file_stem)
+    for path, (figsize, (rows, columns), panels) in zip(paths, CHART_LAYOUTS):
+        fig = _new_figure(figsize)
+        fig.subplots_adjust(hspace=0.5, wspace=0.3)
+        for i, panel in enumerate(panels, 1):
+            panel(fig.add_subplot(rows, columns, i), summary)
+        with atomic_path(path) as temporary:
+            fig.savefig(temporary, format='png', dpi=PLOT_DPI, bbox_inches='tight')
+    return paths
+
+
+def render_summary_file(path: Path) -> List[Path]:
+    """Render the charts of a saved summary into the ``plots`` folder next to it."""
+    path = Path(path)
+    return render_charts(load_summary(path), path.parent / PLOT_FOLDER, summary_stem(path))
+
+
+def is_stale(path: Path) -> bool:
+    """True when a summary's charts are missing or older than the summary."""
+    modified = path.stat().st_mtime
+    charts = chart_paths(path.parent / PLOT_FOLDER, summary_stem(path))
+    return not all(chart.exists() and chart.stat().st_mtime >= modified for chart in charts)
+
+
+def render_pending(sources: Sequence[Path], workers: Optional[int] = None, force: bool = False) -> List[Path]:
+    """Render charts for every summary in ``sources`` whose charts are missing or stale.
+
+    Rendering runs in a process pool of ``workers`` processes (one per CPU by
+    default). Returns the chart paths written; failures are reported and skipped.
+    """
+    summaries = [path for path in find_summaries(sources) if force or is_stale(path)]
+    if not summaries:
+        return []
+    workers = min(workers or os.cpu_count() or 1, len(summaries))
+    print(f"\nRendering charts for {len(summaries)} report(s) on {workers} worker(s)...")
+    written = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, future in [(path, executor.submit(render_summary_file, path)) for path in summaries]:
+            try:
+                written.extend(future.result())
+            except Exception as e:
+                print(f"Error generating charts for {path.name}: {str(e)}")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render quality charts from QC summary files.")
+    parser.add_argument("sources", nargs="+", type=Path, help="report folders or *_qc_summary.npz files")
+    parser.add_argument("--workers", type=int, default=None, help="rendering processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="re-render charts that are up to date")
+    args = parser.parse_args()
+    written = render_pending(args.sources, args.workers, args.force)
+    print(f"Rendered {len(written)} chart(s)")
+
+
+if __name__ == "__main__":
+    main()
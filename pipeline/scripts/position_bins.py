@@ -0,0 +1,74 @@
+"""Position bins for per-position QC metrics, so long reads cost about as much memory as short ones.
+
+The first ``exact`` bases of a read each get a bin of their own, as for
+ordinary Illumina reads. Past that, every doubling of the position (an
+octave) is split into ``per_octave`` equal bins, so bins get wider the
+further they are into the read, like FastQC's grouped base ranges. With
+the defaults a 100 kb read needs fewer than 1,000 bins and a 1 Mb read
+about 1,150, instead of one per base.
+
+Bins only depend on the position, never on the reads seen so far, so
+accumulators can grow while streaming, shards and samples line up bin for
+bin, and a file of short reads gets exactly the per-base layout.
+"""
+import numpy as np
+
+DEFAULT_EXACT_POSITIONS = 512
+DEFAULT_BINS_PER_OCTAVE = 64
+
+
+class PositionBins:
+    """Map 0-based base positions to bin numbers and back."""
+
+    def __init__(self, exact: int = DEFAULT_EXACT_POSITIONS, per_octave: int = DEFAULT_BINS_PER_OCTAVE):
+        if exact < 1 or per_octave < 1 or exact % per_octave:
+            raise ValueError(f"exact positions ({exact}) must be a positive multiple of bins per octave "
+                             f"({per_octave})")
+        self.exact = exact
+        self.per_octave = per_octave
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PositionBins) and (self.exact, self.per_octave) == (other.exact, other.per_octave)
+
+    def __hash__(self) -> int:
+        return hash((self.exact, self.per_octave))
+
+    def __repr__(self) -> str:
+        return f"PositionBins(exact={self.exact}, per_octave={self.per_octave})"
+
+    def index(self, positions: np.ndarray) -> np.ndarray:
+        """Bin number of each 0-based position."""
+        positions = np.asarray(positions, dtype=np.int64)
+        bins = positions.copy()
+        far = positions >= self.exact
+        if far.any():
+            # frexp gives the exact floor(log2) of integers below 2**53
+            octave = np.frexp(positions[far] // self.exact)[1].astype(np.int64) - 1
+            base = self.exact << octave
+            bins[far] = self.exact + octave * self.per_octave + (positions[far] - base) // (base // self.per_octave)
+        return bins
+
+    def count(self, length: int) -> int:
+        """Number of bins covering reads of up to ``length`` bases."""
+        return int(self.index(length - 1)) + 1 if length > 0 else 0
+
+    def starts(self, count: int) -> np.ndarray:
+        """0-based first position of each of the first ``count`` bins."""
+        bins = np.arange(count, dtype=np.int64)
+        starts = bins.copy()
+        far = bins >= self.exact
+        octave, step = np.divmod(bins[far] - self.exact, self.per_octave)
+        base = self.exact << octave
+        starts[far] = base + step * (base // self.per_octave)
+        return starts
+
+    def ends(self, count: int) -> np.ndarray:
+        """0-based end (exclusive) of each of the first ``count`` bins."""
+        return self.starts(count + 1)[1:]
+
+    def sizes(self, count: int) -> np.ndarray:
+        """Bases covered by each of the first ``count`` bins."""
+        return np.diff(self.starts(count + 1))
+
+
+DEFAULT_POSITION_BINS = PositionBins()
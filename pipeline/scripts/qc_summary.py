@@ -0,0 +1,228 @@
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from checkpoint import atomic_path
+from fastq_reader import fastq_stem
+
+SUMMARY_SUFFIX = "_qc_summary.npz"
+JSON_SUFFIX = "_qc_summary.json"
+# Bump when the layout of the structured (JSON / aggregated) summary changes
+SUMMARY_VERSION = 4
+
+# Lower bounds of FastQC's duplication level bins: 1-9 copies, then >=10, >=50, ... >=10k
+DUPLICATION_BINS = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 50, 100, 500, 1000, 5000, 10000], dtype=np.int64)
+OVERREPRESENTED_SLOTS = 10
+ENRICHED_KMER_SLOTS = 10
+# Metrics a sampled preview reports confidence intervals for, in the rows of ``headline_intervals``
+HEADLINE_METRICS = ('mean_gc', 'mean_seq_quality', 'max_adapter_percent', 'duplicate_percent')
+
+
+def summary_path(fastq_file: Union[str, Path], folder: Path) -> Path:
+    return folder / f"{fastq_stem(fastq_file)}{SUMMARY_SUFFIX}"
+
+
+def summary_stem(path: Union[str, Path]) -> str:
+    """File stem a summary was written for (inverse of ``summary_path``)."""
+    return Path(path).name[:-len(SUMMARY_SUFFIX)]
+
+
+def json_summary_path(fastq_file: Union[str, Path], folder: Path) -> Path:
+    return folder / f"{fastq_stem(fastq_file)}{JSON_SUFFIX}"
+
+
+def find_summaries(sources: Iterable[Path]) -> List[Path]:
+    """Summary files given directly or found in the given report folders."""
+    summaries = []
+    for source in map(Path, sources):
+        summaries.extend(sorted(source.glob(f"*{SUMMARY_SUFFIX}")) if source.is_dir() else [source])
+    return summaries
+
+
+def build_summary(report_data: Dict) -> Dict[str, np.ndarray]:
+    """Flatten ``QCAccumulator.finalize()`` output into named, pre-binned NumPy arrays.
+
+    Everything the text report and the charts need is kept; nothing refers
+    back to the FASTQ data. Per-position metrics have one value per position
+    bin: ``*_positions`` hold the 0-based first base of each bin reported and
+    ``position_bin_starts``/``position_bin_ends`` the extent of every bin.
+    """
+    starts = np.asarray(report_data['position_bin_starts'], dtype=np.int64)
+    quality_stats = report_data['quality_stats']
+    duplication_levels = np.array(sorted(report_data['duplication_levels']), dtype=np.int64)
+    overrepresented = report_data['overrepresented']
+    # (estimate, lower, upper) per headline metric; NaN unless the report comes from a sampled preview
+    intervals = report_data.get('headline_intervals', {})
+    headline_intervals = np.array([intervals.get(metric, (np.nan,) * 3) for metric in HEADLINE_METRICS],
+                                  dtype=np.float64)
+    sampling = report_data.get('sampling', {})
+    kmer_content = report_data.get('kmer_content') or {}
+
+    return {
+        'total_seqs': np.int64(report_data['total_seqs']),
+        'mean_length': np.float64(report_data['mean_length']),
+        'mean_gc': np.float64(report_data['mean_gc']),
+        'mean_seq_quality': np.float64(report_data['mean_seq_quality']),
+        'gc_hist': np.asarray(report_data['gc_hist'], dtype=np.int64),
+        'length_counts': np.asarray(report_data['length_counts'], dtype=np.int64),
+        'per_seq_quality_hist': np.asarray(report_data['per_seq_quality_hist'], dtype=np.int64),
+        'position_bin_starts': starts,
+        'position_bin_ends': np.asarray(report_data['position_bin_ends'], dtype=np.int64),
+        'quality_positions': starts[quality_stats['bins']],
+        'quality_mean': np.asarray(quality_stats['mean'], dtype=np.float64),
+        'quality_median': np.asarray(quality_stats['median'], dtype=np.float64),
+        'quality_q25': np.asarray(quality_stats['q25'], dtype=np.float64),
+        'quality_q75': np.asarray(quality_stats['q75'], dtype=np.float64),
+        'tiles': np.array(report_data['tiles'], dtype=str),
+        'tile_positions': starts[report_data['tile_bins']],
+        'tile_mean': np.asarray(report_data['tile_mean'], dtype=np.float64).reshape(
+            len(report_data['tiles']), len(report_data['tile_bins'])),
+        'base_positions': starts[report_data['base_bins']],
+        'base_percent': np.asarray(report_data['base_percent'], dtype=np.float64).reshape(-1, 4),
+        'n_positions': starts[report_data['n_bins']],
+        'n_percent': np.asarray(report_data['n_percent'], dtype=np.float64),
+        'adapter_positions': starts[:len(report_data['adapter_percent'])],
+        'adapter_percent': np.asarray(report_data['adapter_percent'], dtype=np.float64),
+        'duplication_levels': duplication_levels,
+        'duplication_counts': np.array([report_data['duplication_levels'][level]
+                                        for level in duplication_levels.tolist()], dtype=np.float64),
+        'overrepresented_sequences': np.array([seq for seq, _ in overrepresented], dtype=str),
+        'overrepresented_counts': np.array([count for _, count in overrepresented], dtype=np.int64),
+        'estimation_notes': np.array(report_data.get('estimation_notes', []), dtype=str),
+        'headline_intervals': headline_intervals,
+        'sampled_fraction': np.float64(sampling.get('fraction', 1.0)),
+        'kmer_size': np.int64(kmer_content.get('kmer_size', 0)),
+        'kmer_group_starts': np.asarray(kmer_content.get('group_starts', []), dtype=np.int64),
+        'kmer_group_ends': np.asarray(kmer_content.get('group_ends', []), dtype=np.int64),
+        'kmer_sequences': np.array(kmer_content.get('sequences', []), dtype=str),
+        'kmer_counts': np.asarray(kmer_content.get('counts', []), dtype=np.int64),
+        'kmer_pvalues': np.asarray(kmer_content.get('pvalues', []), dtype=np.float64),
+        'kmer_max_obs_exp': np.asarray(kmer_content.get('max_obs_exp', []), dtype=np.float64),
+        'kmer_max_positions': np.asarray(kmer_content.get('max_positions', []), dtype=np.int64),
+        'kmer_obs_exp': np.asarray(kmer_content.get('obs_exp', np.zeros((0, 0))), dtype=np.float64),
+    }
+
+
+def save_summary(summary: Dict[str, np.ndarray], path: Path) -> Path:
+    """Write a summary as a compressed ``.npz`` (atomically)."""
+    with atomic_path(path) as temporary, open(temporary, "wb") as handle:
+        np.savez_compressed(handle, **summary)
+    return path
+
+
+def load_summary(path: Union[str, Path]) -> Dict[str, np.ndarray]:
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def structured_summary(summary: Dict[str, np.ndarray], sample: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """Fixed-layout form of a summary for machine consumption and aggregation.
+
+    Every per-position metric becomes a dense array with one entry per
+    position bin of the longest read (entry ``i`` covers bases
+    ``position_first_base[i]`` to ``position_last_base[i]``, just base
+    ``i + 1`` for short reads; NaN where no read reaches). Duplication
+    levels are binned as in FastQC (``DUPLICATION_BINS``) and the
+    overrepresented and enriched k-mer lists are padded to
+    ``OVERREPRESENTED_SLOTS`` and ``ENRICHED_KMER_SLOTS``, so every metric has
+    the same shape for samples with the same read length, and position bins
+    line up across samples of any length. Previews also carry
+    ``headline_intervals`` (rows follow ``HEADLINE_METRICS``).
+    """
+    total = int(summary['total_seqs'])
+    # Summaries written before position binning have a bin for every base
+    starts = summary.get('position_bin_starts', np.arange(len(summary['length_counts']) - 1))
+    ends = summary.get('position_bin_ends', starts + 1)
+    width = len(starts)
+
+    def dense(positions, values, fill=np.nan):
+        array = np.full((width,) + values.shape[1:], fill, dtype=np.float64)
+        array[np.searchsorted(starts, positions)] = values
+        return array
+
+    covered = dense(summary['quality_positions'], np.zeros(len(summary['quality_positions'])))
+    n_percent = covered.copy()
+    n_percent[np.searchsorted(starts, summary['n_positions'])] = summary['n_percent']
+    tile_mean = np.full((len(summary['tiles']), width), np.nan)
+    tile_mean[:, np.searchsorted(starts, summary['tile_positions'])] = summary['tile_mean']
+
+    levels, counts = summary['duplication_levels'], summary['duplication_counts']
+    duplication_percent = np.zeros(len(DUPLICATION_BINS))
+    if total > 0:
+        np.add.at(duplication_percent, np.searchsorted(DUPLICATION_BINS, levels, side='right') - 1,
+                  counts * levels / total * 100)
+
+    slots = OVERREPRESENTED_SLOTS
+    overrepresented = summary['overrepresented_sequences'][:slots]
+    overrepresented_counts = np.zeros(slots, dtype=np.int64)
+    overrepresented_counts[:len(overrepresented)] = summary['overrepresented_counts'][:slots]
+    adapter_percent = dense(summary['adapter_positions'], summary['adapter_percent'])
+
+    # Summaries written before k-mer content was added have no k-mer arrays
+    kmer_slots = ENRICHED_KMER_SLOTS
+    kmers = summary.get('kmer_sequences', np.zeros(0, dtype=str))[:kmer_slots]
+
+    def kmer_slot_values(name, fill, dtype):
+        values = np.full(kmer_slots, fill, dtype=dtype)
+        if len(kmers):
+            values[:len(kmers)] = summary[name][:kmer_slots]
+        return values
+
+    return {
+        'format_version': np.int64(SUMMARY_VERSION),
+        'sample': np.str_(sample or ""),
+        'total_seqs': np.int64(total),
+        'max_length': np.int64(len(summary['length_counts']) - 1),
+        'mean_length': np.float64(summary['mean_length']),
+        'mean_gc': np.float64(summary['mean_gc']),
+        'mean_seq_quality': np.float64(summary['mean_seq_quality']),
+        'max_adapter_percent': np.float64(np.nanmax(adapter_percent, initial=0.0)),
+        'duplicate_percent': np.float64(100 - counts.sum() / total * 100 if total else 0.0),
+        'gc_hist': summary['gc_hist'],
+        'per_seq_quality_hist': summary['per_seq_quality_hist'],
+        'length_counts': summary['length_counts'],
+        'position_first_base': starts + 1,
+        'position_last_base': ends,
+        'quality_mean': dense(summary['quality_positions'], summary['quality_mean']),
+        'quality_median': dense(summary['quality_positions'], summary['quality_median']),
+        'quality_q25': dense(summary['quality_positions'], summary['quality_q25']),
+        'quality_q75': dense(summary['quality_positions'], summary['quality_q75']),
+        'base_percent': dense(summary['base_positions'], summary['base_percent']),
+        'n_percent': n_percent,
+        'adapter_percent': adapter_percent,
+        'tiles': summary['tiles'],
+        'tile_mean': tile_mean,
+        'duplication_bins': DUPLICATION_BINS,
+        'duplication_percent': duplication_percent,
+        'overrepresented_sequences': np.array(overrepresented.tolist() + [""] * (slots - len(overrepresented)),
+                                              dtype=str),
+        'overrepresented_counts': overrepresented_counts,
+        'overrepresented_percent': overrepresented_counts / total * 100 if total else np.zeros(slots),
+        'estimation_notes': summary['estimation_notes'],
+        'sampled_fraction': np.float64(summary.get('sampled_fraction', 1.0)),
+        'headline_metrics': np.array(HEADLINE_METRICS, dtype=str),
+        'headline_intervals': summary.get('headline_intervals', np.full((len(HEADLINE_METRICS), 3), np.nan)),
+        'kmer_size': np.int64(summary.get('kmer_size', 0)),
+        'kmer_sequences': np.array(kmers.tolist() + [""] * (kmer_slots - len(kmers)), dtype=str),
+        'kmer_counts': kmer_slot_values('kmer_counts', 0, np.int64),
+        'kmer_pvalues': kmer_slot_values('kmer_pvalues', np.nan, np.float64),
+        'kmer_max_obs_exp': kmer_slot_values('kmer_max_obs_exp', np.nan, np.float64),
+        'kmer_max_positions': kmer_slot_values('kmer_max_positions', 0, np.int64),
+    }
+
+
+def _to_json(value: np.ndarray):
+    """Plain JSON value for an array; NaN becomes ``null``."""
+    array = np.asarray(value)
+    if array.dtype.kind == 'f':
+        array = np.where(np.isnan(array), None, array.astype(object))
+    return array.tolist()
+
+
+def save_summary_json(structured: Dict[str, np.ndarray], path: Path) -> Path:
+    """Write a structured summary as JSON (atomically)."""
+    with atomic_path(path) as temporary, open(temporary, "w") as handle:
+        json.dump({name: _to_json(value) for name, value in structured.items()}, handle, separators=(",", ":"))
+    return path
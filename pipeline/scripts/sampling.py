@@ -0,0 +1,174 @@
+import heapq
+import io
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from fastq_index import FastqIndex
+from fastq_reader import (NEWLINE, BgzfReader, FastqBatch, FastqReader, bgzf_compression_ratio, is_bgzf, is_gzip,
+                          next_bgzf_block, next_record_start, open_fastq)
+
+# Reads analyzed by a preview and the number of places in the file they are taken from
+DEFAULT_PREVIEW_READS = 200_000
+DEFAULT_PREVIEW_BLOCKS = 64
+# Decompressed bytes read from the start of the file to estimate the size of a record
+PROBE_SIZE = 1024 * 1024
+
+
+class ReadSample:
+    """Reads sampled from a FASTQ file, grouped into the blocks they were taken from.
+
+    Blocks are the sampling units for confidence intervals: the spread of a
+    metric between blocks shows how precisely the sample pins it down.
+    ``estimated_total`` is the (estimated) number of reads in the whole file.
+    """
+
+    def __init__(self, blocks: List[List[FastqBatch]], method: str, estimated_total: float):
+        self.blocks = blocks
+        self.method = method
+        self.estimated_total = estimated_total
+
+    @property
+    def reads(self) -> int:
+        return sum(len(batch) for block in self.blocks for batch in block)
+
+    @property
+    def fraction(self) -> float:
+        return min(self.reads / self.estimated_total, 1.0) if self.estimated_total else 1.0
+
+
+def _whole_records(window: bytes, at_file_start: bool) -> bytes:
+    """The complete records in a window of FASTQ data read from an arbitrary offset."""
+    first = 0 if at_file_start else next_record_start(io.BytesIO(window), 1, len(window))
+    newlines = np.flatnonzero(np.frombuffer(window, dtype=np.uint8)[first:] == NEWLINE)
+    complete = len(newlines) // 4 * 4
+    return window[first:first + int(newlines[complete - 1]) + 1] if complete else b""
+
+
+def _read_window(fastq_file: Path, offset: int, size: int, bgzf: bool) -> bytes:
+    """Whole records from about ``size`` decompressed bytes starting at (compressed) ``offset``."""
+    if bgzf:
+        with open(fastq_file, "rb") as handle:
+            start = next_bgzf_block(handle, offset)
+        if start is None:
+            return b""
+        with io.BufferedReader(BgzfReader(fastq_file, threads=1, blocks_per_task=4, start=start)) as reader:
+            return _whole_records(reader.read(size), start == 0)
+    with open(fastq_file, "rb") as handle:
+        handle.seek(offset)
+        return _whole_records(handle.read(size), offset == 0)
+
+
+def _first_reads(records: bytes, limit: int) -> List[FastqBatch]:
+    batches = []
+    # Long reads come in several smaller batches
+    with FastqReader(io.BytesIO(records), batch_size=limit) as reader:
+        for batch in reader:
+            batches.append(batch.subset(np.arange(min(len(batch), limit))))
+            limit -= len(batches[-1])
+            if limit <= 0:
+                break
+    return batches
+
+
+def block_sample(fastq_file: Path, reads: int = DEFAULT_PREVIEW_READS, blocks: int = DEFAULT_PREVIEW_BLOCKS,
+                 seed: int = 0) -> Optional[ReadSample]:
+    """Systematic sample of ``blocks`` runs of consecutive reads spread evenly over a plain or BGZF file.
+
+    Block positions are byte offsets one ``file size / blocks`` apart from a
+    random start, so the whole file is covered without reading it: for BGZF
+    input each block starts at the next BGZF block boundary, for plain input
+    at the next record. The total number of reads is estimated from the
+    record density of the sampled windows, or taken from the file's offset
+    index when it has one. Returns ``None`` when the file is so small that
+    sampling would read a large part of it anyway.
+    """
+    bgzf = is_bgzf(fastq_file)
+    file_size = Path(fastq_file).stat().st_size
+    probe = _read_window(fastq_file, 0, PROBE_SIZE, bgzf)
+    probe_reads = probe.count(b"\n") // 4
+    if not probe_reads:
+        return None
+    record_size = len(probe) / probe_reads
+    ratio = bgzf_compression_ratio(fastq_file) if bgzf else 1.0
+    per_block = -(-reads // blocks)
+    # A couple of records' slack for the partial records cut off at either end of a window
+    window = int((per_block + 2) * record_size * 1.05)
+    if 2 * blocks * window >= file_size * ratio:
+        return None
+
+    start = np.random.default_rng(seed).random()
+    sampled = []
+    window_bytes = window_reads = 0
+    for i in range(blocks):
+        offset = int((i + start) * file_size / blocks)
+        records = _read_window(fastq_file, offset, window, bgzf)
+        if records:
+            sampled.append(_first_reads(records, per_block))
+            window_bytes += len(records)
+            window_reads += records.count(b"\n") // 4
+    index = FastqIndex.load(fastq_file)
+    if index is not None:
+        estimated_total = float(index.records)
+    else:
+        estimated_total = file_size * ratio * window_reads / window_bytes if window_bytes else 0.0
+    return ReadSample(sampled, "bgzf blocks" if bgzf else "blocks", estimated_total)
+
+
+def reservoir_sample(fastq_file: Path, reads: int = DEFAULT_PREVIEW_READS, blocks: int = DEFAULT_PREVIEW_BLOCKS,
+                     seed: int = 0) -> Optional[ReadSample]:
+    """Random sample of ``blocks`` windows of consecutive reads from a stream that cannot seek (plain gzip).
+
+    The decompressed stream is cut into windows of about ``reads / blocks``
+    reads; each window gets a random priority and the ``blocks`` windows with
+    the lowest priorities are kept (reservoir sampling of windows). Only the
+    kept windows are parsed, but the whole file is still decompressed.
+    Returns ``None`` when the file is small enough to analyze completely.
+    """
+    rng = np.random.default_rng(seed)
+    per_block = -(-reads // blocks)
+    kept: List[Tuple[float, int, bytes]] = []
+    lines = windows = 0
+    with open_fastq(fastq_file) as handle:
+        buffer = handle.read(PROBE_SIZE)
+        probe_reads = buffer.count(b"\n") // 4
+        if not probe_reads:
+            return None
+        window = int((per_block + 2) * len(buffer) / probe_reads * 1.05)
+        while True:
+            if len(buffer) < window:
+                buffer += handle.read(window - len(buffer))
+            if not buffer:
+                break
+            chunk, buffer = buffer[:window], buffer[window:]
+            lines += chunk.count(b"\n")
+            # Max-heap on priority (negated) holding the lowest-priority windows seen so far
+            entry = (-rng.random(), windows, chunk)
+            if len(kept) < blocks:
+                heapq.heappush(kept, entry)
+            elif entry[0] > kept[0][0]:
+                heapq.heapreplace(kept, entry)
+            windows += 1
+    if windows < 2 * blocks:
+        return None
+
+    sampled = []
+    for _, index, chunk in sorted(kept, key=lambda entry: entry[1]):
+        records = _whole_records(chunk, index == 0)
+        if records:
+            sampled.append(_first_reads(records, per_block))
+    return ReadSample(sampled, "gzip windows", lines // 4)
+
+
+def sample_reads(fastq_file: Path, reads: int = DEFAULT_PREVIEW_READS, blocks: int = DEFAULT_PREVIEW_BLOCKS,
+                 seed: int = 0) -> Optional[ReadSample]:
+    """Sample reads for a preview: spread-out blocks where the file allows seeking, else a reservoir.
+
+    Plain and BGZF files are sampled in time that does not depend on their
+    size; ordinary gzip files have to be decompressed completely. Returns
+    ``None`` when the file is small enough to analyze completely.
+    """
+    if is_gzip(fastq_file) and not is_bgzf(fastq_file):
+        return reservoir_sample(fastq_file, reads, blocks, seed)
+    return block_sample(fastq_file, reads, blocks, seed)
@@ -0,0 +1,229 @@
+import csv
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastq_reader import fastq_stem, is_gzip
+
+FASTQ_EXTENSIONS = ["*.fastq", "*.fq", "*.fastq.gz", "*.fq.gz"]
+
+# Illumina-style mate naming: sample_R1.fastq.gz, sample_S1_L001_R2_001.fastq.gz, ...
+MATE_PATTERN = re.compile(r"^(?P<sample>.+?)[_.]R(?P<mate>[12])(?P<suffix>(?:_\d+)?)$")
+
+# Memory model for one sample, calibrated on the fused QC/trim pass: a fixed
+# per-process cost (NumPy batches, adapter index, matplotlib) plus the exact
+# duplication counters, which grow with the uncompressed input size.
+WORKER_BASE_MEMORY = 256 * 1024 * 1024
+MEMORY_PER_INPUT_BYTE = 2.5
+GZIP_EXPANSION = 4
+# Share of the available memory the scheduler is allowed to reserve
+MEMORY_HEADROOM = 0.8
+
+
+class Sample:
+    """One sample: a single-end FASTQ file or an R1/R2 pair."""
+
+    def __init__(self, name: str, forward: Path, reverse: Optional[Path] = None):
+        self.name = name
+        self.forward = Path(forward)
+        self.reverse = Path(reverse) if reverse is not None else None
+
+    @property
+    def paired(self) -> bool:
+        return self.reverse is not None
+
+    @property
+    def files(self) -> List[Path]:
+        return [self.forward, self.reverse] if self.paired else [self.forward]
+
+    def __repr__(self):
+        files = ", ".join(path.name for path in self.files)
+        return f"Sample({self.name}: {files})"
+
+
+def find_fastq_files(folder_path: Path) -> List[Path]:
+    """Find all FASTQ files in the directory, including compressed versions."""
+    fastq_files = []
+    for ext in FASTQ_EXTENSIONS:
+        fastq_files.extend(folder_path.glob(ext))
+    return sorted(fastq_files)
+
+
+def mate_key(fastq_file: Path) -> Optional[Tuple[str, str]]:
+    """``(sample name, mate)`` for an ``_R1``/``_R2`` file name, or ``None`` for unpaired names.
+
+    Illumina's ``_001`` chunk number is dropped from the name; other chunk
+    numbers are kept so split files stay separate samples.
+    """
+    match = MATE_PATTERN.match(fastq_stem(fastq_file))
+    if match is None:
+        return None
+    suffix = match.group("suffix")
+    return match.group("sample") + ("" if suffix == "_001" else suffix), match.group("mate")
+
+
+def detect_samples(fastq_files: Sequence[Path]) -> List[Sample]:
+    """Group FASTQ files into samples, pairing ``_R1``/``_R2`` mates by name.
+
+    A file whose mate is missing is processed as a single-end sample.
+    """
+    mates: Dict[str, Dict[str, Path]] = {}
+    samples = []
+    for fastq_file in sorted(fastq_files):
+        key = mate_key(fastq_file)
+        if key is None:
+            samples.append(Sample(fastq_stem(fastq_file), fastq_file))
+        else:
+            mates.setdefault(key[0], {})[key[1]] = fastq_file
+    for name, files in mates.items():
+        if "1" in files and "2" in files:
+            samples.append(Sample(name, files["1"], files["2"]))
+        else:
+            for fastq_file in files.values():
+                print(f"Warning: no mate found for {fastq_file.name}; processing it as single-end.")
+                samples.append(Sample(fastq_stem(fastq_file), fastq_file))
+    return sorted(samples, key=lambda sample: sample.name)
+
+
+def read_sample_sheet(sheet_path: Path) -> List[Sample]:
+    """Read a CSV/TSV sample sheet with ``sample``, ``fastq_1`` and optional ``fastq_2`` columns.
+
+    Relative paths are resolved against the sheet's directory.
+    """
+    sheet_path = Path(sheet_path)
+    with open(sheet_path, "r", newline="") as handle:
+        dialect = csv.Sniffer().sniff(handle.read(4096), delimiters=",\t")
+        handle.seek(0)
+        rows = list(csv.DictReader(handle, dialect=dialect))
+
+    samples = []
+    for line, row in enumerate(rows, 2):
+        row = {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+        if not row.get("sample") or not row.get("fastq_1"):
+            raise ValueError(f"{sheet_path.name}, line {line}: 'sample' and 'fastq_1' are required")
+        forward = sheet_path.parent / row["fastq_1"]
+        reverse = sheet_path.parent / row["fastq_2"] if row.get("fastq_2") else None
+        for fastq_file in [forward, reverse]:
+            if fastq_file is not None and not fastq_file.is_file():
+                raise ValueError(f"{sheet_path.name}, line {line}: {fastq_file} does not exist")
+        samples.append(Sample(row["sample"], forward, reverse))
+    return samples
+
+
+def load_samples(source: Path) -> List[Sample]:
+    """Samples from a directory of FASTQ files or from a sample sheet."""
+    source = Path(source)
+    if source.is_dir():
+        return detect_samples(find_fastq_files(source))
+    return read_sample_sheet(source)
+
+
+def available_memory() -> int:
+    """Memory available to new processes in bytes (MemAvailable on Linux)."""
+    try:
+        with open("/proc/meminfo", "r") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects affinity masks and cgroup cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def estimate_memory(sample: Sample) -> int:
+    """Rough peak memory of processing ``sample`` in one worker."""
+    input_bytes = 0
+    for fastq_file in sample.files:
+        size = fastq_file.stat().st_size
+        input_bytes += size * GZIP_EXPANSION if is_gzip(fastq_file) else size
+    return int(WORKER_BASE_MEMORY + input_bytes * MEMORY_PER_INPUT_BYTE)
+
+
+class ResourceBudget:
+    """CPU and memory limits for a batch run.
+
+    ``max_workers`` defaults to the available CPUs and ``memory`` to a share
+    of the currently available memory. A sample counts as one CPU: its
+    compute thread, which holds the GIL for most of the work. Its reader,
+    writer and BGZF inflate threads are not counted. They mostly wait on I/O
+    or run in zlib, so with compressed input or output a full pool can use
+    somewhat more than ``max_workers`` cores; lower ``max_workers`` where
+    that matters.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, memory: Optional[int] = None):
+        self.max_workers = max(1, max_workers or available_cpus())
+        self.memory = memory if memory is not None else int(available_memory() * MEMORY_HEADROOM)
+
+    def __repr__(self):
+        return f"ResourceBudget({self.max_workers} workers, {self.memory / 2 ** 30:.1f} GiB)"
+
+
+def run_samples(samples: Sequence[Sample], task: Callable, budget: Optional[ResourceBudget] = None,
+                **task_kwargs) -> Dict[str, object]:
+    """Run ``task(sample, **task_kwargs)`` for every sample on a process pool within ``budget``.
+
+    Samples are started largest first, as long as a worker is free and their
+    estimated memory fits in what is left of the budget; a sample larger than
+    the whole budget runs on its own. ``task`` must be a picklable top-level
+    function. Returns ``{sample name: result}``; failed samples map to their
+    exception and are reported without stopping the batch (see ``failed_samples``).
+    """
+    budget = budget or ResourceBudget()
+    # Each estimate stats (and sniffs) the input files, so it is made once per sample
+    memory = {sample: estimate_memory(sample) for sample in samples}
+    pending = sorted(samples, key=memory.get, reverse=True)
+    results = {}
+    if not pending:
+        return results
+    workers = min(budget.max_workers, len(pending))
+    print(f"\nScheduling {len(pending)} sample(s) on {workers} worker(s) within {budget}")
+
+    start = time.perf_counter()
+    running = {}
+    reserved = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            while pending and len(running) < workers:
+                sample = next((s for s in pending if reserved + memory[s] <= budget.memory), None)
+                if sample is None:
+                    if running:
+                        break
+                    sample = pending[0]
+                pending.remove(sample)
+                reserved += memory[sample]
+                running[executor.submit(task, sample, **task_kwargs)] = sample
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                sample = running.pop(future)
+                reserved -= memory[sample]
+                try:
+                    results[sample.name] = future.result()
+                    print(f"Finished {sample.name} ({len(results) - len(failed)}/{len(samples)})")
+                except Exception as e:
+                    results[sample.name] = e
+                    failed.append(sample.name)
+                    print(f"Error processing {sample.name}: {str(e)}")
+
+    elapsed = time.perf_counter() - start
+    print(f"Processed {len(samples) - len(failed)} of {len(samples)} sample(s) in {elapsed:.1f} s"
+          + (f"; {len(failed)} failed" if failed else ""))
+    return results
+
+
+def failed_samples(results: Dict[str, object]) -> List[str]:
+    """Names of the samples whose task raised, from the results of ``run_samples``."""
+    return [name for name, result in results.items() if isinstance(result, Exception)]
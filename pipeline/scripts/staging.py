@@ -0,0 +1,178 @@
+"""Staged execution: overlap reading, computing and writing on threads linked by bounded queues.
+
+A run is split into three stages:
+
+- ``prefetch`` reads, decompresses and parses ahead on a reader thread;
+- ``ordered_map`` runs the per-batch compute on worker threads and hands
+  results back in input order;
+- ``BackgroundWriter`` compresses and writes output buffers on a writer
+  thread, in the order they were produced.
+
+Every queue holds at most ``depth`` items, so a fast stage blocks
+(backpressure) instead of buffering the whole file when the next stage
+falls behind. Decompression, compression, file I/O and most NumPy work
+release the GIL, so the stages genuinely run in parallel and disk or
+network latency is hidden behind the compute. Errors raised on a
+background thread are re-raised in the thread that consumes its output.
+"""
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, TypeVar
+
+from metrics import METRICS
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Items (batches or output buffers) each queue may hold before its producer waits
+DEFAULT_QUEUE_DEPTH = 4
+# How often a blocked thread checks whether the other side has stopped, in seconds
+_POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+def _put(queue: Queue, item, stop: threading.Event) -> bool:
+    """Put ``item`` on a bounded queue, waiting for space; gives up (False) once ``stop`` is set."""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def prefetch(items: Iterable[T], depth: int = DEFAULT_QUEUE_DEPTH) -> Iterator[T]:
+    """Iterate ``items`` on a background thread, keeping up to ``depth`` of them ready.
+
+    Typically wraps a ``FastqReader`` so the next batches are read and parsed
+    while the current one is processed. Anything the caller needs to know
+    about the producer's state at a given item (such as ``reader.offset``
+    for checkpoints) must be captured into the item itself, e.g.
+    ``prefetch((batch, reader.offset) for batch in reader)``. Leaving the loop
+    early stops the reader thread before returning.
+    """
+    queue: Queue = Queue(maxsize=max(depth, 1))
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                if not _put(queue, (item, None), stop):
+                    return
+            _put(queue, (_DONE, None), stop)
+        except BaseException as e:
+            _put(queue, (_DONE, e), stop)
+
+    thread = threading.Thread(target=produce, name="fastq-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def ordered_map(func: Callable[[T], R], items: Iterable[T], workers: int = 1,
+                depth: int = DEFAULT_QUEUE_DEPTH) -> Iterator[R]:
+    """``map(func, items)`` on ``workers`` threads, yielding results in input order.
+
+    At most ``workers + depth`` items are in flight, so a slow consumer holds
+    back the input instead of letting results pile up. ``func`` must not
+    share mutable state between calls (return per-item counters and merge
+    them in the consumer instead). With ``workers <= 1`` this is plain
+    ``map`` on the calling thread.
+    """
+    if workers <= 1:
+        yield from map(func, items)
+        return
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fastq-compute") as executor:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= workers + depth:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class BackgroundWriter:
+    """Write-only file wrapper that performs the writes (and compression) on a background thread.
+
+    ``write`` queues the buffer and returns at once unless ``depth`` buffers
+    are already waiting, in which case it blocks until the writer catches up.
+    Buffers are written in the order they were queued. ``flush`` waits until
+    everything queued is written; ``close`` also closes the wrapped handle.
+    After an error on the writer thread nothing more is written, and the
+    error is raised by every following ``write``, ``flush`` and ``close``.
+    """
+
+    def __init__(self, handle: BinaryIO, depth: int = DEFAULT_QUEUE_DEPTH):
+        self.handle = handle
+        self._queue: Queue = Queue(maxsize=max(depth, 1))
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._drain, name="fastq-writer", daemon=True)
+        self._thread.start()
+        self.closed = False
+
+    def _drain(self) -> None:
+        while True:
+            data = self._queue.get()
+            try:
+                if data is _DONE:
+                    return
+                if self._error is None:
+                    with METRICS.stage("write"):
+                        self.handle.write(data)
+                    METRICS.count("bytes_out", len(data))
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def write(self, data: bytes) -> int:
+        if self.closed:
+            raise ValueError("write to closed BackgroundWriter")
+        self._raise()
+        if data:
+            self._queue.put(data)
+        return len(data)
+
+    def flush(self) -> None:
+        self._queue.join()
+        self._raise()
+        self.handle.flush()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._queue.put(_DONE)
+            self._thread.join()
+            self._raise()
+        finally:
+            self.handle.close()
+
+    def __enter__(self) -> "BackgroundWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -1,231 +1,365 @@
-from Bio import SeqIO
+import time
+from contextlib import ExitStack
+from typing import Iterable
 
-def wasm_trim_reads(input_fastq, output_fastq, min_length=36, quality_threshold=20):
+import numpy as np
+
+from adapters import AdapterIndex, default_adapter_index, encode_bases, kmer_codes, reverse_complement
+from checkpoint import atomic_path
+from fastq_reader import FastqBatch, FastqReader, open_fastq_output
+from metrics import METRICS
+from staging import DEFAULT_QUEUE_DEPTH, BackgroundWriter, ordered_map, prefetch
+
+
+class TrimStats:
+    """Per-run trimming counters and throughput."""
+
+    # What ``dedup_reads`` and ``duplicates`` count
+    DEDUP_UNIT = "reads"
+
+    def __init__(self):
+        self.reads_in = 0
+        self.reads_out = 0
+        self.bases_in = 0
+        self.bases_out = 0
+        self.adapter_trimmed = 0
+        self.quality_trimmed = 0
+        self.too_short = 0
+        # Reads looked at and removed by deduplication (see ``dedup``), if it ran
+        self.dedup_reads = 0
+        self.duplicates = 0
+        self.elapsed = 0.0
+
+    @property
+    def reads_per_second(self) -> float:
+        return self.reads_in / self.elapsed if self.elapsed else 0.0
+
+    def record_metrics(self) -> None:
+        """Add this run's read and base counts to the run metrics (see ``metrics``)."""
+        for name in ("reads_in", "reads_out", "bases_in", "bases_out"):
+            METRICS.count(name, getattr(self, name))
+
+    def merge(self, other: "TrimStats") -> "TrimStats":
+        """Add another run's (or batch's) counters to this one; ``elapsed`` is left alone."""
+        for name, value in vars(other).items():
+            if name != "elapsed":
+                setattr(self, name, getattr(self, name) + value)
+        return self
+
+    @property
+    def duplicate_rate(self) -> float:
+        return self.duplicates / self.dedup_reads if self.dedup_reads else 0.0
+
+    def summary(self) -> str:
+        kept = self.reads_out / self.reads_in * 100 if self.reads_in else 0.0
+        dedup = (f"Duplicates removed: {self.duplicates} of {self.dedup_reads} {self.DEDUP_UNIT} "
+                 f"({self.duplicate_rate * 100:.2f}%)\n" if self.dedup_reads else "")
+        return (
+            f"Input reads: {self.reads_in}, Surviving: {self.reads_out} ({kept:.2f}%), "
+            f"Dropped (too short): {self.too_short}\n"
+            f"Adapter-trimmed reads: {self.adapter_trimmed}, Quality-trimmed reads: {self.quality_trimmed}\n"
+            + dedup +
+            f"Bases in: {self.bases_in}, Bases out: {self.bases_out}\n"
+            f"Throughput: {self.reads_per_second:,.0f} reads/s ({self.elapsed:.2f} s)"
+        )
+
+
+class PairedTrimStats(TrimStats):
+    """Trimming counters for a paired-end run; ``reads_*`` count individual mates."""
+
+    DEDUP_UNIT = "pairs"
+
+    def __init__(self):
+        super().__init__()
+        self.pairs_in = 0
+        self.pairs_out = 0
+        self.forward_only = 0
+        self.reverse_only = 0
+        self.overlap_trimmed = 0
+
+    def summary(self) -> str:
+        kept = self.pairs_out / self.pairs_in * 100 if self.pairs_in else 0.0
+        dropped = self.pairs_in - self.pairs_out - self.forward_only - self.reverse_only - self.duplicates
+        return (
+            f"Input read pairs: {self.pairs_in}, Both surviving: {self.pairs_out} ({kept:.2f}%), "
+            f"Forward only: {self.forward_only}, Reverse only: {self.reverse_only}, Dropped: {dropped}\n"
+            f"Pairs trimmed at overlap (insert < read length): {self.overlap_trimmed}\n"
+            + super().summary()
+        )
+
+
+class ReadTrimmer:
+    """Adapter clipping, sliding-window and 3'-end quality trimming over FASTQ batches.
+
+    Steps run in Trimmomatic order: adapter clipping, SLIDINGWINDOW (cut inside
+    the first window whose mean quality drops below ``quality_threshold``),
+    TRAILING (drop 3' bases below ``trailing_quality``) and MINLEN.
+    """
+
+    # Seed length and mismatch rate used to detect read-through from R1/R2 overlap
+    OVERLAP_SEED = 12
+    OVERLAP_MISMATCH_RATE = 0.1
+
+    def __init__(self, min_length=36, quality_threshold=20, window_size=4, trailing_quality=3,
+                 adapter_index: AdapterIndex = None):
+        self.min_length = min_length
+        self.quality_threshold = quality_threshold
+        self.window_size = window_size
+        self.trailing_quality = trailing_quality
+        self.adapter_index = adapter_index if adapter_index is not None else default_adapter_index()
+
+    def parameters(self) -> dict:
+        """Everything that affects the trimmed output, e.g. for cache keys."""
+        return {
+            "min_length": self.min_length,
+            "quality_threshold": self.quality_threshold,
+            "window_size": self.window_size,
+            "trailing_quality": self.trailing_quality,
+            "overlap_seed": self.OVERLAP_SEED,
+            "overlap_mismatch_rate": self.OVERLAP_MISMATCH_RATE,
+            "adapters": self.adapter_index.parameters(),
+        }
+
+    def sliding_window(self, batch: FastqBatch, lengths: np.ndarray) -> np.ndarray:
+        """Cut each read at the first window whose average quality is below the threshold."""
+        window = self.window_size
+        if batch.width < window:
+            return lengths
+        quals = batch.quals.astype(np.int64)
+        cumulative = np.zeros((len(batch), batch.width + 1), dtype=np.int64)
+        np.cumsum(quals, axis=1, out=cumulative[:, 1:])
+        window_sums = cumulative[:, window:] - cumulative[:, :-window]
+        starts = np.arange(window_sums.shape[1])
+        failing = (window_sums < self.quality_threshold * window) & (starts + window <= lengths[:, None])
+        has_fail = failing.any(axis=1)
+        keep = np.where(has_fail, failing.argmax(axis=1), lengths)
+        # As in Trimmomatic, keep the leading bases of the failing window that pass on their own
+        rows = np.flatnonzero(has_fail)
+        extending = np.ones(len(rows), dtype=bool)
+        for _ in range(window):
+            extending &= quals[rows, keep[rows]] >= self.quality_threshold
+            keep[rows] += extending
+        return np.minimum(lengths, keep)
+
+    def trailing(self, batch: FastqBatch, lengths: np.ndarray) -> np.ndarray:
+        """Remove bases below ``trailing_quality`` from the 3' end."""
+        good = (batch.quals >= self.trailing_quality) & (np.arange(batch.width) < lengths[:, None])
+        last_good = batch.width - np.argmax(good[:, ::-1], axis=1)
+        return np.where(good.any(axis=1), last_good, 0)
+
+    def trim_lengths(self, batch: FastqBatch, stats: TrimStats, max_lengths: np.ndarray = None) -> np.ndarray:
+        """Return the trimmed length of every read in the batch (reads are only cut at the 3' end).
+
+        ``max_lengths`` caps the adapter-free length, e.g. at the insert size of a read pair.
+        """
+        with METRICS.stage("trim.adapters"):
+            lengths = self.adapter_index.find(batch)
+        if max_lengths is not None:
+            lengths = np.minimum(lengths, max_lengths)
+        stats.adapter_trimmed += int((lengths < batch.lengths).sum())
+        with METRICS.stage("trim.quality"):
+            quality_lengths = self.trailing(batch, self.sliding_window(batch, lengths))
+        stats.quality_trimmed += int((quality_lengths < lengths).sum())
+        return quality_lengths
+
+    def insert_lengths(self, forward: FastqBatch, reverse: FastqBatch) -> np.ndarray:
+        """Estimate each pair's insert size from the overlap of R1 with the reverse complement of R2.
+
+        When the insert is shorter than the reads, R1 ends with the reverse
+        complement of the start of R2 and everything past the insert is
+        adapter. Pairs without such an overlap get the longest read length.
+        """
+        k = self.OVERLAP_SEED
+        inserts = np.maximum(forward.lengths, reverse.lengths)
+        if forward.width < k or reverse.width < k:
+            return inserts
+
+        forward_codes = encode_bases(forward.seqs)
+        forward_codes[~forward.mask()] = 4
+        kmers, valid = kmer_codes(forward_codes, k)
+        reverse_start = encode_bases(reverse.seqs[:, :k])
+        seed = np.zeros(len(reverse), dtype=np.int64)
+        for j in range(k - 1, -1, -1):
+            seed = (seed << 2) | (3 - reverse_start[:, j])
+        seed_valid = (reverse_start < 4).all(axis=1) & (reverse.lengths >= k)
+
+        hits = valid & (kmers == seed[:, None]) & seed_valid[:, None]
+        for row in np.flatnonzero(hits.any(axis=1)):
+            read1 = forward.seqs[row, :forward.lengths[row]].tobytes().upper().decode()
+            read2 = reverse.seqs[row, :reverse.lengths[row]].tobytes().upper().decode()
+            for position in np.flatnonzero(hits[row])[::-1].tolist():
+                insert = position + k
+                overlap = min(insert, len(read2))
+                mismatches = sum(a != b for a, b in zip(read1[insert - overlap:insert],
+                                                         reverse_complement(read2[:overlap])))
+                if mismatches <= max(1, int(overlap * self.OVERLAP_MISMATCH_RATE)):
+                    inserts[row] = insert
+                    break
+        return inserts
+
+    def trim_pair(self, forward: FastqBatch, reverse: FastqBatch, stats: PairedTrimStats):
+        """Trim matching batches of R1/R2 reads.
+
+        Returns ``(forward_paired, reverse_paired, forward_unpaired, reverse_unpaired)``;
+        a mate whose partner fell below ``min_length`` goes to the unpaired output.
+        """
+        if len(forward) != len(reverse):
+            raise ValueError("Paired FASTQ files are out of sync: different numbers of reads")
+        if len(forward) and _pair_name(forward.header(0)) != _pair_name(reverse.header(0)):
+            raise ValueError(f"Paired FASTQ files are out of sync: {forward.header(0)!r} vs {reverse.header(0)!r}")
+
+        with METRICS.stage("trim.overlap"):
+            inserts = self.insert_lengths(forward, reverse)
+        stats.overlap_trimmed += int(((inserts < forward.lengths) | (inserts < reverse.lengths)).sum())
+        forward_lengths = self.trim_lengths(forward, stats, inserts)
+        reverse_lengths = self.trim_lengths(reverse, stats, inserts)
+        keep_forward = forward_lengths >= self.min_length
+        keep_reverse = reverse_lengths >= self.min_length
+        both = keep_forward & keep_reverse
+
+        forward = forward.truncate(forward_lengths)
+        reverse = reverse.truncate(reverse_lengths)
+        outputs = (
+            forward.subset(both), reverse.subset(both),
+            forward.subset(keep_forward & ~keep_reverse), reverse.subset(keep_reverse & ~keep_forward),
+        )
+
+        stats.pairs_in += len(forward)
+        stats.pairs_out += int(both.sum())
+        stats.forward_only += len(outputs[2])
+        stats.reverse_only += len(outputs[3])
+        stats.reads_in += 2 * len(forward)
+        stats.bases_in += int(forward.lengths.sum() + reverse.lengths.sum())
+        stats.too_short += int((~keep_forward).sum() + (~keep_reverse).sum())
+        stats.reads_out += sum(len(batch) for batch in outputs)
+        stats.bases_out += sum(int(batch.lengths.sum()) for batch in outputs)
+        return outputs
+
+    def trim_batch(self, batch: FastqBatch, stats: TrimStats) -> FastqBatch:
+        """Trim a batch and return the reads that are still at least ``min_length`` long."""
+        lengths = self.trim_lengths(batch, stats)
+        keep = lengths >= self.min_length
+        stats.reads_in += len(batch)
+        stats.bases_in += int(batch.lengths.sum())
+        stats.too_short += int((~keep).sum())
+        trimmed = batch.truncate(lengths).subset(keep)
+        stats.reads_out += len(trimmed)
+        stats.bases_out += int(trimmed.lengths.sum())
+        return trimmed
+
+
+def wasm_trim_reads(input_fastq, output_fastq, min_length=36, quality_threshold=20, trimmer=None,
+                    compresslevel=None, workers=1, queue_depth=DEFAULT_QUEUE_DEPTH, deduplicator=None):
     """
     WASM-friendly FASTQ trimmer using pure Python (no subprocess or external binaries).
+
+    Reads are adapter-clipped and quality-trimmed rather than discarded, and
+    surviving reads are written one batch at a time. Input may be gzip/BGZF
+    compressed; an output path ending in ``.gz`` is written compressed at
+    ``compresslevel``. Reading, trimming (on ``workers`` threads) and writing
+    overlap, with up to ``queue_depth`` batches queued between stages (see
+    ``staging``). With a ``dedup.Deduplicator`` only the first of the
+    trimmed reads with the same sequence (and UMI) is written. Returns the
+    run's TrimStats.
     """
-    with open(output_fastq, "w") as out_handle:
-        for record in SeqIO.parse(input_fastq, "fastq"):
-            if min(record.letter_annotations["phred_quality"]) >= quality_threshold:
-                if len(record.seq) >= min_length:
-                    SeqIO.write(record, out_handle, "fastq")
-
-
-# # Define adapter sequences
-# adapters_forward = [
-#     "TACACTCTTTCCCTACACGACGCTCTTCCGATCT",  # PrefixPE/1
-#     "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGTA"   # PE1_rc
-# ]
-# adapters_reverse = [
-#     "GTGACTGGAGTTCAGACGTGTGCTCTTCCGATCT",  # PrefixPE/2
-#     "AGATCGGAAGAGCACACGTCTGAACTCCAGTCAC"   # PE2_rc
-# ]
-
-# def trim_adapter(sequence, qualities, adapters):
-#     """
-#     Trims adapter sequences from a given sequence.
-    
-#     Parameters:
-#     - sequence: The sequence to trim.
-#     - qualities: The quality scores corresponding to the sequence.
-#     - adapters: List of adapter sequences to check for trimming.
-    
-#     Returns:
-#     - Tuple of trimmed sequence and trimmed qualities.
-#     """
-#     trimmed_seq = sequence
-#     trimmed_qualities = qualities
-#     for adapter in adapters:
-#         adapter_pos = trimmed_seq.find(adapter)
-#         if adapter_pos != -1:
-#             trimmed_seq = trimmed_seq[:adapter_pos]
-#             trimmed_qualities = trimmed_qualities[:adapter_pos]
-#     return trimmed_seq, trimmed_qualities
-
-# def trim_single_end(input_file, output_file, adapter_sequence, minimum_length=20):
-#     """
-#     Trims adapter sequences from single-end RNA sequencing reads.
-    
-#     Parameters:
-#     - input_file: Path to the input FASTQ file.
-#     - output_file: Path to the output FASTQ file after trimming.
-#     - adapter_sequence: The adapter sequence to be trimmed.
-#     - minimum_length: Minimum length of reads to keep after trimming (default: 20).
-    
-#     Returns:
-#     - None
-#     """
-#     try:
-#         with open(input_file, "r") as infile, open(output_file, "w") as outfile:
-#             for record in SeqIO.parse(infile, "fastq"):
-#                 sequence = record.seq
-#                 qualities = record.letter_annotations["phred_quality"]
-                
-#                 # Trim adapter
-#                 trimmed_sequence, trimmed_qualities = trim_adapter(sequence, qualities, [adapter_sequence])
-                
-#                 # Write trimmed read if it meets the minimum length
-#                 if len(trimmed_sequence) >= minimum_length:
-#                     record.seq = trimmed_sequence
-#                     record.letter_annotations["phred_quality"] = trimmed_qualities
-#                     SeqIO.write(record, outfile, "fastq")
-        
-#         print(f"Single-end trimming completed successfully. Output saved to {output_file}")
-#     except Exception as e:
-#         print(f"Error during single-end trimming: {e}")
-
-# def trim_paired_end(forward_input, reverse_input, forward_output, reverse_output, minimum_length=20):
-#     """
-#     Trims adapter sequences from paired-end RNA sequencing reads.
-    
-#     Parameters:
-#     - forward_input: Path to the forward input FASTQ file.S
-#     - reverse_input: Path to the reverse input FASTQ file.
-#     - forward_output: Path to the forward output FASTQ file after trimming.
-#     - reverse_output: Path to the reverse output FASTQ file after trimming.
-#     - minimum_length: Minimum length of reads to keep after trimming (default: 20).
-    
-#     Returns:
-#     - None
-#     """
-#     try:
-#         with open(forward_input, "r") as fin, open(reverse_input, "r") as rin, \
-#              open(forward_output, "w") as fout, open(reverse_output, "w") as rout:
-            
-#             for forward_record, reverse_record in zip(SeqIO.parse(fin, "fastq"), SeqIO.parse(rin, "fastq")):
-#                 # Trim forward read
-#                 forward_seq = forward_record.seq
-#                 forward_qualities = forward_record.letter_annotations["phred_quality"]
-#                 forward_trimmed_seq, forward_trimmed_qualities = trim_adapter(forward_seq, forward_qualities, adapters_forward)
-                
-#                 # Trim reverse read
-#                 reverse_seq = reverse_record.seq
-#                 reverse_qualities = reverse_record.letter_annotations["phred_quality"]
-#                 reverse_trimmed_seq, reverse_trimmed_qualities = trim_adapter(reverse_seq, reverse_qualities, adapters_reverse)
-                
-#                 # Write trimmed reads if they meet the minimum length
-#                 if len(forward_trimmed_seq) >= minimum_length and len(reverse_trimmed_seq) >= minimum_length:
-#                     # Update forward record
-#                     forward_record.seq = forward_trimmed_seq
-#                     forward_record.letter_annotations["phred_quality"] = forward_trimmed_qualities
-                    
-#                     # Update reverse record
-#                     reverse_record.seq = reverse_trimmed_seq
-#                     reverse_record.letter_annotations["phred_quality"] = reverse_trimmed_qualities
-                    
-#                     # Write trimmed records to output files
-#                     SeqIO.write(forward_record, fout, "fastq")
-#                     SeqIO.write(reverse_record, rout, "fastq")
-        
-#         print(f"Paired-end trimming completed successfully. Outputs saved to {forward_output} and {reverse_output}")
-#     except Exception as e:
-#         print(f"Error during paired-end trimming: {e}")
-# # Define adapter sequences
-# adapters_forward = [
-#     "TACACTCTTTCCCTACACGACGCTCTTCCGATCT",  # PrefixPE/1
-#     "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGTA"   # PE1_rc
-# ]
-# adapters_reverse = [
-#     "GTGACTGGAGTTCAGACGTGTGCTCTTCCGATCT",  # PrefixPE/2
-#     "AGATCGGAAGAGCACACGTCTGAACTCCAGTCAC"   # PE2_rc
-# ]
-
-# def trim_adapter(sequence, qualities, adapters):
-#     """
-#     Trims adapter sequences from a given sequence.
-    
-#     Parameters:
-#     - sequence: The sequence to trim.
-#     - qualities: The quality scores corresponding to the sequence.
-#     - adapters: List of adapter sequences to check for trimming.
-    
-#     Returns:
-#     - Tuple of trimmed sequence and trimmed qualities.
-#     """
-#     trimmed_seq = sequence
-#     trimmed_qualities = qualities
-#     for adapter in adapters:
-#         adapter_pos = trimmed_seq.find(adapter)
-#         if adapter_pos != -1:
-#             trimmed_seq = trimmed_seq[:adapter_pos]
-#             trimmed_qualities = trimmed_qualities[:adapter_pos]
-#     return trimmed_seq, trimmed_qualities
-
-# def trim_single_end(input_file, output_file, adapter_sequence, minimum_length=20):
-#     """
-#     Trims adapter sequences from single-end RNA sequencing reads.
-    
-#     Parameters:
-#     - input_file: Path to the input FASTQ file.
-#     - output_file: Path to the output FASTQ file after trimming.
-#     - adapter_sequence: The adapter sequence to be trimmed.
-#     - minimum_length: Minimum length of reads to keep after trimming (default: 20).
-    
-#     Returns:
-#     - None
-#     """
-#     try:
-#         with open(input_file, "r") as infile, open(output_file, "w") as outfile:
-#             for record in SeqIO.parse(infile, "fastq"):
-#                 sequence = record.seq
-#                 qualities = record.letter_annotations["phred_quality"]
-                
-#                 # Trim adapter
-#                 trimmed_sequence, trimmed_qualities = trim_adapter(sequence, qualities, [adapter_sequence])
-                
-#                 # Write trimmed read if it meets the minimum length
-#                 if len(trimmed_sequence) >= minimum_length:
-#                     record.seq = trimmed_sequence
-#                     record.letter_annotations["phred_quality"] = trimmed_qualities
-#                     SeqIO.write(record, outfile, "fastq")
-        
-#         print(f"Single-end trimming completed successfully. Output saved to {output_file}")
-#     except Exception as e:
-#         print(f"Error during single-end trimming: {e}")
-
-# def trim_paired_end(forward_input, reverse_input, forward_output, reverse_output, minimum_length=20):
-#     """
-#     Trims adapter sequences from paired-end RNA sequencing reads.
-    
-#     Parameters:
-#     - forward_input: Path to the forward input FASTQ file.
-#     - reverse_input: Path to the reverse input FASTQ file.
-#     - forward_output: Path to the forward output FASTQ file after trimming.
-#     - reverse_output: Path to the reverse output FASTQ file after trimming.
-#     - minimum_length: Minimum length of reads to keep after trimming (default: 20).
-    
-#     Returns:
-#     - None
-#     """
-#     try:
-#         with open(forward_input, "r") as fin, open(reverse_input, "r") as rin, \
-#              open(forward_output, "w") as fout, open(reverse_output, "w") as rout:
-            
-#             for forward_record, reverse_record in zip(SeqIO.parse(fin, "fastq"), SeqIO.parse(rin, "fastq")):
-#                 # Trim forward read
-#                 forward_seq = forward_record.seq
-#                 forward_qualities = forward_record.letter_annotations["phred_quality"]
-#                 forward_trimmed_seq, forward_trimmed_qualities = trim_adapter(forward_seq, forward_qualities, adapters_forward)
-                
-#                 # Trim reverse read
-#                 reverse_seq = reverse_record.seq
-#                 reverse_qualities = reverse_record.letter_annotations["phred_quality"]
-#                 reverse_trimmed_seq, reverse_trimmed_qualities = trim_adapter(reverse_seq, reverse_qualities, adapters_reverse)
-                
-#                 # Write trimmed reads if they meet the minimum length
-#                 if len(forward_trimmed_seq) >= minimum_length and len(reverse_trimmed_seq) >= minimum_length:
-#                     # Update forward record
-#                     forward_record.seq = forward_trimmed_seq
-#                     forward_record.letter_annotations["phred_quality"] = forward_trimmed_qualities
-                    
-#                     # Update reverse record
-#                     reverse_record.seq = reverse_trimmed_seq
-#                     reverse_record.letter_annotations["phred_quality"] = reverse_trimmed_qualities
-                    
-#                     # Write trimmed records to output files
-#                     SeqIO.write(forward_record, fout, "fastq")
-#                     SeqIO.write(reverse_record, rout, "fastq")
-        
-#         print(f"Paired-end trimming completed successfully. Outputs saved to {forward_output} and {reverse_output}")
-#     except Exception as e:
-#         print(f"Error during paired-end trimming: {e}")
\ No newline at end of file
+    if trimmer is None:
+        trimmer = ReadTrimmer(min_length=min_length, quality_threshold=quality_threshold)
+
+    def trim(batch):
+        batch_stats = TrimStats()
+        trimmed = trimmer.trim_batch(batch, batch_stats)
+        # Duplicates are found in input order after this, so the batch is serialized then
+        return (trimmed.to_fastq() if deduplicator is None else trimmed), batch_stats
+
+    stats = TrimStats()
+    start = time.perf_counter()
+    with METRICS.stage("trim"), FastqReader(input_fastq) as reader, atomic_path(output_fastq) as temporary, \
+            BackgroundWriter(open_fastq_output(temporary, compresslevel), queue_depth) as out_handle:
+        batches = prefetch(METRICS.timed_iter("read", reader), queue_depth)
+        for records, batch_stats in ordered_map(trim, batches, workers, queue_depth):
+            stats.merge(batch_stats)
+            if deduplicator is not None:
+                records = deduplicator.filter([records])[0].to_fastq()
+            out_handle.write(records)
+        if deduplicator is not None:
+            for (kept,) in deduplicator.finish():
+                out_handle.write(kept.to_fastq())
+            deduplicator.record(stats)
+        METRICS.count("bytes_in", reader.bytes_read)
+    stats.record_metrics()
+    stats.elapsed = time.perf_counter() - start
+    print(stats.summary())
+    return stats
+
+
+def _pair_name(header: bytes) -> bytes:
+    """Read name shared by both mates: first header token without a trailing /1 or /2."""
+    name = header.split(None, 1)[0] if header else b""
+    return name[:-2] if name[-2:] in (b"/1", b"/2") else name
+
+
+def paired_batches(forward_reader: Iterable[FastqBatch], reverse_reader: Iterable[FastqBatch]):
+    """Yield matching ``(forward, reverse)`` batches from two readers, failing if one file runs out early."""
+    reverse_batches = iter(reverse_reader)
+    for forward in forward_reader:
+        reverse = next(reverse_batches, None)
+        if reverse is None:
+            raise ValueError("Paired FASTQ files are out of sync: reverse file has fewer reads")
+        yield forward, reverse
+    if next(reverse_batches, None) is not None:
+        raise ValueError("Paired FASTQ files are out of sync: forward file has fewer reads")
+
+
+def wasm_trim_pairs(forward_fastq, reverse_fastq, forward_output, reverse_output,
+                    forward_unpaired, reverse_unpaired, min_length=36, quality_threshold=20, trimmer=None,
+                    compresslevel=None, workers=1, queue_depth=DEFAULT_QUEUE_DEPTH, deduplicator=None):
+    """
+    Trim R1/R2 files together in a single streaming pass so the outputs stay in sync.
+
+    Pairs where both mates survive go to the paired outputs; a mate whose
+    partner was dropped goes to the corresponding unpaired output (as in
+    Trimmomatic PE mode). Each input is read on its own thread and each
+    output written on its own thread, as in ``wasm_trim_reads``. With a
+    ``dedup.Deduplicator`` duplicate pairs (same R1 and R2 sequences) are
+    left out of the paired outputs; unpaired mates are all written. Returns
+    the run's PairedTrimStats.
+    """
+    if trimmer is None:
+        trimmer = ReadTrimmer(min_length=min_length, quality_threshold=quality_threshold)
+
+    def trim(pair):
+        batch_stats = PairedTrimStats()
+        trimmed = trimmer.trim_pair(*pair, batch_stats)
+        return ([batch.to_fastq() for batch in trimmed] if deduplicator is None else trimmed), batch_stats
+
+    stats = PairedTrimStats()
+    start = time.perf_counter()
+    # Mates must land in batches of the same size, so batches are cut by read count only
+    with METRICS.stage("trim"), FastqReader(forward_fastq, max_batch_bases=None) as forward_reader, \
+            FastqReader(reverse_fastq, max_batch_bases=None) as reverse_reader, ExitStack() as temporaries:
+        outputs = [BackgroundWriter(open_fastq_output(temporaries.enter_context(atomic_path(path)), compresslevel),
+                                    queue_depth)
+                   for path in (forward_output, reverse_output, forward_unpaired, reverse_unpaired)]
+        try:
+            pairs = paired_batches(prefetch(METRICS.timed_iter("read", forward_reader), queue_depth),
+                                   prefetch(METRICS.timed_iter("read", reverse_reader), queue_depth))
+            for records, batch_stats in ordered_map(trim, pairs, workers, queue_depth):
+                stats.merge(batch_stats)
+                if deduplicator is not None:
+                    records = deduplicator.filter(list(records[:2])) + list(records[2:])
+                    records = [batch.to_fastq() for batch in records]
+                for handle, data in zip(outputs, records):
+                    handle.write(data)
+            if deduplicator is not None:
+                for kept in deduplicator.finish():
+                    for handle, batch in zip(outputs, kept):
+                        handle.write(batch.to_fastq())
+                deduplicator.record(stats)
+            METRICS.count("bytes_in", forward_reader.bytes_read + reverse_reader.bytes_read)
+        finally:
+            for handle in outputs:
+                handle.close()
+    stats.record_metrics()
+    stats.elapsed = time.perf_counter() - start
+    print(stats.summary())
+    return stats
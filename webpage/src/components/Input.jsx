@@ -1,15 +1,29 @@
-import React, { useState, useRef } from 'react';
-import pako from 'pako';
+import React, { useState, useRef, useEffect } from 'react';
+
+// Local job service started with `rna-seek serve` (pipeline/scripts/job_service.py)
+const JOB_SERVICE_URL = process.env.NEXT_PUBLIC_JOB_SERVICE_URL || 'http://127.0.0.1:8765';
 
 export default function InputFQ() {
     const [file, setFile] = useState(null);
+    const [trim, setTrim] = useState(true);
     const [error, setError] = useState('');
+    const [uploadProgress, setUploadProgress] = useState(null);
+    const [job, setJob] = useState(null);
+    const [summaries, setSummaries] = useState({});
     const fileInputRef = useRef(null);
+    const requestRef = useRef(null);
+    const eventsRef = useRef(null);
+
+    // Stop listening for progress when the page is left
+    useEffect(() => () => {
+        requestRef.current?.abort();
+        eventsRef.current?.close();
+    }, []);
 
     const handleFileChange = (event) => {
         const selectedFile = event.target.files[0];
         const validTypes = ['application/gzip', 'application/x-gzip', 'text/plain'];
-        const validExtensions = ['.fastq', '.fastq.gz'];
+        const validExtensions = ['.fastq', '.fq', '.fastq.gz', '.fq.gz'];
 
         if (selectedFile) {
             const fileName = selectedFile.name.toLowerCase();
@@ -27,80 +41,124 @@ export default function InputFQ() {
     };
 
     const handleClear = () => {
+        requestRef.current?.abort();
+        eventsRef.current?.close();
         setFile(null);
         setError('');
+        setUploadProgress(null);
+        setJob(null);
+        setSummaries({});
         // Clear the file input value
         if (fileInputRef.current) {
             fileInputRef.current.value = '';
         }
     };
 
-    const handleSubmit = async () => {
-        if (!file) return;
-        
-        try {
-            let processedFile = file;
-
-            // Decompress if it's a GZIP file
-            if (file.name.toLowerCase().endsWith('.gz')) {
-                // Read the compressed file as ArrayBuffer
-                const arrayBuffer = await new Promise((resolve, reject) => {
-                    const reader = new FileReader();
-                    reader.onload = () => resolve(reader.result);
-                    reader.onerror = reject;
-                    reader.readAsArrayBuffer(file);
-                });
-
-                // Decompress using pako
-                const decompressedData = pako.inflate(new Uint8Array(arrayBuffer), { to: 'string' });
-                
-                // Create new File object with decompressed content
-                processedFile = new File(
-                    [decompressedData],
-                    file.name.replace(/\.gz$/i, ''),
-                    { type: 'text/plain' }
-                );
+    const loadSummaries = async (finishedJob) => {
+        const loaded = {};
+        for (const [report, links] of Object.entries(finishedJob.reports || {})) {
+            const response = await fetch(`${JOB_SERVICE_URL}${links.summary}`);
+            if (response.ok) {
+                loaded[report] = await response.json();
             }
-
-            // Example: Submit the processed file (replace with your actual submission logic)
-            const formData = new FormData();
-            formData.append('file', processedFile);
-            
-            // Simulate API call
-            console.log('Submitting file:', processedFile.name);
-            // const response = await fetch('/your-api-endpoint', {
-            //     method: 'POST',
-            //     body: formData,
-            // });
-            
-            // Handle successful upload
-            setError('');
-            alert('File processed successfully!');
-            
-        } catch (err) {
-            setError(`Error processing file: ${err.message}`);
-            console.error('Decompression error:', err);
         }
+        setSummaries(loaded);
+    };
+
+    // Job state events until the job finishes; the service closes the stream then
+    const followJob = (jobId) => {
+        const events = new EventSource(`${JOB_SERVICE_URL}/jobs/${jobId}/events`);
+        eventsRef.current = events;
+        events.addEventListener('state', (event) => {
+            const state = JSON.parse(event.data);
+            setJob(state);
+            if (['done', 'failed', 'cancelled'].includes(state.status)) {
+                events.close();
+                if (state.status === 'done') {
+                    loadSummaries(state).catch(err => setError(`Error loading results: ${err.message}`));
+                } else if (state.error) {
+                    setError(`Analysis failed: ${state.error}`);
+                }
+            }
+        });
+        events.onerror = () => {
+            if (events.readyState === EventSource.CLOSED) {
+                setError('Lost connection to the job service.');
+            }
+        };
+    };
+
+    const handleSubmit = () => {
+        if (!file) return;
+        setError('');
+        setJob(null);
+        setSummaries({});
+
+        // The file is sent as it is (still compressed); the service streams it to disk
+        const formData = new FormData();
+        formData.append('trim', trim ? '1' : '0');
+        formData.append('file', file);
+
+        // XMLHttpRequest rather than fetch, for upload progress
+        const request = new XMLHttpRequest();
+        requestRef.current = request;
+        request.open('POST', `${JOB_SERVICE_URL}/jobs`);
+        request.upload.onprogress = (event) => {
+            if (event.lengthComputable) {
+                setUploadProgress(event.loaded / event.total);
+            }
+        };
+        request.onload = () => {
+            setUploadProgress(null);
+            let body = {};
+            try {
+                body = JSON.parse(request.responseText);
+            } catch {
+                // Not JSON; reported below by status
+            }
+            if (request.status !== 202) {
+                setError(`Upload rejected: ${body.error || request.statusText}`);
+                return;
+            }
+            setJob(body);
+            followJob(body.id);
+        };
+        request.onerror = () => {
+            setUploadProgress(null);
+            setError(`Could not reach the job service at ${JOB_SERVICE_URL}. Is "rna-seek serve" running?`);
+        };
+        request.send(formData);
     };
 
+    const busy = uploadProgress !== null || (job && ['queued', 'running'].includes(job.status));
+
     return (
         <div>
             <div style={{ marginBottom: '1rem' }}>
-                <input 
-                    type="file" 
-                    onChange={handleFileChange} 
+                <input
+                    type="file"
+                    onChange={handleFileChange}
                     ref={fileInputRef}
                     style={{ display: 'block', marginBottom: '0.5rem' }}
                 />
+                <label style={{ display: 'block', marginBottom: '0.5rem' }}>
+                    <input
+                        type="checkbox"
+                        checked={trim}
+                        onChange={(event) => setTrim(event.target.checked)}
+                        style={{ marginRight: '0.5rem' }}
+                    />
+                    Trim adapters and low-quality bases
+                </label>
                 <div style={{ gap: '0.5rem', display: 'flex' }}>
-                    <button 
+                    <button
                         onClick={handleSubmit}
-                        disabled={!file}
-                        className={`px-4 py-2 bg-green-500 text-white border-none rounded cursor-${file ? 'pointer' : 'not-allowed'}`}
+                        disabled={!file || busy}
+                        className={`px-4 py-2 bg-green-500 text-white border-none rounded cursor-${file && !busy ? 'pointer' : 'not-allowed'}`}
                     >
                         Submit
                     </button>
-                    <button 
+                    <button
                         onClick={handleClear}
                         disabled={!file}
                         className={`px-4 py-2 bg-red-500 text-white border-none rounded cursor-${file ? 'pointer' : 'not-allowed'}`}
@@ -109,9 +167,40 @@ export default function InputFQ() {
                     </button>
                 </div>
             </div>
-            
+
             {file && <p>Selected file: {file.name}</p>}
+            {uploadProgress !== null && <p>Uploading: {(uploadProgress * 100).toFixed(1)}%</p>}
+            {job && job.status === 'queued' && <p>Queued ({job.position} job(s) ahead)</p>}
+            {job && job.status === 'running' && <p>Analyzing: {(job.progress * 100).toFixed(1)}%</p>}
             {error && <p style={{ color: 'red' }}>{error}</p>}
+
+            {job && job.status === 'done' && Object.entries(job.reports).map(([report, links]) => (
+                <div key={report} style={{ marginTop: '1.5rem' }}>
+                    <h2 className="text-xl font-semibold text-gray-900 mb-2">
+                        {report === 'raw' ? 'Uploaded reads' : 'Trimmed reads'}
+                    </h2>
+                    {summaries[report] && (
+                        <ul style={{ marginBottom: '0.5rem' }}>
+                            <li>Total sequences: {summaries[report].total_seqs}</li>
+                            <li>Mean length: {summaries[report].mean_length.toFixed(1)} bp</li>
+                            <li>GC content: {summaries[report].mean_gc.toFixed(1)}%</li>
+                            <li>Mean sequence quality: {summaries[report].mean_seq_quality.toFixed(1)}</li>
+                            <li>Maximum adapter content: {summaries[report].max_adapter_percent.toFixed(2)}%</li>
+                            <li>Duplicate reads: {summaries[report].duplicate_percent.toFixed(1)}%</li>
+                        </ul>
+                    )}
+                    {/* Charts are rendered by the service the first time they are requested */}
+                    {links.charts.map((chart) => (
+                        // eslint-disable-next-line @next/next/no-img-element
+                        <img key={chart} src={`${JOB_SERVICE_URL}${chart}`} alt={`${report} quality charts`} loading="lazy" style={{ maxWidth: '100%' }} />
+                    ))}
+                </div>
+            ))}
+            {job && job.status === 'done' && job.trimmed && (
+                <a href={`${JOB_SERVICE_URL}${job.trimmed}`} className="text-blue-600 underline">
+                    Download trimmed reads
+                </a>
+            )}
         </div>
     );
-}
\ No newline at end of file
+}